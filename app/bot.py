@@ -1,12 +1,21 @@
 # app/bot.py
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-import logging
+import io
+import zipfile
 import tempfile
+import logging
 import asyncio
+from contextlib import nullcontext
+from typing import List, Dict, Any
+from datetime import datetime, date, timedelta
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     ApplicationBuilder, 
@@ -14,21 +23,61 @@ from telegram.ext import (
     MessageHandler, 
     filters, 
     ContextTypes, 
-    ConversationHandler
+    ConversationHandler,
+    TypeHandler,
 )
 
-from app.services.ai_extractor import extract_data_with_gemini
-from app.services.stt import transcribe
-from app.services.sheets import append_offline_row
+from app.services.ai_extractor import extract_fields_many, usage_summary as extract_usage_summary, warm_up as warm_up_gemini
+from app.services.enum_classifier import warm_up as warm_up_classifier
+from app.services.enum_config import reload as reload_enums
+from app.services.stt import transcribe, warm_up as warm_up_stt
+from app.services.sheets import warm_up as warm_up_sheets, get_shard
+from app.services.sync import sync_shop, sync_all, SYNC_INTERVAL
+from app.services.visit_store import record_visits, make_visit_key, pending_counts
+from app.services.visit_segmenter import split_visits
+from app.services import client_index
+from app.services.idle_sessions import (
+    touch as touch_session, sweep as sweep_sessions, journal as journal_drafts, CONV_SWEEP_S,
+)
+from app.services.reports import parse_period, build_report, format_report
 from app.services.validator import validate_and_normalize_row, prepare_row_for_sheet
-from app.conversation_flow import ConversationState, STATE_FEEDBACK, BTN_REPORT_PROBLEM
-from app.services.local_store import save_failed_entry, track_event
+from app.conversation_flow import ConversationState, STATE_FEEDBACK, STATE_CONTACT_LEFT, BTN_REPORT_PROBLEM
+from app.services.local_store import save_failed_entry, track_event, FAILED_SAVES_FILE
+from app.services import profiler
+from app.services.log_export import parse_filters as parse_log_filters, export as export_logs, format_summary as format_log_summary
+from app.services.shops import resolve_shop, assign_shop, list_shops
+from app.services.metrics import timed, summary as metrics_summary
+from app.services.breaker import get_breaker, stats as breaker_stats
+from app.services.deadline import (
+    DeadlineExceeded, within, start as start_deadline, for_audio as deadline_for_audio, clear as clear_deadline,
+)
+from app.services.scratch import scratch_dir, count_in_memory, cleanup_stale, AUDIO_IN_MEMORY_MAX_BYTES
+from app.services.tracing import span
+from app.update_processor import PerChatUpdateProcessor
+from app.logging_setup import setup_logging, set_request_id
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 if not TOKEN:
     raise RuntimeError("TELEGRAM_TOKEN not set in .env")
 
+# Optional Bot API override (local Bot API server, or the replay harness fake)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
+
+# Update delivery: "polling" (default) or "webhook" (behind a local reverse proxy)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")              # public https URL Telegram posts to
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")        # checked against X-Telegram-Bot-Api-Secret-Token
+# Updates processed at the same time (different chats); same-chat updates stay ordered
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+
+# Optional daily digest: report of the day for every shop, sent to ADMIN_CHAT_ID at HH:MM
+ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
+DAILY_DIGEST_TIME = os.getenv("DAILY_DIGEST_TIME")
+
 # Conversation handler states
 CHOOSING_INPUT = 0
 COLLECTING = 1
@@ -39,14 +88,37 @@ BTN_TEXT = "Текст (кнопки)"
 
 CHOICE_KEYBOARD = [[BTN_VOICE, BTN_TEXT]]
 
+_IMPORTS_DONE = time.perf_counter()
+
 
 # ============================================================================
 # COMMAND HANDLERS
 # ============================================================================
 
+async def tag_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Runs first (group -1) for every update: sets the request ID that every log
+    line of this update carries, including lines from to_thread workers.
+    """
+    chat = update.effective_chat
+    set_request_id(f"{chat.id if chat else 0}:{update.update_id}")
+    # One time budget for everything this update does (download, STT, extraction, save)
+    start_deadline()
+    if context.user_data is not None:
+        touch_session(context.user_data, chat.id if chat else None)
+    logging.debug("Update received: %s", update)
+
+
+def _visit_key(update: Update) -> str:
+    """Idempotency key of the visit started by this message (same message -> same key)."""
+    msg = update.message
+    return make_visit_key(update.effective_chat.id, msg.message_id, msg.date)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command. Shows choice: voice or text input."""
     context.user_data.pop("conv_state", None)
+    context.user_data.pop("visit_batch", None)
     context.user_data.pop("input_mode", None)
 
     await update.message.reply_text(
@@ -69,6 +141,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /cancel command."""
     await update.message.reply_text("Отмена нахер.", reply_markup=ReplyKeyboardRemove())
     context.user_data.pop("conv_state", None)
+    context.user_data.pop("visit_batch", None)
     return ConversationHandler.END
 
 
@@ -89,7 +162,7 @@ async def choose_input_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         return CHOOSING_INPUT
 
     if text == BTN_TEXT:
-        conv_state = ConversationState("", update.message.date)
+        conv_state = ConversationState("", update.message.date, _visit_key(update))
         context.user_data["conv_state"] = conv_state
         question, keyboard = conv_state.get_next_question()
         if keyboard:
@@ -112,6 +185,44 @@ async def choose_input_handler(update: Update, context: ContextTypes.DEFAULT_TYP
 # VOICE PROCESSING
 # ============================================================================
 
+async def download_and_transcribe(context: ContextTypes.DEFAULT_TYPE, voice) -> str:
+    """
+    Fetch the note and run STT on it. Notes up to AUDIO_IN_MEMORY_MAX_BYTES are
+    downloaded into memory; bigger ones (or of unknown size) go to a scratch
+    directory that is deleted as soon as STT is done.
+    """
+    size = voice.file_size or 0
+    in_memory = 0 < size <= AUDIO_IN_MEMORY_MAX_BYTES
+    duration = voice.duration.total_seconds() if hasattr(voice.duration, "total_seconds") else voice.duration
+    # STT time grows with the note: long ones get more than the base budget
+    deadline_for_audio(duration or 0)
+    with (nullcontext() if in_memory else scratch_dir()) as workdir:
+        with timed("download") as sp:
+            sp.set_attribute("audio_duration_s", duration)
+            sp.set_attribute("file_size", size)
+            sp.set_attribute("in_memory", in_memory)
+            with span("get_file"):
+                file = await within("download", context.bot.get_file(voice.file_id))
+            if in_memory:
+                with span("download_to_memory"):
+                    source = io.BytesIO()
+                    await within("download", file.download_to_memory(source))
+                    source.seek(0)
+                    source.name = f"{voice.file_unique_id}.ogg"
+                count_in_memory()
+            else:
+                source = os.path.join(workdir, f"{voice.file_unique_id}.ogg")
+                with span("download_to_drive"):
+                    await within("download", file.download_to_drive(source))
+
+        # Transcribe (non-blocking to keep event loop responsive); on the deadline the
+        # decoder is killed and the recognizer stops at its next chunk
+        with timed("stt") as sp:
+            text = await within("stt", asyncio.to_thread(transcribe, source))
+            sp.set_attribute("transcript_len", len(text))
+    return text
+
+
 async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Entry point: handle incoming voice message.
@@ -127,14 +238,9 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     
     try:
-        file = await context.bot.get_file(voice.file_id)
-        temp_dir = tempfile.gettempdir()
-        local_path = os.path.join(temp_dir, f"{voice.file_unique_id}.ogg")
-        await file.download_to_drive(local_path)
-        
-        # Transcribe (non-blocking to keep event loop responsive)
-        text = await asyncio.to_thread(transcribe, local_path)
-
+        text = await download_and_transcribe(context, voice)
+    except DeadlineExceeded as e:
+        return await degrade_to_buttons(update, context, e.stage)
     except Exception as e:
         await msg.reply_text(f"Блять я захуярил голосовое: {str(e)}")
         return ConversationHandler.END
@@ -150,13 +256,34 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     display_text = text[:800] + "..." if len(text) > 800 else text
     await msg.reply_text(f"Транскрибация: {display_text}")
 
-    await msg.reply_text("🤖 Анализирую текст через Gemini...")
-    extracted_data = extract_data_with_gemini(text)
-    
+    # One note can describe a whole rush: "первый — ..., второй — ..."
+    visits = split_visits(text) or [text]
+    if len(visits) > 1:
+        await msg.reply_text(f"🧾 В записи несколько визитов: {len(visits)}. Разберу каждый и сохраню все разом.")
+
+    if get_breaker("gemini").is_open():
+        await msg.reply_text("⚠️ Gemini сейчас недоступен — что смогу, разберу сам, остальное спрошу кнопками.")
+    else:
+        await msg.reply_text("🤖 Анализирую текст через Gemini...")
+    with timed("extract") as sp:
+        try:
+            extracted = await within("extract", asyncio.to_thread(extract_fields_many, visits))
+        except DeadlineExceeded:
+            # Keep the transcript, ask everything with buttons
+            track_event("deadline_exceeded", details="extract")
+            await msg.reply_text("⏱ Разбор затянулся — заполним кнопками.")
+            extracted = [{} for _ in visits]
+        sp.set_attribute("visits", len(visits))
+        sp.set_attribute("fields", sum(len(e) for e in extracted))
+
+    if len(visits) > 1:
+        return await start_visit_batch(update, context, visits, extracted)
+
     # Initialize conversation state
-    conv_state = ConversationState(text, update.message.date)
+    conv_state = ConversationState(text, update.message.date, _visit_key(update))
 
-    conv_state.apply_extracted_data(extracted_data)
+    conv_state.apply_extracted_data(extracted[0])
+    await apply_client_from_text(msg, conv_state, text)
     # --- CHANGED CODE END ---
 
     context.user_data["conv_state"] = conv_state
@@ -179,6 +306,63 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return COLLECTING
 
 
+async def degrade_to_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE, stage: str):
+    """The voice note didn't make it through in time: drop it and fill the visit with buttons."""
+    track_event("deadline_exceeded", details=stage)
+    logging.warning(f"Voice pipeline out of time in {stage}, falling back to buttons")
+    conv_state = ConversationState("", update.message.date, _visit_key(update))
+    context.user_data["conv_state"] = conv_state
+    question, keyboard = conv_state.get_next_question()
+    await update.message.reply_text("⏱ Голосовое обрабатывается слишком долго. Давай заполним кнопками.")
+    await update.message.reply_text(
+        question,
+        reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True) if keyboard else ReplyKeyboardRemove()
+    )
+    return COLLECTING
+
+
+async def start_visit_batch(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            visits: List[str], extracted: List[Dict[str, Any]]):
+    """Several visits in one note: a short question flow for each one's gaps, then one save for all."""
+    msg = update.message
+    states = []
+    for i, (visit_text, fields) in enumerate(zip(visits, extracted), 1):
+        # Own idempotency key per visit of the note
+        state = ConversationState(visit_text, msg.date, f"{_visit_key(update)}#{i}", ask_short_note=False)
+        state.apply_extracted_data(fields)
+        await apply_client_from_text(msg, state, visit_text)
+        states.append(state)
+    context.user_data["visit_batch"] = {"pending": states, "rows": [], "total": len(states), "current": 0}
+    return await next_batch_visit(update, context)
+
+
+async def next_batch_visit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Move to the next visit of the note; after the last one, save every valid row together."""
+    batch = context.user_data["visit_batch"]
+    if batch["pending"]:
+        conv_state = batch["pending"].pop(0)
+        batch["current"] += 1
+        context.user_data["conv_state"] = conv_state
+        if conv_state.is_complete():
+            return await finalize_and_save(update, context, conv_state)
+        question, keyboard = conv_state.get_next_question()
+        preview = conv_state.data["Transcription_raw"]
+        preview = preview[:200] + "..." if len(preview) > 200 else preview
+        await update.message.reply_text(
+            f"Визит {batch['current']}/{batch['total']}: «{preview}»\n\n{question}",
+            reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True) if keyboard else ReplyKeyboardRemove(),
+        )
+        return COLLECTING
+
+    context.user_data.pop("visit_batch", None)
+    if not batch["rows"]:
+        context.user_data.pop("conv_state", None)
+        await update.message.reply_text("❌ Ни один визит не прошёл проверку, ничего не сохранил.",
+                                        reply_markup=ReplyKeyboardRemove())
+        return ConversationHandler.END
+    return await save_rows(update, context, batch["rows"])
+
+
 # ============================================================================
 # DATA COLLECTION
 # ============================================================================
@@ -190,7 +374,9 @@ async def collect_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     conv_state: ConversationState = context.user_data.get("conv_state")
     if not conv_state:
-        await update.message.reply_text("Ошибка: состояние потеряно. Начни заново.")
+        # Also how a conversation closed by the session sweep ends
+        await update.message.reply_text("Ошибка: состояние потеряно. Начни заново: /start",
+                                        reply_markup=ReplyKeyboardRemove())
         return ConversationHandler.END
     
     user_text = update.message.text
@@ -223,6 +409,7 @@ async def collect_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return COLLECTING
 
     # Process the answer
+    answered = conv_state.current_state
     error = conv_state.process_answer(update.message.text)
     
     if error:
@@ -239,6 +426,10 @@ async def collect_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(question, reply_markup=ReplyKeyboardRemove())
         return COLLECTING
     
+    # Only the contact answer may carry a phone/client ID; amounts and notes are not looked up
+    if answered == STATE_CONTACT_LEFT:
+        await apply_client_from_text(update.message, conv_state, user_text)
+
     # Check if complete
     if conv_state.is_complete():
         return await finalize_and_save(update, context, conv_state)
@@ -256,6 +447,20 @@ async def collect_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return COLLECTING
 
 
+async def apply_client_from_text(msg, conv_state: ConversationState, text: str):
+    """If text has a phone/client ID (and the visit has none yet), fill client fields from its history."""
+    client_id = client_index.find_client_id(text)
+    if not client_id or conv_state.data.get("Client_ID"):
+        return
+    previous = await asyncio.to_thread(client_index.lookup, client_id)
+    conv_state.apply_client(client_id, previous)
+    if previous:
+        await msg.reply_text(
+            f"🔁 Клиент уже был у нас: визитов {previous['visits']}, последний {previous['last_date']}. "
+            f"Отметил как {conv_state.data['Type_of_client']}."
+        )
+
+
 async def skip_short_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /skip command to skip short note."""
     conv_state: ConversationState = context.user_data.get("conv_state")
@@ -278,14 +483,22 @@ async def finalize_and_save(
 ):
     """
     Validate collected data and save to Google Sheets.
+    Inside a multi-visit note the row is queued and saved with the others at the end.
     """
+    batch = context.user_data.get("visit_batch")
+    prefix = f"Визит {batch['current']}/{batch['total']}: " if batch else ""
+
     # Validate the collected data
-    is_valid, normalized_row, messages = validate_and_normalize_row(conv_state.data)
+    with timed("validate"):
+        is_valid, normalized_row, messages = validate_and_normalize_row(conv_state.data)
     
     if not is_valid:
         # Critical validation errors
         track_event("critical_validation_fail")
-        error_text = "❌ Ошибки валидации:\n" + "\n".join(messages)
+        error_text = prefix + "❌ Ошибки валидации:\n" + "\n".join(messages)
+        if batch:
+            await update.message.reply_text(error_text + "\n\nЭтот визит НЕ сохранён, остальные сохраню.")
+            return await next_batch_visit(update, context)
         error_text += "\n\nДанные НЕ сохранены. Начни заново."
         await update.message.reply_text(error_text, reply_markup=ReplyKeyboardRemove())
         context.user_data.pop("conv_state", None)
@@ -293,77 +506,388 @@ async def finalize_and_save(
     
     # Show warnings if any
     if messages:
-        warning_text = "⚠️ Предупреждения:\n" + "\n".join(messages)
+        warning_text = prefix + "⚠️ Предупреждения:\n" + "\n".join(messages)
         await update.message.reply_text(warning_text)
-    
-    max_retries = 3
-    saved = False
-    error_msg = ""
 
-    msg = await update.message.reply_text("⏳ Сохраняю в таблицу...")
+    if batch:
+        batch["rows"].append(normalized_row)
+        return await next_batch_visit(update, context)
+    return await save_rows(update, context, [normalized_row])
 
-    for attempt in range(max_retries):
-    # Save to sheet
-        try:
-            # Use the new validator function to prepare the row
-            append_offline_row(normalized_row)
-            saved = True
-            track_event("save_success")
-            break
-        except Exception as e:
-            logging.error(f"Save attempt {attempt+1} failed: {e}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2) # Backoff
-            else:
-                # All retries failed
-                error_msg = str(e)
-    
-    if saved:
-        await msg.edit_text("✅ Забубенил в таблицу. Хорош братишка!")
-    else:
-        # [NEW] Save locally (Plan Item 2)
-        save_failed_entry(conv_state.data, error_msg)
+
+async def save_rows(update: Update, context: ContextTypes.DEFAULT_TYPE, rows: List[Dict[str, Any]]):
+    """Commit validated rows locally and reply; the push to Sheets runs in the background."""
+    shop = resolve_shop(update.effective_chat.id, update.effective_user.id)
+
+    # The local store is the system of record: once the rows are committed the visit is saved
+    try:
+        with timed("commit"):
+            saved = await asyncio.to_thread(record_visits, rows, shop)
+    except Exception as e:
+        logging.error(f"Local commit failed: {e}")
+        for row in rows:
+            save_failed_entry(row, str(e))
         track_event("save_failure_offline")
-        
-        await msg.edit_text(
-            f"❌ Не удалось сохранить в Google Sheets после {max_retries} попыток.\n\n"
-            f"💾 **Я сохранил запись локально.**\n"
-            f"Админ проверит файл failed_saves.json.\n\n"
-            f"Ошибка: {error_msg}"
+        await update.message.reply_text(
+            f"❌ Не удалось сохранить запись в локальную базу.\n\n"
+            f"💾 Я скинул её в {FAILED_SAVES_FILE}, админ проверит.\n\n"
+            f"Ошибка: {e}"
         )
-    
+        context.user_data.pop("conv_state", None)
+        return ConversationHandler.END
+
+    # A re-sent message commits nothing new, so its client visit is not counted twice
+    for row, (_, inserted) in zip(rows, saved):
+        if inserted:
+            await asyncio.to_thread(client_index.record, row)
+
+    request_sync(context.application, shop)
+    if get_shard(shop).breaker.is_open():
+        # Google is down: say so, the rows go out when it recovers
+        track_event("save_deferred", details="circuit open")
+        await update.message.reply_text(
+            "💾 Запись сохранена, но Google Sheets сейчас не отвечает.\n"
+            "Я допишу её в таблицу автоматически, как только он оживёт."
+        )
+    else:
+        track_event("save_success")
+        if len(saved) > 1:
+            await update.message.reply_text(f"✅ Забубенил все визиты разом: {len(saved)}. Хорош братишка!")
+        else:
+            await update.message.reply_text("✅ Забубенил. Хорош братишка!")
+
     # Clean up
     context.user_data.pop("conv_state", None)
     return ConversationHandler.END
 
-async def send_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отправляет файлы с ошибками и аналитикой в чат."""
-    files_to_check = ["failed_saves.json", "analytics.json"]
-    found = False
 
-    await update.message.reply_text("📂 Проверяю локальные файлы...")
+# shop -> its running post-save sync task; shops whose rows were committed while it ran
+_sync_tasks: Dict[str, asyncio.Task] = {}
+_sync_again: set = set()
+
 
-    for filename in files_to_check:
-        if os.path.exists(filename):
-            found = True
+def request_sync(application, shop: str):
+    """Push the shop's pending rows to Sheets in the background; at most one pass per shop at a time."""
+    if shop in _sync_tasks:
+        _sync_again.add(shop)  # the running pass may have missed the new rows
+        return
+    _sync_tasks[shop] = application.create_task(_sync_after_save(shop), name=f"sync:{shop}")
+
+
+async def _sync_after_save(shop: str):
+    # Runs in the saving update's context (request ID for logs) but not under its deadline
+    clear_deadline()
+    try:
+        while True:
+            _sync_again.discard(shop)
             try:
+                with timed("save"):
+                    await asyncio.to_thread(sync_shop, shop)
+            except Exception as e:
+                logging.warning(f"Sync of shop {shop} after a save failed, the background sync retries: {e}")
+                break
+            if shop not in _sync_again:
+                break
+    finally:
+        _sync_tasks.pop(shop, None)
+        _sync_again.discard(shop)
+
+
+async def wait_for_syncs():
+    """Wait until the post-save syncs in flight are done (shutdown, replay)."""
+    while _sync_tasks:
+        await asyncio.gather(*list(_sync_tasks.values()), return_exceptions=True)
+
+
+async def shop_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /shop - show current shop; /shop <name> - send my visits to that shop's sheet (if the
+    shop's "users" list has me); admin: /shop <name> [user_id] - assign anyone anywhere.
+    """
+    shops = list_shops()
+    if not context.args:
+        current = resolve_shop(update.effective_chat.id, update.effective_user.id)
+        await update.message.reply_text(
+            f"🏬 Текущий магазин: {current}\nДоступные: {', '.join(shops)}\n"
+            f"Сменить: /shop <название>"
+        )
+        return
+    name = context.args[0]
+    is_admin = _is_admin(update, fail_closed=True)
+    user_id = update.effective_user.id
+    if len(context.args) > 1:
+        if not is_admin or not context.args[1].lstrip("-").isdigit():
+            await update.message.reply_text("Назначать магазин другим может только админ: /shop <название> <user_id>")
+            return
+        user_id = int(context.args[1])
+    try:
+        assign_shop(user_id, name, by_admin=is_admin)
+    except KeyError:
+        await update.message.reply_text(f"Нет такого магазина. Доступные: {', '.join(shops)}")
+        return
+    except PermissionError:
+        logging.warning(f"User {user_id} tried to switch to shop {name}")
+        await update.message.reply_text("⛔ Этот магазин тебе не назначен. Попроси админа.")
+        return
+    if user_id == update.effective_user.id:
+        await update.message.reply_text(f"✅ Теперь твои визиты пишутся в магазин: {name}")
+    else:
+        await update.message.reply_text(f"✅ Визиты пользователя {user_id} пишутся в магазин: {name}")
+
+
+async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/report [today|yesterday|week|month|YYYY-MM-DD|YYYY-MM-DD..YYYY-MM-DD] for the user's shop."""
+    arg = " ".join(context.args) if context.args else None
+    try:
+        start_d, end_d, group = parse_period(arg)
+    except ValueError:
+        await update.message.reply_text(
+            "Не понял период. Примеры: /report, /report week, /report month, "
+            "/report 2026-03-14, /report 2026-03-01..2026-03-14"
+        )
+        return
+    shop = resolve_shop(update.effective_chat.id, update.effective_user.id)
+    with timed("report"):
+        report = await asyncio.to_thread(build_report, shop, start_d, end_d, group)
+    await update.message.reply_text(format_report(report))
+
+
+def _is_admin(update: Update, fail_closed: bool = False) -> bool:
+    """
+    Admin commands are open to everyone until ADMIN_CHAT_ID is set, then only to that chat.
+    fail_closed: refuse while ADMIN_CHAT_ID is unset (commands that move data or expose internals).
+    """
+    if not ADMIN_CHAT_ID:
+        return not fail_closed
+    return str(update.effective_chat.id) == str(ADMIN_CHAT_ID)
+
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats - stage latencies, dependency breakers, Gemini usage, sync backlog."""
+    if not _is_admin(update):
+        await update.message.reply_text("Статистика доступна только админу.")
+        return
+    lines = ["📊 Задержки по этапам (p50 / p95, мс):"]
+    for stage, s in metrics_summary().items():
+        lines.append(f"  {stage}: {s['p50_ms']} / {s['p95_ms']} ({s['count']})")
+    lines.append("\n🔌 Внешние сервисы:")
+    for name, b in breaker_stats().items():
+        retry = f", повтор через {b['retry_in_s']} с" if "retry_in_s" in b else ""
+        lines.append(f"  {name}: {b['state']}{retry}; вызовов {b['calls']}, ошибок {b['failures']}, "
+                     f"отбито {b['rejected']}, срабатываний {b['trips']}")
+    usage = extract_usage_summary()
+    lines.append(f"\n🤖 Gemini: {usage['calls']} вызовов, в среднем {usage['avg_latency_ms']} мс")
+    pending = await asyncio.to_thread(pending_counts)
+    lines.append(f"💾 Ждут синхронизации: {sum(pending.values())}"
+                 + (f" ({', '.join(f'{k}: {v}' for k, v in pending.items())})" if pending else ""))
+    await update.message.reply_text("\n".join(lines))
+
+
+async def send_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /logs [period] [failed|drafts|events|<event type>...] [last=N] - summary of the local
+    journals, then the matching entries as a zip (see log_export for the filters).
+    """
+    if not _is_admin(update):
+        await update.message.reply_text("Логи доступны только админу.")
+        return
+    try:
+        filters_ = parse_log_filters(context.args or [])
+    except ValueError:
+        await update.message.reply_text(
+            "Не понял фильтр. Примеры: /logs, /logs today, /logs 2026-03-01..2026-03-14 failed, "
+            "/logs week save_deferred last=50"
+        )
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"logs_{filters_['start']}_{filters_['end']}.zip")
+        with timed("logs"):
+            result = await asyncio.to_thread(export_logs, filters_, path)
+        await update.message.reply_text(format_log_summary(filters_, result))
+        if not any(result["entries"].values()):
+            return
+        try:
+            with open(path, "rb") as f:
+                await update.message.reply_document(document=f, filename=os.path.basename(path))
+        except Exception as e:
+            await update.message.reply_text(f"Ошибка при отправке архива: {e}")
+
+
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /profile [seconds | N updates] - sample every thread's stack (loop, STT and Gemini workers)
+    for a while, then send collapsed stacks for a flame graph and the top allocation sites.
+    """
+    if not _is_admin(update, fail_closed=True):
+        await update.message.reply_text("Профилирование доступно только админу (нужен ADMIN_CHAT_ID).")
+        return
+    args = [a.lower() for a in context.args or []]
+    try:
+        count = float(args[0].rstrip("su")) if args else 30.0
+    except ValueError:
+        await update.message.reply_text("Примеры: /profile, /profile 60, /profile 20 updates")
+        return
+    # "/profile 20 updates", "/profile 20u"
+    by_updates = bool(args) and (args[0].endswith("u") or
+                                 (len(args) > 1 and args[1].startswith(("upd", "апд", "сообщ"))))
+    seconds = profiler.PROFILE_MAX_S if by_updates else min(max(1.0, count), profiler.PROFILE_MAX_S)
+
+    run = profiler.start(max_updates=max(1, int(count)) if by_updates else None)
+    if run is None:
+        await update.message.reply_text("Профилирование уже идёт.")
+        return
+    what = f"{int(count)} апдейтов (не дольше {seconds:.0f} с)" if by_updates else f"{seconds:.0f} с"
+    await update.message.reply_text(f"🔬 Профилирую {what}...")
+    # In the background: this chat's next updates must not queue up behind the profile
+    context.application.create_task(_finish_profile(update, run, seconds))
+
+
+async def _finish_profile(update: Update, run, seconds: float):
+    await asyncio.to_thread(run.done.wait, seconds)
+    result = await asyncio.to_thread(profiler.finish, run)
+
+    busy = result["loop_busy"]
+    lines = [f"🔬 {result['samples']} сэмплов за {result['seconds']:.1f} с, апдейтов: {result['updates']}"
+             + (f", event loop занят {busy:.0%}" if busy is not None else "")]
+    lines += [f"  {share:>4.0%} {frame}" for frame, share in result["top"]]
+    await update.message.reply_text("\n".join(lines))
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"profile_{stamp}.zip")
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(f"profile_{stamp}.folded", result["collapsed"])
+            zf.writestr(f"alloc_top_{stamp}.txt", result["allocations"])
+        try:
+            with open(path, "rb") as f:
                 await update.message.reply_document(
-                    document=open(filename, "rb"),
-                    caption=f"Файл: {filename}"
+                    document=f, filename=os.path.basename(path),
+                    caption=".folded: flamegraph.pl / speedscope.app; alloc_top: tracemalloc",
+                )
+        except Exception as e:
+            await update.message.reply_text(f"Ошибка при отправке профиля: {e}")
+
+
+# ============================================================================
+# STARTUP
+# ============================================================================
+
+async def warm_up_services():
+    """
+    Warm the Vosk model, the Sheets worksheet handle and the Gemini client concurrently
+    in worker threads, so the first real voice note does not pay for cold starts.
+    Also sweeps scratch audio left behind by a previous process.
+    Failures are only logged: the same code paths retry lazily on first use.
+    """
+    async def _warm(name, fn):
+        started = time.perf_counter()
+        error = None
+        try:
+            await asyncio.to_thread(fn)
+        except Exception as e:
+            error = e
+        return name, (time.perf_counter() - started) * 1000, error
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        _warm("vosk", warm_up_stt),
+        _warm("sheets", warm_up_sheets),
+        _warm("gemini", warm_up_gemini),
+        _warm("classifier", warm_up_classifier),
+        _warm("enums", reload_enums),
+        _warm("clients", client_index.warm_up),
+        _warm("scratch", cleanup_stale),
+    )
+    parts = []
+    for name, ms, error in results:
+        parts.append(f"{name}={ms:.0f}ms" + (f" (failed: {error})" if error else ""))
+    logging.info(f"Warm-up done in {(time.perf_counter() - started) * 1000:.0f}ms: " + ", ".join(parts))
+
+
+async def sync_loop():
+    """Push visits left pending by failed or deferred saves, every SYNC_INTERVAL seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(sync_all)
+        except Exception as e:
+            logging.error(f"Background sync failed: {e}")
+        await asyncio.sleep(SYNC_INTERVAL)
+
+
+async def session_sweep_loop(application):
+    """Every CONV_SWEEP_S: journal and drop abandoned conversations (TTL, memory budget)."""
+    while True:
+        await asyncio.sleep(CONV_SWEEP_S)
+        try:
+            # Dropping conv_state is enough: handlers take a missing state as the end of the conversation
+            evicted = sweep_sessions(application.user_data)
+            if evicted:
+                await asyncio.to_thread(journal_drafts, evicted)
+        except Exception as e:
+            logging.error(f"Session sweep failed: {e}")
+            continue
+        for draft in evicted:
+            track_event("conversation_expired", details=draft["reason"])
+            chat_id = draft["chat_id"]
+            if chat_id is None:
+                continue
+            try:
+                await application.bot.send_message(
+                    chat_id=chat_id,
+                    text="⌛ Незаконченный визит сохранён как черновик и закрыт. Начни заново: /start",
+                    reply_markup=ReplyKeyboardRemove(),
                 )
             except Exception as e:
-                await update.message.reply_text(f"Ошибка при отправке {filename}: {e}")
-    
-    if not found:
-        await update.message.reply_text("🤷‍♂️ Файлов с логами/ошибками пока нет.")
+                logging.warning(f"Expiry notice to chat {chat_id} failed: {e}")
+
+
+async def daily_digest_loop(application):
+    """Send today's report for every shop to ADMIN_CHAT_ID at DAILY_DIGEST_TIME (HH:MM, local time)."""
+    hour, minute = (int(x) for x in DAILY_DIGEST_TIME.split(":"))
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        for shop in list_shops():
+            try:
+                today = date.today()
+                report = await asyncio.to_thread(build_report, shop, today, today, "day")
+                await application.bot.send_message(chat_id=ADMIN_CHAT_ID, text=format_report(report))
+            except Exception as e:
+                logging.error(f"Daily digest for shop {shop} failed: {e}")
+
+
+async def _post_init(application):
+    """Runs inside run_polling before the first getUpdates; warm-up continues in the background."""
+    logging.info(
+        f"Startup: imports={(_IMPORTS_DONE - _IMPORT_STARTED) * 1000:.0f}ms, "
+        f"ready={(time.perf_counter() - _IMPORT_STARTED) * 1000:.0f}ms"
+    )
+    application.create_task(warm_up_services())
+    application.create_task(sync_loop())
+    application.create_task(session_sweep_loop(application))
+    if ADMIN_CHAT_ID and DAILY_DIGEST_TIME:
+        application.create_task(daily_digest_loop(application))
+
 
 # ============================================================================
 # MAIN
 # ============================================================================
 
-def main():
-    """Start the bot."""
-    app = ApplicationBuilder().token(TOKEN).build()
+def build_application(warm_up: bool = True):
+    """Build the Application with all handlers registered (used by main and the replay harness)."""
+    builder = ApplicationBuilder().token(TOKEN)
+    # Slow steps of one user no longer hold up the others; same-chat order is preserved
+    builder = builder.concurrent_updates(PerChatUpdateProcessor(max(1, UPDATE_WORKERS)))
+    if warm_up:
+        builder = builder.post_init(_post_init)
+    if TELEGRAM_API_BASE_URL:
+        base = TELEGRAM_API_BASE_URL.rstrip("/")
+        builder = builder.base_url(f"{base}/bot").base_file_url(f"{base}/file/bot")
+    app = builder.build()
     
     # Conversation handler
     conv = ConversationHandler(
@@ -389,19 +913,35 @@ def main():
     )
 
     # Register handlers (/start is only in conversation entry_points and fallbacks)
+    app.add_handler(TypeHandler(Update, tag_update), group=-1)
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("logs", send_logs))
+    app.add_handler(CommandHandler("shop", shop_cmd))
+    app.add_handler(CommandHandler("report", report_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
+    app.add_handler(CommandHandler("profile", profile_cmd))
     app.add_handler(conv)
-    
-    # Optional: Debug handler to see all incoming updates
-    # Uncomment if you need debugging
-    # async def _debug_all(update, context):
-    #     print("===== UPDATE RECEIVED =====")
-    #     print(update)
-    # app.add_handler(MessageHandler(filters.ALL, _debug_all), group=-1)
-    
-    print("Бот щещес (готов)...")
-    app.run_polling()
+    return app
+
+
+def main():
+    """Start the bot."""
+    app = build_application()
+    logging.info("Бот щещес (готов)...")
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL in .env")
+        # Plain HTTP on WEBHOOK_LISTEN:WEBHOOK_PORT; TLS is terminated by the reverse proxy
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=min(100, max(UPDATE_WORKERS, 40)),
+        )
+    else:
+        app.run_polling()
 
 
 if __name__ == "__main__":
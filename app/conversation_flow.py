@@ -9,6 +9,8 @@ import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from app.services.enum_config import current as current_enums
+
 logger = logging.getLogger(__name__)
 
 # Conversation states
@@ -27,22 +29,27 @@ STATE_FEEDBACK = "feedback"
 
 BTN_REPORT_PROBLEM = "Что-то не так? (Report)"
 
-# Quick keyboards
-TYPE_CLIENT_KB = [["новый"], ["повторный"], ["контрактник/мастер"], ["оптовик"]]
-BEHAVIOR_KB = [["мимо прошли"], ["поспрашивали"], ["посмотрели"], ["замеряли/считали"]]
-STATUS_KB = [["купили"], ["не купили"], ["думают"], ["обмен"]]
-YESNO_KB = [["да"], ["нет"]]
-REASON_KB = [
-    ["дорого"], ["нет дизайна/цвета"], ["нет в наличии"], ["сравнивают"],
-    ["зайдут позже"], ["не целевой"], ["не успел обработать"], ["другое"]
-]
-SOURCE_KB = [["Instagram"], ["2ГИС"], ["рекомендация"], ["вывеска"], ["TikTok"], ["другое"]]
+# Answer keyboards come from the enum config (app.services.enum_config), so they
+# always offer exactly the values the validator accepts
+_STATE_KEYBOARD_FIELD = {
+    STATE_TYPE_CLIENT: "Type_of_client",
+    STATE_BEHAVIOR: "Behavior",
+    STATE_PURCHASE_STATUS: "Purchase_status",
+    STATE_REASON_NOT_BUYING: "Reason_not_buying",
+    STATE_CONTACT_LEFT: "YesNo",
+    STATE_SOURCE: "Source",
+}
+
+
+def _keyboard(state: str):
+    return current_enums().keyboard(_STATE_KEYBOARD_FIELD[state])
 
 
 class ConversationState:
     """Tracks current state of data collection conversation."""
     
-    def __init__(self, transcription: str, timestamp: datetime):
+    def __init__(self, transcription: str, timestamp: datetime, visit_key: str = "",
+                 ask_short_note: bool = True):
         self.data: Dict[str, Any] = {
             "Date": timestamp.date().isoformat(),
             "Time": timestamp.time().strftime("%H:%M"),
@@ -60,8 +67,11 @@ class ConversationState:
             "Repeat_visit": "",
             "Contact_left": "",
             "Short_note": "",
+            "Visit_key": visit_key,
         }
         self.current_state = STATE_TYPE_CLIENT
+        # False for visits of a multi-visit note: the note itself is the description
+        self.ask_short_note = ask_short_note
     
     def is_complete(self) -> bool:
         """Check if conversation is complete."""
@@ -76,13 +86,13 @@ class ConversationState:
         
         if self.current_state == STATE_TYPE_CLIENT:
             # Add report button to the existing list
-            return ("Выбери баля Type_of_client", TYPE_CLIENT_KB + report_btn_row)
+            return ("Выбери баля Type_of_client", _keyboard(STATE_TYPE_CLIENT) + report_btn_row)
         
         elif self.current_state == STATE_BEHAVIOR:
-            return ("Че он делал? Behavior", BEHAVIOR_KB + report_btn_row)
+            return ("Че он делал? Behavior", _keyboard(STATE_BEHAVIOR) + report_btn_row)
         
         elif self.current_state == STATE_PURCHASE_STATUS:
-            return ("Купил или не купил? Purchase status?", STATUS_KB + report_btn_row)
+            return ("Купил или не купил? Purchase status?", _keyboard(STATE_PURCHASE_STATUS) + report_btn_row)
         
         elif self.current_state == STATE_TICKET_AMOUNT:
             # Currently returns None (which removes keyboard). 
@@ -96,13 +106,13 @@ class ConversationState:
             return ("Что именно продали и в каком количестве? Например: 'флизелиновые обои, 3 рулона'", report_btn_row)
         
         elif self.current_state == STATE_REASON_NOT_BUYING:
-            return ("А че не купили? Почему? Отправляй пункты из списка или напиши коротко", REASON_KB + report_btn_row)
+            return ("А че не купили? Почему? Отправляй пункты из списка или напиши коротко", _keyboard(STATE_REASON_NOT_BUYING) + report_btn_row)
         
         elif self.current_state == STATE_CONTACT_LEFT:
-            return ("Хотя бы контакт оставил? (да/нет)", YESNO_KB + report_btn_row)
+            return ("Хотя бы контакт оставил? (да/нет)", _keyboard(STATE_CONTACT_LEFT) + report_btn_row)
         
         elif self.current_state == STATE_SOURCE:
-            return ("Откуда он узнал про наш секретный бутик обоев? (Source)", SOURCE_KB + report_btn_row)
+            return ("Откуда он узнал про наш секретный бутик обоев? (Source)", _keyboard(STATE_SOURCE) + report_btn_row)
         
         elif self.current_state == STATE_SHORT_NOTE:
             return ("Ну в кратце расскажи что-то еще, а если нечего то /skip", report_btn_row)
@@ -282,7 +292,10 @@ class ConversationState:
                 break
                 
             elif current_state == STATE_CONTACT_LEFT:
-                # Contact_left is not auto-filled, stop here
+                # Only filled when a phone/ID was found (apply_client)
+                if self.data.get("Contact_left"):
+                    self.current_state = STATE_SOURCE
+                    continue
                 break
                 
             elif current_state == STATE_SOURCE:
@@ -302,7 +315,9 @@ class ConversationState:
                 break
                 
             elif current_state == STATE_SHORT_NOTE:
-                # Always stop at short note (user can skip)
+                # Stop at short note (user can skip) unless it isn't asked at all
+                if not self.ask_short_note:
+                    self.current_state = STATE_COMPLETE
                 break
                 
             else:
@@ -352,8 +367,8 @@ class ConversationState:
             logger.info("No extracted data to apply")
             return
             
-        logger.info(f"Applying extracted data, starting from state: {self.current_state}")
-        logger.info(f"Extracted data: {extracted}")
+        logger.info("Applying %d extracted fields, starting from state: %s", len(extracted), self.current_state)
+        logger.debug("Extracted data: %s", extracted)
         
         # Step 1: Fill all available fields directly into self.data (bypassing state machine)
         # This allows us to fill fields out of order
@@ -361,23 +376,23 @@ class ConversationState:
         # Fill simple fields directly
         if extracted.get("Type_of_client"):
             self.data["Type_of_client"] = extracted["Type_of_client"]
-            logger.info(f"Direct-filled Type_of_client: {extracted['Type_of_client']}")
+            logger.debug("Direct-filled Type_of_client: %s", extracted['Type_of_client'])
         
         if extracted.get("Behavior"):
             self.data["Behavior"] = extracted["Behavior"]
-            logger.info(f"Direct-filled Behavior: {extracted['Behavior']}")
+            logger.debug("Direct-filled Behavior: %s", extracted['Behavior'])
         
         if extracted.get("Purchase_status"):
             self.data["Purchase_status"] = extracted["Purchase_status"]
-            logger.info(f"Direct-filled Purchase_status: {extracted['Purchase_status']}")
+            logger.debug("Direct-filled Purchase_status: %s", extracted['Purchase_status'])
         
         if extracted.get("Source"):
             self.data["Source"] = extracted["Source"]
-            logger.info(f"Direct-filled Source: {extracted['Source']}")
+            logger.debug("Direct-filled Source: %s", extracted['Source'])
         
         if extracted.get("Reason_not_buying"):
             self.data["Reason_not_buying"] = extracted["Reason_not_buying"]
-            logger.info(f"Direct-filled Reason_not_buying: {extracted['Reason_not_buying']}")
+            logger.debug("Direct-filled Reason_not_buying: %s", extracted['Reason_not_buying'])
         
         # Fill numeric fields (validate first)
         if extracted.get("Ticket_amount") is not None:
@@ -385,26 +400,26 @@ class ConversationState:
             ticket_num = self._parse_number(ticket_str)
             if ticket_num is not None and ticket_num >= 0:
                 self.data["Ticket_amount"] = ticket_num
-                logger.info(f"Direct-filled Ticket_amount: {ticket_num}")
+                logger.debug("Direct-filled Ticket_amount: %s", ticket_num)
         
         if extracted.get("Cost_Price") is not None:
             cost_str = str(extracted["Cost_Price"])
             cost_num = self._parse_number(cost_str)
             if cost_num is not None and cost_num >= 0:
                 self.data["Cost_Price"] = cost_num
-                logger.info(f"Direct-filled Cost_Price: {cost_num}")
+                logger.debug("Direct-filled Cost_Price: %s", cost_num)
         
         # Fill product info
         if extracted.get("Product_name"):
             self.data["Product_name"] = extracted["Product_name"]
-            logger.info(f"Direct-filled Product_name: {extracted['Product_name']}")
+            logger.debug("Direct-filled Product_name: %s", extracted['Product_name'])
         
         if extracted.get("Quantity") is not None:
             qty_str = str(extracted["Quantity"])
             qty_num = self._parse_number(qty_str)
             if qty_num is not None:
                 self.data["Quantity"] = qty_num if abs(qty_num - round(qty_num)) < 1e-9 else round(qty_num, 3)
-                logger.info(f"Direct-filled Quantity: {self.data['Quantity']}")
+                logger.debug("Direct-filled Quantity: %s", self.data['Quantity'])
         
         # Step 2: Advance state machine to the first missing field
         # We need to respect the order: Type_of_client -> Behavior -> Purchase_status -> ...
@@ -449,8 +464,10 @@ class ConversationState:
                 self.current_state = STATE_CONTACT_LEFT
                 
             elif current_state == STATE_CONTACT_LEFT:
-                # Contact_left is not extracted by Gemini, so we stop here
-                break
+                # Contact_left is not extracted by Gemini; only a found phone/ID fills it
+                if not self.data.get("Contact_left"):
+                    break
+                self.current_state = STATE_SOURCE
                 
             elif current_state == STATE_SOURCE:
                 if not self.data.get("Source"):
@@ -469,7 +486,9 @@ class ConversationState:
                 self.current_state = STATE_SHORT_NOTE
                 
             elif current_state == STATE_SHORT_NOTE:
-                # Short note is optional, always stop here
+                # Short note is optional: stop here, or finish if it isn't asked
+                if not self.ask_short_note:
+                    self.current_state = STATE_COMPLETE
                 break
                 
             else:
@@ -478,6 +497,27 @@ class ConversationState:
         
         logger.info(f"Auto-fill complete. Current state: {self.current_state}")
     
+    def apply_client(self, client_id: str, previous: Optional[Dict[str, Any]]):
+        """
+        Fill client fields from a phone/ID found in the transcript or an answer.
+        previous: client_index.lookup() result (None = never seen before).
+        A known client makes Repeat_visit "да" and Type_of_client "повторный" (or their
+        wholesale/contractor type); a phone means the contact was left.
+        """
+        from app.services.client_index import client_type_for_repeat
+
+        self.data["Client_ID"] = client_id
+        self.data["Contact_left"] = "да"
+        if previous:
+            self.data["Repeat_visit"] = "да"
+            if self.data.get("Type_of_client") in ("", "новый", "повторный"):
+                self.data["Type_of_client"] = client_type_for_repeat(previous)
+        elif not self.data.get("Repeat_visit"):
+            self.data["Repeat_visit"] = "нет"
+        logger.info("Client %s: %s", client_id[-6:],
+                    f"{previous['visits']} earlier visits" if previous else "first visit")
+        self._auto_advance_through_filled_fields()
+
     def skip_short_note(self):
         """Skip the short note and complete."""
         if self.current_state == STATE_SHORT_NOTE:
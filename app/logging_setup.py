@@ -0,0 +1,90 @@
+# app/logging_setup.py
+"""
+Logging for the bot: level-gated, non-blocking, with a per-update request ID.
+
+- LOG_LEVEL (default INFO) gates everything; disabled levels cost one int compare.
+- Records are handed to a QueueHandler and written by a QueueListener thread,
+  so handlers and the STT/Gemini worker threads never wait on stdout.
+- request_id is a ContextVar set once per update; asyncio tasks and
+  asyncio.to_thread copy the context, so the same ID shows up on the download,
+  STT, extraction, validation and save lines of that update.
+- LOG_FORMAT=json writes one JSON object per line for log shippers.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+_listener = None
+
+
+def set_request_id(value: str):
+    request_id_var.set(value)
+
+
+def get_request_id() -> str:
+    return request_id_var.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps the caller's request ID on the record (runs in the caller's thread/context)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    """Install the queue-based root handler once (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+
+    stream = logging.StreamHandler(sys.stderr)
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(_TEXT_FORMAT))
+
+    q: "queue.SimpleQueue" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(q)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    # Chatty HTTP client internals stay at WARNING unless explicitly debugging
+    if level > logging.DEBUG:
+        for name in ("httpx", "httpcore", "urllib3"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
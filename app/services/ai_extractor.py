@@ -1,111 +1,464 @@
 # app/services/ai_extractor.py
 import os
+import re
 import json
 import random
 import time
 import logging
-from google import genai
-from google.genai import types
-from app.services.validator import ALLOWED
+import threading
+from typing import Dict, Any, List, Tuple, Optional
+from app.services.validator import match_enum, parse_number
+from app.services.enum_config import current as current_enums
+from app.services.tracing import span, set_attribute
+from app.services.breaker import get_breaker
+from app.services.deadline import DeadlineExceeded, sleep_within
+
+# google.genai is imported lazily in get_client(): the SDK (pydantic models, httpx)
+# is one of the slowest imports at bot startup.
 
 logger = logging.getLogger(__name__)
 
+# Use the stable free-tier model
+MODEL_ID = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
+# Per-request HTTP timeout of the SDK client (seconds)
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "30"))
+
+# Fields the model fills, in sheet order
+FIELDS = ["Type_of_client", "Behavior", "Purchase_status", "Ticket_amount", "Cost_Price",
+          "Source", "Reason_not_buying", "Product_name", "Quantity"]
+_ENUM_FIELDS = ["Type_of_client", "Behavior", "Purchase_status", "Reason_not_buying", "Source"]
+_NUMBER_FIELDS = ["Ticket_amount", "Cost_Price", "Quantity"]
+
+# Running totals for usage_summary(): calls, tokens and model latency
+_usage = {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "latency_s": 0.0, "bad_fields": 0}
+_usage_lock = threading.Lock()
+
+# Cached genai.Client keyed by (api_key, base_url); the client keeps its HTTP pool warm
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return a shared genai.Client, or None if GOOGLE_API_KEY is not set."""
+    global _client, _client_key
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        return None
+    # GEMINI_BASE_URL points the SDK at a local stand-in (replay harness / load tests)
+    base_url = os.getenv("GEMINI_BASE_URL")
+    with _client_lock:
+        set_attribute("client_cached", _client is not None and _client_key == (api_key, base_url))
+        if _client is None or _client_key != (api_key, base_url):
+            from google import genai
+            from google.genai import types
+            # A hung request must not outlive the update that waits for it
+            http_options = types.HttpOptions(base_url=base_url, timeout=int(GEMINI_TIMEOUT_S * 1000))
+            _client = genai.Client(api_key=api_key, http_options=http_options)
+            _client_key = (api_key, base_url)
+        return _client
+
+
+def warm_up():
+    """Import the SDK and build the client and request config ahead of the first voice note."""
+    if get_client() is not None:
+        _config("single")
+
+
+# ============================================================================
+# PROMPT + RESPONSE SCHEMA
+# ============================================================================
+
+# The allowed values travel in the response schema (as enums), not in the prompt
+# text, so the instructions are short and built once at import time.
+_RULES = """- НЕ придумывай значения: если информация явно не сказана — null.
+- «оптовик купила обоев на пятьдесят тысяч» -> Purchase_status "купили", Type_of_client "оптовик", Ticket_amount 50000.
+- «себестоимость двадцать тысяч» -> Cost_Price 20000.
+- Reason_not_buying — только если покупка не состоялась и причина названа.
+- Product_name — что продали, Quantity — количество.
+"""
+
+_SINGLE_PROMPT = (
+    "Ты помощник по внесению данных для магазина обоев. "
+    "Заполни поля схемы по транскрипции разговора с клиентом (русский/казахский разговорный).\n"
+    + _RULES
+    + "Транскрипция:\n"
+)
+
+_BATCH_PROMPT = (
+    "Ты помощник по внесению данных для магазина обоев. "
+    "Ниже JSON-массив транскрипций разговоров с клиентами, у каждой свой id. "
+    "Для КАЖДОЙ верни объект схемы с тем же id, ровно один на id.\n"
+    + _RULES
+    + "Транскрипции:\n"
+)
+
+
+def item_schema(enums=None) -> Dict[str, Any]:
+    """Response schema of one extraction: enums from the enum config, numbers as numbers, all nullable."""
+    enums = enums or current_enums()
+    props: Dict[str, Any] = {}
+    for field in FIELDS:
+        if field in _ENUM_FIELDS:
+            props[field] = {"type": "STRING", "enum": list(enums.choices[field]), "nullable": True}
+        elif field in _NUMBER_FIELDS:
+            props[field] = {"type": "NUMBER", "nullable": True}
+        else:
+            props[field] = {"type": "STRING", "nullable": True}
+    return {"type": "OBJECT", "properties": props}
+
+
+def _batch_schema(enums=None) -> Dict[str, Any]:
+    item = item_schema(enums)
+    item = {**item, "properties": {"id": {"type": "INTEGER"}, **item["properties"]}, "required": ["id"]}
+    return {"type": "ARRAY", "items": item}
+
+
+# (kind, enum config key) -> GenerateContentConfig; a reloaded enum config gets fresh entries
+_configs: Dict[Tuple[str, str], Any] = {}
+_configs_lock = threading.Lock()
+
+
+def _config(kind: str):
+    """GenerateContentConfig for 'single' or 'batch', built once per enum config version."""
+    enums = current_enums()
+    # Extraction runs in worker threads: check, prune and fill the cache as one step
+    with _configs_lock:
+        cfg = _configs.get((kind, enums.key))
+        if cfg is None:
+            from google.genai import types
+            # Drop the configs of older enum versions
+            for old_key in [k for k in _configs if k[1] != enums.key]:
+                del _configs[old_key]
+            cfg = _configs[(kind, enums.key)] = types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=item_schema(enums) if kind == "single" else _batch_schema(enums),
+            )
+        return cfg
+
+
+def build_prompt(transcription_text: str) -> str:
+    return _SINGLE_PROMPT + transcription_text
+
+
+def _batch_prompt(texts: List[str]) -> str:
+    items = [{"id": i, "text": t} for i, t in enumerate(texts, 1)]
+    return _BATCH_PROMPT + json.dumps(items, ensure_ascii=False)
+
+
+# ============================================================================
+# RESPONSE PARSING
+# ============================================================================
+
+# Salvage "Field": value pairs from output that isn't valid JSON (e.g. truncated)
+_FIELD_RE = re.compile(r'"(\w+)"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?|null|true|false)')
+
+
+def _clean_field(field: str, value: Any) -> Any:
+    """One field of model output -> valid value or None (raises nothing)."""
+    if value is None or value == "":
+        return None
+    if field in _ENUM_FIELDS:
+        return match_enum(str(value), field) or None
+    if field in _NUMBER_FIELDS:
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return value
+        return parse_number(str(value))
+    return str(value).strip() or None
+
+
+def parse_fields(raw: Any) -> Dict[str, Any]:
+    """
+    Model output (JSON text or an already parsed object) -> {field: value} for every FIELD.
+    Each field is checked on its own: a malformed or out-of-list value becomes None
+    while the other fields are kept; unparsable JSON is salvaged pair by pair.
+    """
+    obj = raw
+    if isinstance(raw, (str, bytes)):
+        try:
+            obj = json.loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            obj = {}
+            for key, val in _FIELD_RE.findall(raw if isinstance(raw, str) else raw.decode("utf-8", "replace")):
+                try:
+                    obj[key] = json.loads(val)
+                except json.JSONDecodeError:
+                    pass
+    if not isinstance(obj, dict):
+        obj = {}
+    out = {}
+    bad = 0
+    for field in FIELDS:
+        value = _clean_field(field, obj.get(field))
+        if value is None and obj.get(field) not in (None, ""):
+            bad += 1
+            logger.warning(f"Dropped invalid {field} from Gemini: {obj.get(field)!r}")
+        out[field] = value
+    if bad:
+        with _usage_lock:
+            _usage["bad_fields"] += bad
+    return out
+
+
+def _account(response, seconds: float, sp=None):
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = (usage.prompt_token_count or 0) if usage is not None else 0
+    output_tokens = (usage.candidates_token_count or 0) if usage is not None else 0
+    with _usage_lock:
+        _usage["calls"] += 1
+        _usage["prompt_tokens"] += prompt_tokens
+        _usage["output_tokens"] += output_tokens
+        _usage["latency_s"] += seconds
+    if sp is not None:
+        sp.set_attribute("prompt_tokens", prompt_tokens)
+        sp.set_attribute("output_tokens", output_tokens)
+    logger.debug("Gemini call: %s prompt + %s output tokens in %.0fms", prompt_tokens, output_tokens, seconds * 1000)
+    return prompt_tokens, output_tokens
+
+
+def usage_summary() -> Dict[str, Any]:
+    """Per-call averages since start (for /stats and the prompt report)."""
+    with _usage_lock:
+        u = dict(_usage)
+    calls = u["calls"] or 1
+    return {
+        **u,
+        "avg_prompt_tokens": round(u["prompt_tokens"] / calls, 1),
+        "avg_output_tokens": round(u["output_tokens"] / calls, 1),
+        "avg_latency_ms": round(u["latency_s"] / calls * 1000, 1),
+    }
+
+
+# ============================================================================
+# SINGLE EXTRACTION
+# ============================================================================
+
 def extract_data_with_gemini(transcription_text: str):
     """
     Sends transcription to Gemini to extract structured JSON data.
     Includes auto-retry for 429 (Rate Limit) errors.
-    Returns dict with extracted fields or empty dict on failure.
+    Returns dict with every field in FIELDS (None where unknown or invalid), or {} on failure.
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    with span("get_client"):
+        client = get_client()
+    if client is None:
         logger.error("❌ CRITICAL ERROR: GOOGLE_API_KEY not found.")
         return {}
+    breaker = get_breaker("gemini")
+    if not breaker.allow():
+        # Gemini is down: don't spend timeouts and backoff sleeps, the buttons will ask
+        logger.warning("⚠️ Gemini circuit open, skipping extraction")
+        return {}
 
-    client = genai.Client(api_key=api_key)
-
-    # Use the stable free-tier model
-    MODEL_ID = 'gemini-2.5-flash-lite' 
-
-    # Improved prompt in Russian for better understanding of colloquial speech
-    prompt = f"""Ты помощник по внесению данных для магазина обоев.
-
-Проанализируй текст разговора с клиентом и заполни JSON со следующими полями:
-
-- Type_of_client: ОДНО значение ИЗ СПИСКА {ALLOWED['Type_of_client']} или null.
-- Behavior: ОДНО значение ИЗ СПИСКА {ALLOWED['Behavior']} или null.
-- Purchase_status: ОДНО значение ИЗ СПИСКА {ALLOWED['Purchase_status']} или null.
-- Reason_not_buying: ОДНО значение ИЗ СПИСКА {ALLOWED['Reason_not_buying']} или null.
-- Source: ОДНО значение ИЗ СПИСКА {ALLOWED['Source']} или null.
-- Ticket_amount: число (сумма чека в тенге) или null.
-- Cost_Price: число (себестоимость в тенге) или null.
-- Product_name: что именно продали (текст) или null.
-- Quantity: количество (число) или null.
-
-Важно:
-- НЕ придумывай значения. ЕСЛИ ТЫ НЕ УВЕРЕН или информация явно не сказана — ставь null.
-- Если в тексте есть фразы про покупку (например, «оптовик купила обоев на пятьдесят тысяч»), тогда:
-  - Purchase_status = "купили"
-  - Type_of_client = подходящее значение из списка (например, "оптовик")
-  - Ticket_amount = соответствующее число (например, 50000)
-- Если есть слова про себестоимость («себестоимость двадцать тысяч тенге»), то это Cost_Price.
-- Если покупка не состоялась, а есть причина, выбери подходящую Reason_not_buying, иначе null.
-- Не добавляй никаких других полей, только перечисленные.
-
-Текст транскрипции (на русском/казахском разговорном языке):
-\"\"\"{transcription_text}\"\"\"
-
-Верни ТОЛЬКО один JSON без комментариев, без пояснений, строго в формате:
-
-{{
-  "Type_of_client": ...,
-  "Behavior": ...,
-  "Purchase_status": ...,
-  "Ticket_amount": ...,
-  "Cost_Price": ...,
-  "Source": ...,
-  "Reason_not_buying": ...,
-  "Product_name": ...,
-  "Quantity": ...
-}}
-"""
+    prompt = build_prompt(transcription_text)
 
     # RETRY LOGIC (Max 3 attempts)
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            response = client.models.generate_content(
-                model=MODEL_ID,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type='application/json'
+            set_attribute("retries", attempt)
+            with span("gemini", attempt=attempt + 1, prompt_chars=len(prompt)) as sp:
+                started = time.perf_counter()
+                response = client.models.generate_content(
+                    model=MODEL_ID,
+                    contents=prompt,
+                    config=_config("single"),
                 )
-            )
-            
-            # Parse JSON response
-            extracted = json.loads(response.text)
-            
-            # Debug logging: show what Gemini extracted
-            logger.info(f"✅ Gemini extracted: {json.dumps(extracted, ensure_ascii=False, indent=2)}")
-            
+                _account(response, time.perf_counter() - started, sp)
+
+            breaker.record_success()
+            extracted = parse_fields(response.text or "")
+            logger.info("✅ Gemini extracted %d fields", sum(v is not None for v in extracted.values()))
+            logger.debug("Gemini extracted: %s", response.text)
             return extracted
 
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Failed to parse JSON from Gemini: {e}")
-            logger.error(f"Raw response: {response.text if 'response' in locals() else 'No response'}")
-            # Don't retry on JSON errors - likely prompt/model issue
-            return {}
-            
         except Exception as e:
-            error_str = str(e)
             # Check if it's a Rate Limit error (429)
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
+            if _is_rate_limit(e):
                 wait_time = (2 ** attempt) + random.uniform(0, 1)  # Backoff: 1s, 2s, 4s...
                 logger.warning(f"⚠️ Quota hit. Retrying in {wait_time:.1f}s... (Attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
+                if not sleep_within(wait_time):
+                    # Our deadline, not Gemini's fault: leave the breaker alone
+                    logger.warning("⚠️ No time left in this update for another attempt")
+                    return {}
             else:
                 # If it's another error (like Auth or 500), stop immediately
                 logger.error(f"❌ AI Error: {e}")
+                breaker.record_failure()
                 return {}
 
     logger.error("❌ Failed after max retries.")
-    return {} 
\ No newline at end of file
+    breaker.record_failure()
+    return {}
+
+
+def extract_fields(transcription_text: str) -> Dict[str, Any]:
+    """
+    Local enum classifier first, Gemini only for what it is unsure about.
+
+    Confident classifier predictions win over Gemini's. Gemini is skipped when
+    every enum field the flow needs is confident and nothing else is left to
+    extract (amounts only matter for a purchase). Same shape as
+    extract_data_with_gemini.
+    """
+    from app.services.enum_classifier import confident_fields
+
+    local = confident_fields(transcription_text)
+    set_attribute("local_fields", len(local))
+    if _local_is_enough(local):
+        logger.info("✅ Classified %d fields locally, Gemini skipped", len(local))
+        return {f: local.get(f) for f in FIELDS}
+
+    extracted = extract_data_with_gemini(transcription_text)
+    if local and extracted:
+        extracted.update(local)
+    elif local:
+        # Gemini failed: the confident local fields still save the user some taps
+        extracted = {f: local.get(f) for f in FIELDS}
+    return extracted
+
+
+def _local_is_enough(local: Dict[str, str]) -> bool:
+    """Every enum field confident and no purchase (amounts and product still need Gemini)."""
+    return local.get("Purchase_status") not in (None, "купили") and all(f in local for f in _ENUM_FIELDS)
+
+
+def extract_fields_many(texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    extract_fields for several visits from one note, in order. The visits the local
+    classifier can't settle go to Gemini together in one packed request (extract_batch).
+    """
+    if len(texts) == 1:
+        return [extract_fields(texts[0])]
+    from app.services.enum_classifier import confident_fields
+
+    local = [confident_fields(t) for t in texts]
+    results = [{f: fields.get(f) for f in FIELDS} if fields else {} for fields in local]
+    need = [i for i, fields in enumerate(local) if not _local_is_enough(fields)]
+    set_attribute("gemini_visits", len(need))
+    if need:
+        res = extract_batch([(str(i), texts[i]) for i in need])
+        for i in need:
+            extracted = res["results"].get(str(i))
+            if extracted:
+                results[i] = {**extracted, **local[i]}
+        if res["errors"]:
+            logger.warning(f"Gemini failed for {len(res['errors'])} of {len(texts)} visits in one note")
+    return results
+
+
+def _is_rate_limit(e: Exception) -> bool:
+    error_str = str(e)
+    return "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
+
+
+# ============================================================================
+# BATCH EXTRACTION
+# ============================================================================
+
+def _new_stats() -> Dict[str, Any]:
+    return {"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "retries": 0, "splits": 0}
+
+
+def _call_batch(client, texts: List[str], stats: Dict[str, Any], max_retries: int) -> Dict[int, Dict[str, Any]]:
+    """One packed request (with 429 backoff). Returns {local id: extracted fields} for parsable items."""
+    prompt = _batch_prompt(texts)
+    for attempt in range(max_retries):
+        try:
+            stats["requests"] += 1
+            with span("gemini_batch", items=len(texts), attempt=attempt + 1) as sp:
+                started = time.perf_counter()
+                response = client.models.generate_content(
+                    model=MODEL_ID,
+                    contents=prompt,
+                    config=_config("batch"),
+                )
+                prompt_tokens, output_tokens = _account(response, time.perf_counter() - started, sp)
+            break
+        except Exception as e:
+            if not _is_rate_limit(e) or attempt == max_retries - 1:
+                raise
+            stats["retries"] += 1
+            wait_time = (2 ** attempt) + random.uniform(0, 1)
+            logger.warning(f"⚠️ Quota hit on batch of {len(texts)}. Retrying in {wait_time:.1f}s...")
+            if not sleep_within(wait_time):
+                raise DeadlineExceeded("gemini_batch") from e
+
+    stats["prompt_tokens"] += prompt_tokens
+    stats["output_tokens"] += output_tokens
+
+    try:
+        parsed = json.loads(response.text)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    out = {}
+    for obj in parsed if isinstance(parsed, list) else []:
+        if not isinstance(obj, dict):
+            continue
+        try:
+            local_id = int(obj.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= local_id <= len(texts):
+            out[local_id] = parse_fields(obj)
+    return out
+
+
+def extract_batch(items: List[Tuple[str, str]], max_retries: int = 3) -> Dict[str, Any]:
+    """
+    Extract many transcripts with one request per batch instead of one per transcript.
+
+    items: [(key, transcription_text)] - one packed request for all of them, so keep
+    batches to a few dozen. Items the model skipped or mangled are retried by
+    splitting the batch in halves, down to single items, so one bad transcript
+    costs a few extra requests instead of failing its neighbours.
+
+    Returns {"results": {key: fields}, "errors": {key: message}, "requests",
+    "prompt_tokens", "output_tokens", "retries", "splits"}.
+    """
+    stats = _new_stats()
+    results: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    client = get_client()
+    if client is None:
+        return {"results": {}, "errors": {k: "GOOGLE_API_KEY not set" for k, _ in items}, **stats}
+
+    breaker = get_breaker("gemini")
+    pending = [list(items)] if items else []
+    while pending:
+        chunk = pending.pop()
+        if not breaker.allow():
+            errors.update({key: "Gemini circuit open" for key, _ in chunk})
+            continue
+        try:
+            got = _call_batch(client, [t for _, t in chunk], stats, max_retries)
+        except DeadlineExceeded as e:
+            # Out of time, not a Gemini failure: the breaker isn't told, the rest isn't tried
+            logger.warning(f"⚠️ Batch of {len(chunk)} stopped: {e}")
+            errors.update({key: str(e) for part in [chunk, *pending] for key, _ in part})
+            break
+        except Exception as e:
+            # The request itself failed (after 429 backoff): don't hammer the API item by item
+            logger.error(f"❌ Batch of {len(chunk)} failed: {e}")
+            breaker.record_failure()
+            errors.update({key: str(e) for key, _ in chunk})
+            continue
+        breaker.record_success()
+        missing = []
+        for i, (key, text) in enumerate(chunk, 1):
+            if i in got:
+                results[key] = got[i]
+            else:
+                missing.append((key, text))
+        if not missing:
+            continue
+        if len(chunk) == 1:
+            errors[missing[0][0]] = "missing or invalid in model response"
+            continue
+        # Partial answer: retry what's missing in smaller batches
+        stats["splits"] += 1
+        mid = (len(missing) + 1) // 2
+        pending.extend(p for p in (missing[:mid], missing[mid:]) if p)
+    return {"results": results, "errors": errors, **stats}
@@ -0,0 +1,121 @@
+# app/services/breaker.py
+"""
+Circuit breakers for external dependencies: "gemini", and one "sheets:<shop>"
+per Sheets shard, so a single shop's broken sheet doesn't fail the others.
+
+A breaker counts consecutive failures of its dependency. After
+BREAKER_FAILURES of them it opens: callers check allow() and take their
+fallback at once (local journal for saves, button flow for extraction) instead
+of paying timeouts and retry sleeps. After BREAKER_RESET_S it goes half-open
+and lets a single probe call through; success closes it, failure opens it for
+another period. State and counters are reported by stats() (/stats, replay).
+"""
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any
+
+from app.services.tracing import set_attribute
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET_S):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "trips": 0}
+
+    def allow(self) -> bool:
+        """True if a call may go ahead now (closed, or the one half-open probe)."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"Breaker {self.name} half-open, probing")
+            if self.state == HALF_OPEN and self._probe_in_flight \
+                    and time.monotonic() - self._probe_started >= self.reset_timeout:
+                self._probe_in_flight = False  # the probe never reported back
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._probe_in_flight):
+                if self.state == HALF_OPEN:
+                    self._probe_in_flight = True
+                    self._probe_started = time.monotonic()
+                self.counters["calls"] += 1
+                return True
+            self.counters["rejected"] += 1
+        set_attribute(f"breaker.{self.name}", self.state)
+        return False
+
+    def is_open(self) -> bool:
+        """Open and not yet due for a probe (read-only; doesn't count as a call)."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def check(self):
+        """allow() that raises CircuitOpenError when the call must not be made."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} unavailable (circuit open), retry in "
+                                   f"{max(0, self.reset_timeout - (time.monotonic() - self.opened_at)):.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Breaker {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.counters["failures"] += 1
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.counters["trips"] += 1
+                logger.warning(f"Breaker {self.name} open after {self.failures} failures, "
+                               f"fast-failing for {self.reset_timeout:.0f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {"state": self.state, "consecutive_failures": self.failures, **self.counters}
+            if self.state == OPEN:
+                out["retry_in_s"] = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+            return out
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """{dependency: {"state", "consecutive_failures", "calls", "failures", "rejected", "trips"[, "retry_in_s"]}}"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
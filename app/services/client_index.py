@@ -0,0 +1,109 @@
+# app/services/client_index.py
+"""
+In-memory index of clients' previous visits, keyed by normalized Client_ID.
+
+Client_ID is stored as the last 6 digits of the phone/ID (validate_and_normalize_row),
+so the index uses the same key. It is built from the local visit store on first
+use (warm_up at startup) and updated by record() on every save, so looking up a
+client costs one dict access. When a phone number or client ID shows up in a
+transcript or an answer, the conversation can fill Repeat_visit and
+Type_of_client (and Contact_left) from it instead of asking.
+"""
+import re
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+from app.services.validator import norm_phone
+
+logger = logging.getLogger(__name__)
+
+# Client types that describe the client rather than the visit, so a repeat visit keeps them
+_STICKY_TYPES = ("оптовик", "контрактник/мастер")
+
+# Phone: +7/8 prefix optional, 10+ digits with spaces, dashes or parentheses between them
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+?\d[\s\-()]*)?(?:\d[\s\-()]*){9,}\d(?!\d)")
+# Explicit ID: "id 123456", "айди 12-34-56", "номер клиента 123456"
+_ID_RE = re.compile(r"(?:\bid\b|айди|номер(?:\s+клиента)?|код\s+клиента)\s*[:№#]?\s*(\d[\d\s\-]{4,}\d)",
+                    re.IGNORECASE)
+
+_index: Dict[str, Dict[str, Any]] = {}
+_loaded = False
+_lock = threading.Lock()
+
+
+def client_key(client_id: Optional[str]) -> str:
+    """Index key: last 6 digits, as validate_and_normalize_row stores Client_ID ("" if too short)."""
+    digits = norm_phone(client_id)
+    return digits[-6:] if len(digits) >= 6 else ""
+
+
+def find_client_id(text: Optional[str]) -> str:
+    """First phone number or explicit client ID in free text, as digits ("" if none)."""
+    if not text:
+        return ""
+    m = _PHONE_RE.search(text) or _ID_RE.search(text)
+    if not m:
+        return ""
+    return norm_phone(m.group(m.lastindex or 0))
+
+
+def _add(key: str, date: str, type_of_client: str):
+    entry = _index.get(key)
+    if entry is None:
+        _index[key] = {"visits": 1, "last_date": date, "type_of_client": type_of_client}
+        return
+    entry["visits"] += 1
+    if date >= entry["last_date"]:
+        entry["last_date"] = date
+        if type_of_client:
+            entry["type_of_client"] = type_of_client
+
+
+def _ensure_loaded():
+    global _loaded
+    if _loaded:
+        return
+    from app.services.visit_store import query
+
+    rows = query("SELECT client_id, date, type_of_client FROM visits "
+                 "WHERE client_id IS NOT NULL AND client_id != '' ORDER BY date")
+    for r in rows:
+        key = client_key(r["client_id"])
+        if key:
+            _add(key, r["date"], r["type_of_client"] or "")
+    _loaded = True
+    logger.info(f"Client index built: {len(_index)} clients from {len(rows)} visits")
+
+
+def warm_up():
+    with _lock:
+        _ensure_loaded()
+
+
+def lookup(client_id: str) -> Optional[Dict[str, Any]]:
+    """{"visits", "last_date", "type_of_client"} of the client's earlier visits, or None if never seen."""
+    key = client_key(client_id)
+    if not key:
+        return None
+    with _lock:
+        _ensure_loaded()
+        entry = _index.get(key)
+        return dict(entry) if entry else None
+
+
+def record(row: Dict[str, Any]):
+    """Count a just-committed visit (normalized row) in the index."""
+    key = client_key(row.get("Client_ID"))
+    if not key:
+        return
+    with _lock:
+        if not _loaded:
+            _ensure_loaded()  # built from the store, which already has this visit
+            return
+        _add(key, row.get("Date", ""), row.get("Type_of_client", ""))
+
+
+def client_type_for_repeat(previous: Dict[str, Any]) -> str:
+    """Type_of_client for a client seen before: their wholesale/contractor type, else "повторный"."""
+    return previous["type_of_client"] if previous.get("type_of_client") in _STICKY_TYPES else "повторный"
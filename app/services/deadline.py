@@ -0,0 +1,147 @@
+# app/services/deadline.py
+"""
+Per-update deadline shared by every stage of the voice pipeline.
+
+tag_update starts one Deadline per update (UPDATE_DEADLINE_S) in a ContextVar,
+like the request ID, so asyncio.to_thread workers see the same object. A voice
+note stretches it with for_audio() by UPDATE_DEADLINE_PER_AUDIO_S per second
+of audio, since STT time grows with the note. Stages spend from the one budget:
+  - async side: within(stage, awaitable) waits at most the remaining time;
+    on expiry it cancels the deadline and raises DeadlineExceeded;
+  - worker side: blocking code polls `expired` (recognizer loop), sleeps with
+    sleep_within() (Gemini backoff) and registers kill callbacks with
+    on_cancel() (decoder subprocess), so a cancelled update stops using CPU
+    instead of finishing work nobody waits for.
+Without a deadline (batch tools, tests) every helper is a no-op.
+"""
+import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, TypeVar
+
+UPDATE_DEADLINE_S = float(os.getenv("UPDATE_DEADLINE_S", "120"))
+# Extra budget per second of audio, so long notes aren't cut off in STT (see for_audio)
+UPDATE_DEADLINE_PER_AUDIO_S = float(os.getenv("UPDATE_DEADLINE_PER_AUDIO_S", "1"))
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(RuntimeError):
+    """The update's time budget ran out in `stage`."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"deadline exceeded in {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self._cancelled.is_set() or time.monotonic() >= self.expires_at
+
+    def extend(self, seconds: float):
+        """Allow at least `seconds` from the start (never shortens)."""
+        self.expires_at = max(self.expires_at, self.started + seconds)
+
+    def check(self, stage: str):
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    def cancel(self):
+        """Stop the update's remaining work: wake sleepers and run the kill callbacks."""
+        with self._lock:
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+
+    @contextmanager
+    def on_cancel(self, fn: Callable[[], None]):
+        """Run fn if the deadline is cancelled while the block runs (e.g. kill a subprocess)."""
+        with self._lock:
+            cancelled = self._cancelled.is_set()
+            if not cancelled:
+                self._callbacks.append(fn)
+        if cancelled:
+            fn()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if fn in self._callbacks:
+                    self._callbacks.remove(fn)
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def start(seconds: float = UPDATE_DEADLINE_S) -> Deadline:
+    """New deadline for the current update (and the threads it hands work to)."""
+    deadline = Deadline(seconds)
+    _current.set(deadline)
+    return deadline
+
+
+def clear():
+    """No deadline from here on in this context (background work an update hands off)."""
+    _current.set(None)
+
+
+def for_audio(duration_s: float):
+    """Stretch the current deadline to the base budget plus UPDATE_DEADLINE_PER_AUDIO_S per audio second."""
+    deadline = _current.get()
+    if deadline is not None and duration_s:
+        deadline.extend(UPDATE_DEADLINE_S + UPDATE_DEADLINE_PER_AUDIO_S * duration_s)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining() -> float:
+    """Seconds left for this update (inf without a deadline)."""
+    deadline = _current.get()
+    return float("inf") if deadline is None else deadline.remaining()
+
+
+def sleep_within(seconds: float) -> bool:
+    """Sleep unless that would outlast the deadline; False (right away, or when cancelled) if it would."""
+    deadline = _current.get()
+    if deadline is None:
+        time.sleep(seconds)
+        return True
+    if seconds >= deadline.remaining():
+        return False
+    return not deadline._cancelled.wait(seconds)
+
+
+async def within(stage: str, awaitable: Awaitable[T]) -> T:
+    """Await a stage with what is left of the deadline; DeadlineExceeded (and cancel()) when it runs out."""
+    deadline = _current.get()
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=deadline.remaining())
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        if not deadline.expired:
+            raise  # a timeout of the stage itself (socket, API), not ours
+        deadline.cancel()
+        raise DeadlineExceeded(stage)
@@ -0,0 +1,343 @@
+# app/services/enum_classifier.py
+"""
+On-CPU classifier for the enum fields, trained on our own labeled visits.
+
+Features are character 2-4-grams of the normalized transcript (padded per
+word), weighted with sublinear TF-IDF and L2-normalized. Each field
+(Type_of_client, Behavior, Purchase_status, Reason_not_buying, Source) is a
+multinomial Naive Bayes model over the same features; its scores are turned
+into probabilities with a per-field temperature fitted on held-out rows, so
+the reported confidence is calibrated (0.9 means right ~90% of the time).
+
+Everything is plain Python. The loaded model keeps, per feature, its IDF and
+the weights of all fields together and caches each word's in-vocabulary
+n-grams; features are summed column-wise per count group, so there is no
+per-class Python loop per n-gram. Once a note has CLASSIFIER_MAX_NGRAMS
+distinct features, its later words are left out. Measured with a 3k-feature, 26-class model on one slow vCPU: ~0.75 ms
+for 30-110 words, ~0.9 ms at 330 words and ~1.5 ms at 670 words;
+train_classifier prints the figures for your own model. Train with
+`python -m app.tools.train_classifier`; the model is a JSON file at
+CLASSIFIER_PATH. Without that file predict() returns {} and the bot keeps
+using Gemini for everything.
+"""
+import os
+import re
+import json
+import math
+import random
+import logging
+import threading
+from collections import Counter
+from operator import itemgetter
+from datetime import datetime
+from typing import Dict, Any, List, Tuple, Optional
+
+from app.services.validator import match_enum
+from app.services.enum_config import current as current_enums
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_PATH = os.getenv("CLASSIFIER_PATH", "enum_classifier.json")
+# Predictions below this calibrated confidence are left to Gemini
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.85"))
+
+ENUM_FIELDS = ["Type_of_client", "Behavior", "Purchase_status", "Reason_not_buying", "Source"]
+
+NGRAM_MIN, NGRAM_MAX = 2, 4
+MAX_FEATURES = 20000
+# Distinct n-gram features scored per note: later words of a longer note are left out
+CLASSIFIER_MAX_NGRAMS = int(os.getenv("CLASSIFIER_MAX_NGRAMS", "400"))
+# Words whose n-grams are cached per loaded model
+_WORD_CACHE_SIZE = 50000
+NB_ALPHA = 0.1
+_TEMPERATURES = [0.05 * 1.25 ** i for i in range(40)]   # 0.05 .. ~300
+
+_clean_re = re.compile(r"[^0-9a-zа-я\s]+")
+
+
+# ============================================================================
+# FEATURES
+# ============================================================================
+
+def _normalize(text: str) -> str:
+    text = (text or "").lower().replace("ё", "е")
+    return " ".join(_clean_re.sub(" ", text).split())
+
+
+def _word_ngrams(word: str) -> List[str]:
+    w = f" {word} "
+    return [w[i:i + n] for n in range(NGRAM_MIN, NGRAM_MAX + 1) for i in range(len(w) - n + 1)]
+
+
+def ngrams(text: str) -> Counter:
+    """Character n-gram counts of each word padded with spaces (like char_wb)."""
+    counts: Counter = Counter()
+    for word in _normalize(text).split():
+        counts.update(_word_ngrams(word))
+    return counts
+
+
+def _tfidf(counts: Counter, idf: Dict[str, float]) -> List[Tuple[str, float]]:
+    vec = [(g, (1.0 + math.log(c)) * idf[g]) for g, c in counts.items() if g in idf]
+    norm = math.sqrt(sum(v * v for _, v in vec)) or 1.0
+    return [(g, v / norm) for g, v in vec]
+
+
+def _softmax(scores: List[float], temperature: float) -> List[float]:
+    scaled = [s / temperature for s in scores]
+    top = max(scaled)
+    exps = [math.exp(s - top) for s in scaled]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+# ============================================================================
+# TRAINING
+# ============================================================================
+
+def _fit_nb(vectors: List[List[Tuple[str, float]]], labels: List[str], classes: List[str],
+            vocab: List[str]) -> Tuple[List[float], Dict[str, List[float]]]:
+    """Multinomial NB on TF-IDF weights. Returns (log priors, feature -> per-class log likelihoods)."""
+    k = len(classes)
+    index = {c: i for i, c in enumerate(classes)}
+    class_counts = [0] * k
+    feature_mass: Dict[str, List[float]] = {}
+    totals = [0.0] * k
+    for vec, label in zip(vectors, labels):
+        ci = index[label]
+        class_counts[ci] += 1
+        for g, v in vec:
+            row = feature_mass.get(g)
+            if row is None:
+                row = feature_mass[g] = [0.0] * k
+            row[ci] += v
+            totals[ci] += v
+    n = len(labels)
+    priors = [math.log((class_counts[i] + 1) / (n + k)) for i in range(k)]
+    denom = [totals[i] + NB_ALPHA * len(vocab) for i in range(k)]
+    weights = {}
+    for g in vocab:
+        row = feature_mass.get(g, [0.0] * k)
+        weights[g] = [math.log((row[i] + NB_ALPHA) / denom[i]) for i in range(k)]
+    return priors, weights
+
+
+def _scores(vec, priors: List[float], weights: Dict[str, List[float]]) -> List[float]:
+    s = list(priors)
+    for g, v in vec:
+        w = weights.get(g)
+        if w is not None:
+            for i in range(len(s)):
+                s[i] += v * w[i]
+    return s
+
+
+def _fit_temperature(score_rows: List[List[float]], gold: List[int]) -> float:
+    """Temperature minimizing held-out negative log-likelihood."""
+    best_t, best_nll = 1.0, float("inf")
+    for t in _TEMPERATURES:
+        nll = 0.0
+        for scores, y in zip(score_rows, gold):
+            nll -= math.log(max(_softmax(scores, t)[y], 1e-12))
+        if nll < best_nll:
+            best_t, best_nll = t, nll
+    return best_t
+
+
+def train(rows: List[Dict[str, Any]], holdout: float = 0.2, seed: int = 13,
+          min_confidence: float = CLASSIFIER_MIN_CONFIDENCE) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    rows: visits with Transcription_raw and the chosen enum values.
+    Returns (model, report); report has held-out accuracy, coverage and accuracy above min_confidence.
+    """
+    data = []
+    for r in rows:
+        text = r.get("Transcription_raw") or ""
+        if not _normalize(text):
+            continue
+        labels = {f: match_enum(r.get(f), f) for f in ENUM_FIELDS}
+        data.append((ngrams(text), labels))
+    if len(data) < 20:
+        raise ValueError(f"Need at least 20 transcribed rows to train, got {len(data)}")
+
+    random.Random(seed).shuffle(data)
+    cut = max(1, int(len(data) * holdout))
+    held, fit = data[:cut], data[cut:]
+
+    def build(part):
+        df: Counter = Counter()
+        for counts, _ in part:
+            df.update(counts.keys())
+        vocab = [g for g, c in df.most_common(MAX_FEATURES) if c >= 2]
+        idf = {g: math.log((1 + len(part)) / (1 + df[g])) + 1.0 for g in vocab}
+        return vocab, idf
+
+    report: Dict[str, Any] = {"rows": len(data), "holdout": len(held), "fields": {}}
+    temperatures = {}
+    vocab, idf = build(fit)
+    fit_vecs = [_tfidf(c, idf) for c, _ in fit]
+    held_vecs = [_tfidf(c, idf) for c, _ in held]
+    for field in ENUM_FIELDS:
+        pairs = [(v, lab[field]) for v, (_, lab) in zip(fit_vecs, fit) if lab[field]]
+        classes = sorted({lab for _, lab in pairs})
+        if len(classes) < 2:
+            continue
+        priors, weights = _fit_nb([v for v, _ in pairs], [lab for _, lab in pairs], classes, vocab)
+        test = [(v, lab[field]) for v, (_, lab) in zip(held_vecs, held) if lab[field] in classes]
+        if not test:
+            temperatures[field] = 1.0
+            continue
+        score_rows = [_scores(v, priors, weights) for v, _ in test]
+        gold = [classes.index(lab) for _, lab in test]
+        t = _fit_temperature(score_rows, gold)
+        temperatures[field] = t
+        correct = confident = confident_correct = 0
+        for scores, y in zip(score_rows, gold):
+            probs = _softmax(scores, t)
+            pred = max(range(len(probs)), key=probs.__getitem__)
+            correct += pred == y
+            if probs[pred] >= min_confidence:
+                confident += 1
+                confident_correct += pred == y
+        report["fields"][field] = {
+            "classes": len(classes),
+            "accuracy": round(correct / len(test), 3),
+            "coverage": round(confident / len(test), 3),
+            "confident_accuracy": round(confident_correct / confident, 3) if confident else None,
+            "temperature": round(t, 3),
+        }
+
+    # Refit on all rows with the held-out temperatures
+    vocab, idf = build(data)
+    vecs = [_tfidf(c, idf) for c, _ in data]
+    model: Dict[str, Any] = {
+        "version": 1,
+        "trained_at": datetime.now().isoformat(timespec="seconds"),
+        "rows": len(data),
+        "ngram": [NGRAM_MIN, NGRAM_MAX],
+        "idf": {g: round(idf[g], 5) for g in vocab},
+        "fields": {},
+    }
+    per_feature: Dict[str, List[float]] = {g: [] for g in vocab}
+    offset = 0
+    for field in ENUM_FIELDS:
+        if field not in temperatures:
+            continue
+        pairs = [(v, lab[field]) for v, (_, lab) in zip(vecs, data) if lab[field]]
+        classes = sorted({lab for _, lab in pairs})
+        priors, weights = _fit_nb([v for v, _ in pairs], [lab for _, lab in pairs], classes, vocab)
+        for g in vocab:
+            per_feature[g].extend(round(w, 4) for w in weights[g])
+        model["fields"][field] = {
+            "classes": classes, "offset": offset, "priors": [round(p, 5) for p in priors],
+            "temperature": temperatures[field],
+        }
+        offset += len(classes)
+    model["weights"] = per_feature
+    return model, report
+
+
+def save_model(model: Dict[str, Any], path: str = CLASSIFIER_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(model, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+# ============================================================================
+# PREDICTION
+# ============================================================================
+
+_model: Optional[Dict[str, Any]] = None
+_model_mtime: Optional[float] = None
+_model_lock = threading.Lock()
+# Derived from _model for predict():
+# {"model", "features": {g: (idf², idf * weights of all fields)}, "words": {word: [g, ...]}, "width"}
+_compiled: Optional[Dict[str, Any]] = None
+
+
+def _compile(model: Dict[str, Any]) -> Dict[str, Any]:
+    idf, weights = model["idf"], model["weights"]
+    return {
+        "model": model,
+        "features": {g: (idf[g] ** 2, tuple(idf[g] * w for w in weights[g])) for g in idf},
+        "words": {},
+        "width": sum(len(f["classes"]) for f in model["fields"].values()),
+    }
+
+
+def load_model(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Cached model; reloaded when the file changes (retraining needs no restart)."""
+    global _model, _model_mtime, _compiled
+    path = path or CLASSIFIER_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _model_lock:
+        if _model is None or mtime != _model_mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                _model = json.load(f)
+            _model_mtime = mtime
+            _compiled = _compile(_model)
+            logger.info(f"Loaded enum classifier from {path} ({_model.get('rows')} rows, "
+                        f"fields: {', '.join(_model['fields'])})")
+        return _model
+
+
+def warm_up():
+    load_model()
+
+
+def predict(text: str) -> Dict[str, Tuple[str, float]]:
+    """{field: (value, calibrated confidence)} for every field the model knows; {} without a model."""
+    words = _normalize(text).split()
+    if load_model() is None or not words:
+        return {}
+    # One consistent snapshot, even if the file is reloaded meanwhile
+    compiled = _compiled
+    model = compiled["model"]
+    features, cache = compiled["features"], compiled["words"]
+    counts: Counter = Counter()
+    # Words in order of first use; a long note stops adding words at CLASSIFIER_MAX_NGRAMS features
+    for word, repeats in Counter(words).items():
+        if len(counts) >= CLASSIFIER_MAX_NGRAMS:
+            break
+        grams = cache.get(word)
+        if grams is None:
+            if len(cache) >= _WORD_CACHE_SIZE:
+                cache.clear()
+            grams = cache[word] = [g for g in _word_ngrams(word) if g in features]
+        counts.update(grams * repeats if repeats > 1 else grams)
+    # Same TF-IDF as training ((1 + log tf) * idf, L2-normalized). Features are grouped by
+    # count, so each group's rows are summed column-wise in C and scaled once
+    groups: Dict[int, List[Tuple[float, Tuple[float, ...]]]] = {}
+    for g, c in counts.items():
+        groups.setdefault(c, []).append(features[g])
+    totals = [0.0] * compiled["width"]
+    sq = 0.0
+    for c, group in groups.items():
+        tf = 1.0 + math.log(c)
+        sq += tf * tf * sum(map(itemgetter(0), group))
+        for i, col in enumerate(zip(*map(itemgetter(1), group))):
+            totals[i] += tf * sum(col)
+    norm = math.sqrt(sq) or 1.0
+    totals = [t / norm for t in totals]
+    out = {}
+    for field, f in model["fields"].items():
+        k = len(f["classes"])
+        scores = [p + s for p, s in zip(f["priors"], totals[f["offset"]:f["offset"] + k])]
+        probs = _softmax(scores, f["temperature"])
+        best = max(range(k), key=probs.__getitem__)
+        out[field] = (f["classes"][best], probs[best])
+    return out
+
+
+def confident_fields(text: str, min_confidence: float = CLASSIFIER_MIN_CONFIDENCE) -> Dict[str, str]:
+    """
+    Only the predictions at or above min_confidence, as {field: value}. Values the
+    enum config no longer allows (model trained before a change) are dropped.
+    """
+    choices = current_enums().choices
+    return {f: v for f, (v, conf) in predict(text).items()
+            if conf >= min_confidence and v in choices.get(f, ())}
@@ -0,0 +1,132 @@
+# app/services/enum_config.py
+"""
+Allowed enum values (client type, behavior, status, reasons, sources, yes/no),
+shared by the validator, the answer keyboards and the Gemini response schema.
+
+The values live in one versioned JSON file (ENUM_CONFIG_PATH):
+
+    {"version": 3,
+     "fields": {"Type_of_client": ["новый", "повторный", ...],
+                "Reason_not_buying": [...], ...}}
+
+Fields missing from the file keep the built-in values (DEFAULT_ALLOWED); without
+the file the built-ins are used as is. Unknown fields, and files that drop a
+value the code itself relies on (_REQUIRED_VALUES), are rejected. current()
+returns an immutable snapshot with everything precomputed (lowercase lookups,
+keyboards). The file is checked at most every ENUM_CONFIG_CHECK_S seconds and a
+changed file is swapped in atomically, so adding a reason needs no restart (and
+keeps loaded models). A broken file is logged and ignored; the previous
+snapshot stays. Caches derived from the values key on snapshot.key, which
+changes with every reload.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENUM_CONFIG_PATH = os.getenv("ENUM_CONFIG_PATH", "enum_config.json")
+ENUM_CONFIG_CHECK_S = float(os.getenv("ENUM_CONFIG_CHECK_S", "5"))
+
+DEFAULT_ALLOWED: Dict[str, List[str]] = {
+    "Type_of_client": ["новый", "повторный", "контрактник/мастер", "оптовик"],
+    "Behavior": ["мимо прошли", "поспрашивали", "посмотрели", "замеряли/считали"],
+    "Purchase_status": ["купили", "не купили", "думают", "обмен"],
+    "Reason_not_buying": ["дорого", "нет дизайна/цвета", "нет в наличии", "сравнивают",
+                          "зайдут позже", "не целевой", "не успел обработать", "другое"],
+    "Source": ["Instagram", "2ГИС", "рекомендация", "вывеска", "TikTok", "другое"],
+    "YesNo": ["да", "нет"],
+}
+# Literals the code compares against or writes itself, so a config can't rename or drop them:
+# the purchase branch (conversation_flow, validator, visit_store rollups), repeat-client
+# handling (ConversationState.apply_client, client_index) and the yes/no answers
+_REQUIRED_VALUES = {
+    "Purchase_status": ["купили"],
+    "Type_of_client": ["новый", "повторный", "оптовик", "контрактник/мастер"],
+    "YesNo": ["да", "нет"],
+}
+
+
+class EnumConfig:
+    """One loaded version of the allowed values, with lookups precomputed. Never mutated."""
+
+    __slots__ = ("version", "key", "source", "choices", "lowered", "by_lower", "keyboards")
+
+    def __init__(self, fields: Dict[str, List[str]], version: int, digest: str, source: str):
+        self.version = version
+        self.key = f"{version}:{digest}"
+        self.source = source
+        self.choices: Dict[str, Tuple[str, ...]] = {f: tuple(v) for f, v in fields.items()}
+        # Lowercased values in order (substring/fuzzy matching) and lower -> original (exact match)
+        self.lowered: Dict[str, Tuple[str, ...]] = {f: tuple(c.lower() for c in v) for f, v in self.choices.items()}
+        self.by_lower: Dict[str, Dict[str, str]] = {f: {c.lower(): c for c in v} for f, v in self.choices.items()}
+        # One button per row, as the bot has always shown them
+        self.keyboards: Dict[str, List[List[str]]] = {f: [[c] for c in v] for f, v in self.choices.items()}
+
+    def keyboard(self, field: str) -> List[List[str]]:
+        return [list(row) for row in self.keyboards.get(field, [])]
+
+
+def _parse(raw: bytes, source: str) -> EnumConfig:
+    """Build a snapshot from file contents; ValueError if it isn't a usable config."""
+    data = json.loads(raw.decode("utf-8"))
+    if not isinstance(data, dict) or not isinstance(data.get("version"), int):
+        raise ValueError('expected {"version": <int>, "fields": {...}}')
+    fields = {f: list(v) for f, v in DEFAULT_ALLOWED.items()}
+    for field, values in (data.get("fields") or {}).items():
+        if field not in DEFAULT_ALLOWED:
+            raise ValueError(f"unknown field {field} (known: {', '.join(DEFAULT_ALLOWED)})")
+        if (not isinstance(values, list) or not values
+                or not all(isinstance(v, str) and v.strip() for v in values)):
+            raise ValueError(f"{field}: expected a non-empty list of strings")
+        fields[field] = [v.strip() for v in values]
+    for field, required in _REQUIRED_VALUES.items():
+        missing = [v for v in required if v not in fields[field]]
+        if missing:
+            raise ValueError(f"{field}: must keep {', '.join(missing)}")
+    return EnumConfig(fields, data["version"], hashlib.sha1(raw).hexdigest()[:8], source)
+
+
+_BUILTIN = EnumConfig(DEFAULT_ALLOWED, 0, "builtin", "builtin")
+_current = _BUILTIN
+_mtime: Optional[float] = None
+_next_check = 0.0
+_lock = threading.Lock()
+
+
+def reload(force: bool = False) -> EnumConfig:
+    """Re-read ENUM_CONFIG_PATH if it changed (or force). Returns the snapshot in effect."""
+    global _current, _mtime, _next_check
+    with _lock:
+        _next_check = time.monotonic() + ENUM_CONFIG_CHECK_S
+        try:
+            mtime = os.path.getmtime(ENUM_CONFIG_PATH)
+        except OSError:
+            if _current is not _BUILTIN:
+                logger.warning(f"Enum config {ENUM_CONFIG_PATH} is gone, back to built-in values")
+            _current, _mtime = _BUILTIN, None
+            return _current
+        if mtime == _mtime and not force:
+            return _current
+        _mtime = mtime
+        try:
+            with open(ENUM_CONFIG_PATH, "rb") as f:
+                snapshot = _parse(f.read(), ENUM_CONFIG_PATH)
+        except Exception as e:
+            logger.error(f"Enum config {ENUM_CONFIG_PATH} not loaded, keeping version {_current.key}: {e}")
+            return _current
+        if snapshot.key != _current.key:
+            logger.info(f"Enum config version {snapshot.key} loaded from {ENUM_CONFIG_PATH}")
+            _current = snapshot
+        return _current
+
+
+def current() -> EnumConfig:
+    """Snapshot in effect; checks the file for changes at most every ENUM_CONFIG_CHECK_S seconds."""
+    if time.monotonic() >= _next_check:
+        return reload()
+    return _current
@@ -0,0 +1,125 @@
+# app/services/idle_sessions.py
+"""
+Expire abandoned conversations so per-user state doesn't pile up in memory.
+
+An unfinished visit lives in user_data ("conv_state", plus "visit_batch" for a
+multi-visit note) with the whole raw transcript. sweep() drops:
+  - conversations idle longer than CONV_TTL_S, and
+  - the least recently active ones while all conversations together are over
+    CONV_MEMORY_BUDGET_KB.
+sweep() only touches memory, so it runs on the event loop; the bot then appends
+the drafts to the drafts journal with journal() in a worker thread, so nothing
+the user dictated is lost. The conversation itself ends on the user's next
+message, which finds no conv_state. Activity is stamped by touch() on every update; the bot sweeps every
+CONV_SWEEP_S.
+"""
+import os
+import sys
+import time
+import logging
+from typing import Dict, Any, List, Mapping, Optional, Tuple
+
+from app.services.local_store import save_draft
+
+logger = logging.getLogger(__name__)
+
+CONV_TTL_S = float(os.getenv("CONV_TTL_S", "3600"))
+CONV_MEMORY_BUDGET_KB = int(os.getenv("CONV_MEMORY_BUDGET_KB", "20480"))
+CONV_SWEEP_S = float(os.getenv("CONV_SWEEP_S", "60"))
+
+# Keys of user_data that make up an unfinished visit
+_SESSION_KEYS = ("conv_state", "visit_batch", "input_mode")
+# Object, dict and bookkeeping overhead per state, on top of its strings
+_STATE_OVERHEAD = 2048
+
+
+def touch(user_data: Dict[str, Any], chat_id: Optional[int]):
+    """Mark the user as active now (called for every update)."""
+    user_data["last_active"] = time.monotonic()
+    if chat_id is not None:
+        user_data["chat_id"] = chat_id
+
+
+def _states(user_data: Dict[str, Any]) -> List[Any]:
+    states = [user_data["conv_state"]] if user_data.get("conv_state") else []
+    batch = user_data.get("visit_batch")
+    if batch:
+        states.extend(batch["pending"])
+    return states
+
+
+def session_bytes(user_data: Dict[str, Any]) -> int:
+    """Rough memory held by the user's unfinished visit(s); 0 if there is none."""
+    batch = user_data.get("visit_batch")
+    rows = batch["rows"] if batch else []
+    total = 0
+    for values in [s.data.values() for s in _states(user_data)] + [r.values() for r in rows]:
+        total += _STATE_OVERHEAD + sum(sys.getsizeof(v) for v in values if isinstance(v, str))
+    return total
+
+
+def _draft(user_id: int, user_data: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    batch = user_data.get("visit_batch") or {}
+    current = user_data.get("conv_state")
+    return {
+        "reason": reason,
+        "user_id": user_id,
+        "chat_id": user_data.get("chat_id"),
+        "idle_s": round(time.monotonic() - user_data.get("last_active", time.monotonic())),
+        "state": current.current_state if current else None,
+        "current": current.data if current else None,
+        # Visits of a multi-visit note: answered ones (validated rows) and not yet reached ones
+        "completed": list(batch.get("rows", [])),
+        "pending": [s.data for s in batch.get("pending", [])],
+    }
+
+
+def evict(user_id: int, user_data: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    """Drop the unfinished visit from memory; returns its draft for journal()."""
+    draft = _draft(user_id, user_data, reason)
+    for key in _SESSION_KEYS:
+        user_data.pop(key, None)
+    return draft
+
+
+def journal(drafts: List[Dict[str, Any]]):
+    """Append evicted visits to the drafts journal (file I/O: run it off the event loop)."""
+    for draft in drafts:
+        try:
+            save_draft(draft)
+        except Exception as e:
+            # Memory is the bigger problem here; the draft is logged so it can still be recovered
+            logger.error(f"Draft of user {draft['user_id']} not journaled ({e}): {draft}")
+
+
+def sweep(all_user_data: Mapping[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Expire idle sessions, then evict least recently active ones until under budget.
+    Returns the drafts of the evicted sessions ("reason" is "ttl" or "memory") for
+    journal(). Their conversations end on the user's next message, as the bot's
+    handlers take a missing conv_state as END.
+    """
+    now = time.monotonic()
+    evicted = []
+    live = []
+    for user_id, user_data in list(all_user_data.items()):
+        if not user_data.get("conv_state") and not user_data.get("visit_batch"):
+            continue
+        last_active = user_data.get("last_active", now)
+        if now - last_active > CONV_TTL_S:
+            evicted.append(evict(user_id, user_data, "ttl"))
+        else:
+            live.append((last_active, user_id, user_data, session_bytes(user_data)))
+
+    budget = CONV_MEMORY_BUDGET_KB * 1024
+    used = sum(size for *_, size in live)
+    for last_active, user_id, user_data, size in sorted(live, key=lambda s: s[0]):
+        if used <= budget:
+            break
+        evicted.append(evict(user_id, user_data, "memory"))
+        used -= size
+
+    if evicted:
+        logger.info(f"Evicted {len(evicted)} abandoned conversations; "
+                    f"{len(live) - sum(d['reason'] == 'memory' for d in evicted)} active, ~{used // 1024} KB")
+    return evicted
@@ -5,35 +5,34 @@ import logging
 from datetime import datetime
 from typing import Dict, Any
 
-FAILED_SAVES_FILE = "failed_saves.json"
+# Journals are JSON Lines: one append per entry, streamed by /logs (log_export)
+FAILED_SAVES_FILE = "failed_saves.jsonl"
+LEGACY_FAILED_SAVES_FILE = "failed_saves.json"  # JSON array written by older versions; read-only now
+EVENTS_FILE = os.getenv("EVENTS_FILE", "events.jsonl")
 ANALYTICS_FILE = "analytics.json"
+DRAFTS_FILE = os.getenv("DRAFTS_FILE", "drafts.jsonl")
 
 logger = logging.getLogger(__name__)
 
+
+def _append(path: str, entry: Dict[str, Any]):
+    # "timestamp" goes first, so readers can filter by date without parsing the line
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"timestamp": datetime.now().isoformat(), **entry},
+                           ensure_ascii=False, default=str) + "\n")
+
 # --- FAILED SAVES (Plan Item 2) ---
 
 def save_failed_entry(data: Dict[str, Any], error: str):
-    """Save a failed row to a local JSON file for manual review."""
-    entry = {
-        "timestamp": datetime.now().isoformat(),
-        "error": str(error),
-        "data": data
-    }
-    
-    entries = []
-    if os.path.exists(FAILED_SAVES_FILE):
-        try:
-            with open(FAILED_SAVES_FILE, "r", encoding="utf-8") as f:
-                entries = json.load(f)
-        except json.JSONDecodeError:
-            entries = []
-            
-    entries.append(entry)
-    
-    with open(FAILED_SAVES_FILE, "w", encoding="utf-8") as f:
-        json.dump(entries, f, ensure_ascii=False, indent=2)
-    
-    logger.info(f"Saved failed entry locally. Total failed: {len(entries)}")
+    """Append a failed row to the failed saves journal for manual review."""
+    _append(FAILED_SAVES_FILE, {"error": str(error), "data": data})
+    logger.info(f"Saved failed entry locally to {FAILED_SAVES_FILE}")
+
+# --- DRAFTS (abandoned conversations) ---
+
+def save_draft(draft: Dict[str, Any]):
+    """Append the partial data of an expired conversation to the drafts journal (one JSON per line)."""
+    _append(DRAFTS_FILE, draft)
 
 # --- ANALYTICS (Plan Item 3) ---
 
@@ -41,7 +40,9 @@ def track_event(event_type: str, details: str = None):
     """
     Track events like 'validation_error', 'save_success', 'save_failure'.
     Structure: { "validation_error": { "count": 10, "details": ["error 1", "error 2"] } }
+    Every event is also appended to the events journal (EVENTS_FILE) for /logs.
     """
+    _append(EVENTS_FILE, {"event": event_type, "details": details})
     stats = {}
     if os.path.exists(ANALYTICS_FILE):
         try:
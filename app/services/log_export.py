@@ -0,0 +1,173 @@
+# app/services/log_export.py
+"""
+Filtered, compressed export of the local journals for /logs.
+
+Journals (local_store) are JSON Lines with "timestamp" as the first key, so a
+line's date is read from a fixed offset and only lines inside the date range
+are parsed. Matching lines are streamed unchanged into a zip archive with one
+member per journal; memory stays bounded by the "last N" window, not by the
+size of the files. The same pass counts entries per journal and per event type
+for the inline summary. The archive is capped at LOGS_EXPORT_MAX_MB of
+uncompressed lines so it always fits Telegram's upload limit.
+
+Filters (any order):
+    today | week | month | 2026-03-14 | 2026-03-01..2026-03-14   date range (default: week)
+    failed | drafts | events | <event type>                      journal or event, repeatable
+    200 | last=200                                               only the newest N entries per journal
+"""
+import os
+import json
+import zipfile
+import logging
+from collections import Counter, deque
+from datetime import date
+from typing import Dict, Any, Iterator, List, Optional
+
+from app.services.local_store import FAILED_SAVES_FILE, LEGACY_FAILED_SAVES_FILE, EVENTS_FILE, DRAFTS_FILE
+from app.services.reports import parse_period
+
+logger = logging.getLogger(__name__)
+
+LOGS_EXPORT_MAX_MB = float(os.getenv("LOGS_EXPORT_MAX_MB", "100"))
+
+# journal name -> files, oldest first
+JOURNALS = {
+    "failed": [LEGACY_FAILED_SAVES_FILE, FAILED_SAVES_FILE],
+    "drafts": [DRAFTS_FILE],
+    "events": [EVENTS_FILE],
+}
+
+_TS_PREFIX = '{"timestamp": "'
+_EVENT_KEY = '"event": "'
+
+
+def _is_period(token: str, today: Optional[date]) -> bool:
+    try:
+        parse_period(token, today)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_filters(args: List[str], today: Optional[date] = None) -> Dict[str, Any]:
+    """/logs arguments -> {"start", "end", "journals", "events", "last"}. ValueError on a bad period."""
+    filters = {"start": None, "end": None, "journals": set(), "events": set(), "last": None}
+    period = None
+    for arg in args:
+        token = arg.strip().lower()
+        if token.startswith("last="):
+            token = token[5:]
+        if token.isdigit():
+            filters["last"] = max(1, int(token))
+        elif token in JOURNALS:
+            filters["journals"].add(token)
+        elif _is_period(token, today):
+            period = token
+        elif token[:1].isdigit():
+            raise ValueError(f"bad date or range: {arg}")
+        else:
+            filters["events"].add(arg.strip())
+    filters["start"], filters["end"], _ = parse_period(period or "week", today)
+    if filters["events"] and not filters["journals"]:
+        filters["journals"].add("events")
+    return filters
+
+
+def _lines(path: str) -> Iterator[str]:
+    """Lines of a journal; a legacy JSON array is re-emitted as JSON Lines."""
+    if not os.path.exists(path):
+        return
+    if path.endswith(".json"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Skipping unreadable {path}: {e}")
+            return
+        for entry in entries:
+            yield json.dumps({"timestamp": entry.pop("timestamp", ""), **entry}, ensure_ascii=False) + "\n"
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from f
+
+
+def _line_date(line: str) -> str:
+    """YYYY-MM-DD of a journal line, without parsing it ("" if unknown)."""
+    if line.startswith(_TS_PREFIX):
+        return line[len(_TS_PREFIX):len(_TS_PREFIX) + 10]
+    try:
+        return str(json.loads(line).get("timestamp", ""))[:10]
+    except ValueError:
+        return ""
+
+
+def _line_event(line: str) -> str:
+    """Event type of an events journal line; the key right after the timestamp, so no full parse."""
+    i = line.find(_EVENT_KEY, 0, 120)
+    if i >= 0:
+        i += len(_EVENT_KEY)
+        return line[i:line.find('"', i)]
+    try:
+        return str(json.loads(line).get("event", "?"))
+    except ValueError:
+        return "?"
+
+
+def _matching(journal: str, filters: Dict[str, Any], counts: Counter) -> Iterator[str]:
+    start, end = filters["start"].isoformat(), filters["end"].isoformat()
+    for path in JOURNALS[journal]:
+        for line in _lines(path):
+            day = _line_date(line)
+            if not (start <= day <= end):
+                continue
+            if journal == "events":
+                event = _line_event(line)
+                if filters["events"] and event not in filters["events"]:
+                    continue
+                counts[event] += 1
+            yield line
+
+
+def export(filters: Dict[str, Any], archive_path: str) -> Dict[str, Any]:
+    """
+    Write the entries matching filters to a zip at archive_path (one .jsonl per journal).
+    Returns {"entries": {journal: n written}, "events": {event type: n in range}, "truncated", "bytes"}.
+    """
+    journals = sorted(filters["journals"]) or sorted(JOURNALS)
+    limit = int(LOGS_EXPORT_MAX_MB * 1024 * 1024)
+    written = 0
+    truncated = False
+    entries: Dict[str, int] = {}
+    events: Counter = Counter()
+    with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for journal in journals:
+            lines = _matching(journal, filters, events)
+            if filters["last"]:
+                lines = deque(lines, maxlen=filters["last"])
+            n = 0
+            with zf.open(f"{journal}.jsonl", "w", force_zip64=True) as out:
+                for line in lines:
+                    data = line.encode("utf-8")
+                    if written + len(data) > limit:
+                        truncated = True
+                        break
+                    out.write(data)
+                    written += len(data)
+                    n += 1
+            entries[journal] = n
+    return {"entries": entries, "events": dict(events.most_common()),
+            "truncated": truncated, "bytes": os.path.getsize(archive_path)}
+
+
+def format_summary(filters: Dict[str, Any], result: Dict[str, Any]) -> str:
+    period = (filters["start"].isoformat() if filters["start"] == filters["end"]
+              else f"{filters['start'].isoformat()}..{filters['end'].isoformat()}")
+    lines = [f"📂 Логи за {period}" + (f", последние {filters['last']}" if filters["last"] else "") + ":"]
+    for journal, n in result["entries"].items():
+        lines.append(f"  {journal}: {n}")
+    if result["events"]:
+        top = list(result["events"].items())[:10]
+        lines.append("События: " + ", ".join(f"{e} {n}" for e, n in top))
+    if result["truncated"]:
+        lines.append(f"⚠️ Обрезано до {LOGS_EXPORT_MAX_MB:.0f} МБ — сузь период или добавь last=N.")
+    return "\n".join(lines)
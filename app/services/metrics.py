@@ -0,0 +1,86 @@
+# app/services/metrics.py
+"""
+In-process stage latency metrics.
+
+Handlers wrap each pipeline stage in `timed("stt")` etc. Samples are kept in a
+bounded reservoir per stage so memory stays flat, and `summary()` reports
+count and p50/p95/p99 in milliseconds (used by the replay harness and /stats).
+Each timed stage is also a trace span (app.services.tracing) of the same name.
+"""
+import math
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any
+
+from app.services.tracing import span
+
+logger = logging.getLogger(__name__)
+
+RESERVOIR_SIZE = 2048
+
+_lock = threading.Lock()
+_samples: Dict[str, List[float]] = {}
+_counts: Dict[str, int] = {}
+
+
+def record(stage: str, seconds: float):
+    """Record one latency sample (seconds) for a stage."""
+    with _lock:
+        n = _counts.get(stage, 0) + 1
+        _counts[stage] = n
+        bucket = _samples.setdefault(stage, [])
+        if len(bucket) < RESERVOIR_SIZE:
+            bucket.append(seconds)
+        else:
+            # Reservoir sampling: every sample seen has equal chance to be kept
+            j = random.randrange(n)
+            if j < RESERVOIR_SIZE:
+                bucket[j] = seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block (works inside async handlers around awaits too). Yields its span."""
+    started = time.perf_counter()
+    try:
+        with span(stage) as s:
+            yield s
+    finally:
+        elapsed = time.perf_counter() - started
+        record(stage, elapsed)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("stage %s took %.1fms", stage, elapsed * 1000, extra={"fields": {
+                "stage": stage, "duration_ms": round(elapsed * 1000, 1)}})
+
+
+def percentile(sorted_vals: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..1) of an ascending list; 0.0 if empty. Shared by the tools' reports."""
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, math.ceil(q * len(sorted_vals)) - 1))
+    return sorted_vals[idx]
+
+
+def summary() -> Dict[str, Dict[str, Any]]:
+    """{stage: {"count", "p50_ms", "p95_ms", "p99_ms"}}"""
+    with _lock:
+        snapshot = {k: sorted(v) for k, v in _samples.items()}
+        counts = dict(_counts)
+    out = {}
+    for stage, vals in snapshot.items():
+        out[stage] = {
+            "count": counts.get(stage, 0),
+            "p50_ms": round(percentile(vals, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(vals, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(vals, 0.99) * 1000, 1),
+        }
+    return out
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _counts.clear()
@@ -0,0 +1,180 @@
+# app/services/profiler.py
+"""
+On-demand sampling profiler for live diagnosis (/profile).
+
+While a profile runs, a daemon thread reads sys._current_frames() every
+PROFILE_INTERVAL_MS and counts each thread's stack, so the asyncio loop
+(MainThread), the to_thread workers and the STT segment pool all show up,
+prefixed with their thread name. Nothing is instrumented: the profiled code
+runs unchanged, and with no profile running nothing here runs at all (the
+per-update hook is one None check).
+
+Results:
+  - collapsed stacks ("thread;outer;...;inner count" per line), the input of
+    flamegraph.pl, speedscope.app and most flame graph viewers;
+  - the top PROFILE_TOP_N allocation sites still alive at the end, from
+    tracemalloc, which is only tracing for the duration of the profile.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_S = float(os.getenv("PROFILE_MAX_S", "300"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "25"))
+# Deepest frames kept per stack (recursion and deep library stacks are cut at the root side)
+_MAX_DEPTH = 80
+_IDLE_FILES = ("selectors.py", "threading.py", "queue.py", "thread.py")
+
+
+class Profiler:
+    """One profiling run; start() once, wait on done (or time out), then stop()."""
+
+    def __init__(self, max_updates: Optional[int] = None):
+        self.max_updates = max_updates
+        self.updates = 0
+        self.done = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._own_tracemalloc = False
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self, me: int):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None and len(stack) < _MAX_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.stacks[tuple(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        me = threading.get_ident()
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            self._sample(me)
+
+    def start(self):
+        self._own_tracemalloc = not tracemalloc.is_tracing()
+        if self._own_tracemalloc:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def note_update(self, started: Optional[float] = None):
+        if started is not None and started < self.started:
+            return  # began before the profile (e.g. the /profile command itself)
+        self.updates += 1
+        if self.max_updates and self.updates >= self.max_updates:
+            self.done.set()
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop sampling; returns {"collapsed", "allocations", "top", "loop_busy", "samples", "seconds", "updates"}."""
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        return {
+            "collapsed": "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.stacks.most_common()),
+            "allocations": format_allocations(snapshot.statistics("lineno")[:PROFILE_TOP_N]),
+            "top": self.top_frames(),
+            "loop_busy": self.loop_busy(),
+            "samples": self.samples,
+            "seconds": self.elapsed,
+            "updates": self.updates,
+        }
+
+    def top_frames(self, n: int = 10) -> List[Tuple[str, float]]:
+        """(frame, share of busy samples) of the innermost frames outside idle waits, most frequent first."""
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if not _is_idle(stack):
+                own[stack[-1]] += count
+        total = sum(own.values()) or 1
+        return [(frame, count / total) for frame, count in own.most_common(n)]
+
+    def loop_busy(self) -> Optional[float]:
+        """Share of samples the asyncio loop (MainThread) was running code rather than waiting."""
+        main = [(stack, n) for stack, n in self.stacks.items() if stack[0] == "MainThread"]
+        total = sum(n for _, n in main)
+        if not total:
+            return None
+        return sum(n for stack, n in main if not _is_idle(stack)) / total
+
+
+def _is_idle(stack: Tuple[str, ...]) -> bool:
+    # Innermost Python frame of a thread blocked in select/epoll, a lock, a condition or a queue
+    return any(f"({name}:" in stack[-1] for name in _IDLE_FILES)
+
+
+def format_allocations(stats) -> str:
+    lines = [f"{'size KB':>10} {'blocks':>8}  site"]
+    for stat in stats:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:>10.1f} {stat.count:>8}  {frame.filename}:{frame.lineno}")
+    return "\n".join(lines) + "\n"
+
+
+_active: Optional[Profiler] = None
+_active_lock = threading.Lock()
+
+
+def start(max_updates: Optional[int] = None) -> Optional[Profiler]:
+    """Start a profile, or None if one is already running."""
+    global _active
+    with _active_lock:
+        if _active is not None:
+            return None
+        profiler = _active = Profiler(max_updates)
+    profiler.start()
+    logger.info(f"Profiling started ({f'{max_updates} updates' if max_updates else 'timed'}, "
+                f"every {PROFILE_INTERVAL_MS:.0f}ms)")
+    return profiler
+
+
+def finish(profiler: Profiler) -> Dict[str, Any]:
+    global _active
+    try:
+        return profiler.stop()
+    finally:
+        with _active_lock:
+            _active = None
+        logger.info(f"Profiling stopped: {profiler.samples} samples in {profiler.elapsed:.1f}s")
+
+
+def note_update(started: Optional[float] = None):
+    """
+    Per-update hook, called by the update processor once an update's handlers are
+    done; counts updates for '/profile N updates' runs. started: perf_counter() when
+    the update began, so updates already running when the profile started don't count.
+    """
+    profiler = _active
+    if profiler is not None:
+        profiler.note_update(started)
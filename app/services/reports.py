@@ -0,0 +1,134 @@
+# app/services/reports.py
+"""
+Shop analytics for /report and the daily digest.
+
+Everything is computed with SQL aggregates over the daily rollup tables in
+the visit store (one row per shop/day, plus per-day source/reason counts),
+so a report costs the same few milliseconds for a week or for years of history.
+"""
+from datetime import date, timedelta
+from typing import Dict, Any, Optional, Tuple, List
+
+from app.services.visit_store import query
+
+TOP_N = 3
+
+_PERIOD_ALIASES = {
+    "today": "today", "сегодня": "today", "day": "today", "день": "today",
+    "yesterday": "yesterday", "вчера": "yesterday",
+    "week": "week", "неделя": "week", "7d": "week",
+    "month": "month", "месяц": "month", "30d": "month",
+}
+
+
+def parse_period(arg: Optional[str], today: Optional[date] = None) -> Tuple[date, date, str]:
+    """
+    '/report [period]' argument -> (start, end, group) with group 'day' or 'week'.
+    Accepts today/yesterday/week/month (and Russian aliases), a date 2026-03-14
+    or a range 2026-03-01..2026-03-14. Raises ValueError on anything else.
+    """
+    today = today or date.today()
+    key = _PERIOD_ALIASES.get((arg or "today").strip().lower())
+    if key == "today":
+        return today, today, "day"
+    if key == "yesterday":
+        y = today - timedelta(days=1)
+        return y, y, "day"
+    if key == "week":
+        return today - timedelta(days=6), today, "day"
+    if key == "month":
+        return today - timedelta(days=29), today, "week"
+    if arg and ".." in arg:
+        a, b = arg.split("..", 1)
+        start, end = date.fromisoformat(a.strip()), date.fromisoformat(b.strip())
+    else:
+        start = end = date.fromisoformat(arg.strip())
+    if end < start:
+        start, end = end, start
+    return start, end, "day" if (end - start).days < 14 else "week"
+
+
+def _bucket_expr(group: str) -> str:
+    # ISO-ish week bucket: the Monday of the row's week
+    if group == "week":
+        return "date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days')"
+    return "date"
+
+
+def _metrics(visits, purchases, revenue, margin, margin_n) -> Dict[str, Any]:
+    return {
+        "visits": visits or 0,
+        "purchases": purchases or 0,
+        "conversion": (purchases / visits) if visits else 0.0,
+        "avg_ticket": (revenue / purchases) if purchases else 0.0,
+        "revenue": revenue or 0.0,
+        "margin": margin or 0.0,
+        "margin_known": margin_n or 0,
+    }
+
+
+def build_report(shop: str, start: date, end: date, group: str = "day") -> Dict[str, Any]:
+    """Totals, per-day/week buckets, top reasons for not buying and best sources."""
+    params = (shop, start.isoformat(), end.isoformat())
+    where = "shop = ? AND date BETWEEN ? AND ?"
+
+    total = query(
+        f"SELECT SUM(visits), SUM(purchases), SUM(revenue), SUM(margin), SUM(margin_n) "
+        f"FROM daily_rollup WHERE {where}", params,
+    )[0]
+    buckets = query(
+        f"SELECT {_bucket_expr(group)} AS bucket, SUM(visits), SUM(purchases), SUM(revenue), "
+        f"SUM(margin), SUM(margin_n) FROM daily_rollup WHERE {where} GROUP BY bucket ORDER BY bucket",
+        params,
+    )
+    reasons = query(
+        f"SELECT value, SUM(visits) AS n FROM daily_dim WHERE {where} AND dim = 'reason' "
+        f"GROUP BY value ORDER BY n DESC LIMIT {TOP_N}", params,
+    )
+    sources = query(
+        f"SELECT value, SUM(visits), SUM(purchases) AS p, SUM(revenue) AS r FROM daily_dim "
+        f"WHERE {where} AND dim = 'source' GROUP BY value ORDER BY p DESC, r DESC LIMIT {TOP_N}", params,
+    )
+
+    return {
+        "shop": shop,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "group": group,
+        "total": _metrics(*total),
+        "buckets": [{"bucket": b[0], **_metrics(*b[1:])} for b in buckets],
+        "top_reasons": [(r[0], r[1]) for r in reasons],
+        "top_sources": [{"source": s[0], "visits": s[1], "purchases": s[2], "revenue": s[3]} for s in sources],
+    }
+
+
+def _money(v: float) -> str:
+    return f"{v:,.0f}".replace(",", " ")
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    t = report["total"]
+    period = report["start"] if report["start"] == report["end"] else f"{report['start']} — {report['end']}"
+    lines: List[str] = [
+        f"📊 Отчёт {report['shop']}: {period}",
+        "",
+        f"Визиты: {t['visits']} | Покупки: {t['purchases']} | Конверсия: {t['conversion']:.0%}",
+        f"Выручка: {_money(t['revenue'])} ₸ | Средний чек: {_money(t['avg_ticket'])} ₸",
+        f"Маржа: {_money(t['margin'])} ₸ (по {t['margin_known']} чекам с себестоимостью)",
+    ]
+    if t["visits"] == 0:
+        return "\n".join(lines[:1] + ["", "Визитов за период нет."])
+
+    if report["top_reasons"]:
+        lines += ["", "Почему не купили:"]
+        lines += [f"• {reason} — {n}" for reason, n in report["top_reasons"]]
+    if report["top_sources"]:
+        lines += ["", "Лучшие источники:"]
+        lines += [f"• {s['source']} — {s['purchases']} покупок из {s['visits']}, {_money(s['revenue'])} ₸"
+                  for s in report["top_sources"]]
+    if len(report["buckets"]) > 1:
+        label = "По неделям" if report["group"] == "week" else "По дням"
+        lines += ["", f"{label}:"]
+        lines += [f"{b['bucket']}: {b['visits']} виз., {b['purchases']} пок., {b['conversion']:.0%}, "
+                  f"{_money(b['revenue'])} ₸" for b in report["buckets"]]
+    return "\n".join(lines)
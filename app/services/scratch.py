@@ -0,0 +1,132 @@
+# app/services/scratch.py
+"""
+Managed scratch space for audio that has to touch the disk.
+
+Short voice notes never get here: the bot downloads them into memory and
+hands the buffer to STT. Bigger files (or ones whose size Telegram doesn't
+report) get a private directory under SCRATCH_DIR via `scratch_dir()`, which
+is removed when the block exits, whether or not transcription succeeded.
+A disk quota is checked before every new directory, and leftovers from a
+crashed process are swept at startup by `cleanup_stale()`.
+"""
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_DIR = os.getenv("SCRATCH_DIR") or os.path.join(tempfile.gettempdir(), "traffic-bot-scratch")
+SCRATCH_QUOTA_MB = float(os.getenv("SCRATCH_QUOTA_MB", "512"))
+# Directories older than this are treated as leftovers of a dead process
+SCRATCH_MAX_AGE = float(os.getenv("SCRATCH_MAX_AGE", "3600"))
+# Voice notes up to this size are downloaded into memory instead of a file
+AUDIO_IN_MEMORY_MAX_BYTES = int(os.getenv("AUDIO_IN_MEMORY_MAX_KB", "2048")) * 1024
+
+
+class ScratchQuotaExceeded(RuntimeError):
+    pass
+
+
+_lock = threading.Lock()
+_stats = {
+    "in_memory": 0,         # notes handled without touching the disk
+    "spilled": 0,           # notes that needed a scratch directory
+    "active_dirs": 0,
+    "dirs_removed": 0,
+    "stale_removed": 0,
+    "quota_rejections": 0,
+    "peak_bytes": 0,
+}
+
+
+def _count(key: str, n: int = 1):
+    with _lock:
+        _stats[key] += n
+
+
+def count_in_memory():
+    _count("in_memory")
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed concurrently
+    return total
+
+
+def usage_bytes() -> int:
+    """Bytes currently used under SCRATCH_DIR."""
+    return _dir_size(SCRATCH_DIR) if os.path.isdir(SCRATCH_DIR) else 0
+
+
+def cleanup_stale(max_age: float = SCRATCH_MAX_AGE) -> int:
+    """Remove scratch directories older than max_age seconds. Returns how many were removed."""
+    if not os.path.isdir(SCRATCH_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(SCRATCH_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        _count("stale_removed", removed)
+        logger.info(f"Removed {removed} stale scratch entries from {SCRATCH_DIR}")
+    return removed
+
+
+@contextmanager
+def scratch_dir(prefix: str = "note-"):
+    """
+    Yield a fresh private directory; it and everything in it is deleted on exit.
+    Raises ScratchQuotaExceeded if SCRATCH_DIR is already over SCRATCH_QUOTA_MB
+    (after sweeping stale leftovers once).
+    """
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    quota = SCRATCH_QUOTA_MB * 1024 * 1024
+    used = usage_bytes()
+    if used >= quota and cleanup_stale():
+        used = usage_bytes()
+    if used >= quota:
+        _count("quota_rejections")
+        raise ScratchQuotaExceeded(
+            f"Scratch space full: {used / 1048576:.0f} MB used of {SCRATCH_QUOTA_MB:.0f} MB in {SCRATCH_DIR}"
+        )
+
+    path = tempfile.mkdtemp(prefix=prefix, dir=SCRATCH_DIR)
+    with _lock:
+        _stats["spilled"] += 1
+        _stats["active_dirs"] += 1
+    try:
+        yield path
+    finally:
+        size = _dir_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        with _lock:
+            _stats["active_dirs"] -= 1
+            _stats["dirs_removed"] += 1
+            _stats["peak_bytes"] = max(_stats["peak_bytes"], used + size)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_stats)
+    out["usage_bytes"] = usage_bytes()
+    out["quota_bytes"] = int(SCRATCH_QUOTA_MB * 1024 * 1024)
+    return out
@@ -1,51 +1,324 @@
 # app/services/sheets.py
+"""
+Google Sheets writes, sharded per shop.
+
+Every shop (see app.services.shops) gets its own SheetShard: a cached
+worksheet handle and a write lock of its own, so a slow or busy shop never
+blocks another shop's writes. The per-shop write buffer is the shop's pending
+rows in the local visit store, pushed in batches by app.services.sync.
+All shards draw from one QuotaBudget, so the service account stays under the
+Sheets write quota as a whole.
+
+Every worksheet needs a "Visit_key" header column: it holds each row's
+idempotency key, which sync uses to tell whether an append that raised had
+landed anyway. A shard adds the column after the last header cell the first
+time it opens a worksheet without one; if it can't (no edit rights, a
+protected header row), retried rows of that shop are not re-appended until the
+column exists.
+"""
 import os
-import gspread
-from google.oauth2.service_account import Credentials
-from datetime import datetime
+import re
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
 from app.services.validator import SHEET_COLUMNS
+from app.services.shops import list_shops, get_shop, resolve_shop
+from app.services.tracing import span, set_attribute
+from app.services.breaker import get_breaker
+from app.services.deadline import DeadlineExceeded, sleep_within
+
+# gspread / google-auth / requests are imported lazily in _get_client():
+# they cost noticeable startup time and are only needed once the first row is saved.
+
+logger = logging.getLogger(__name__)
 
 SHEET_NAME = os.getenv("SPREADSHEET_NAME", "Anuar Traffic 2026")
 CREDS_JSON = os.getenv("GOOGLE_CREDENTIALS_JSON", "./credentials.json")
 
-def get_sheet():
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file(CREDS_JSON, scopes=scopes)
-    gc = gspread.authorize(creds)
-    sh = gc.open(SHEET_NAME)
+# Optional local stand-in for the Google APIs (replay harness / load tests).
+# When set, requests go unauthenticated to this base URL instead of googleapis.com.
+SHEETS_API_BASE_URL = os.getenv("SHEETS_API_BASE_URL")
+
+# Google's default limit is 60 write requests per minute per user (service account)
+SHEETS_WRITES_PER_MINUTE = int(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+
+# Sheet column holding each row's idempotency key (see visit_store.make_visit_key)
+VISIT_KEY_COLUMN = "Visit_key"
+
+# "'Offline Traffic'!A10:P12" -> 10
+_RANGE_START_RE = re.compile(r"![A-Z]+(\d+)")
+
+
+def _redirecting_session(base_url: str):
+    """requests.Session that rewrites https://*.googleapis.com/... to base_url/... before sending."""
+    import requests
+
+    class _RedirectAdapter(requests.adapters.HTTPAdapter):
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            request.url = base_url.rstrip("/") + parts.path + (f"?{parts.query}" if parts.query else "")
+            return super().send(request, **kwargs)
+
+    session = requests.Session()
+    adapter = _RedirectAdapter()
+    session.mount("https://sheets.googleapis.com", adapter)
+    session.mount("https://www.googleapis.com", adapter)
+    return session
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    """Shared authorized gspread client (one token refresh for all shards)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import gspread
+            if SHEETS_API_BASE_URL:
+                _client = gspread.Client(None, session=_redirecting_session(SHEETS_API_BASE_URL))
+            else:
+                from google.oauth2.service_account import Credentials
+                scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+                creds = Credentials.from_service_account_file(CREDS_JSON, scopes=scopes)
+                _client = gspread.authorize(creds)
+        return _client
+
+
+def get_sheet(spreadsheet: Optional[str] = None):
+    gc = _get_client()
+    sh = gc.open(spreadsheet or SHEET_NAME)
     return sh
 
-def append_offline_row(row_dict: dict):
-    """
-    row_dict keys:
-    Date, Time, Client_ID, Type_of_client, Behavior, Purchase_status, Ticket_amount, Cost_Price, Source, 
-    Reason_not_buying, Product_name, Quantity, Transcription_raw, Repeat_visit, Contact_left, Short_note
-    """
-    sh = get_sheet()
-    ws = sh.worksheet("Offline Traffic")
-    
-    # Read actual header row from the sheet to get the correct column order
-    header_row = ws.row_values(1)
-    
-    # Map values according to actual sheet column order
+
+def _row_values(header_row: List[str], row_dict: Dict[str, Any]) -> List[Any]:
+    """Map row_dict onto the sheet's actual column order."""
     values = []
+    lowered = {key.lower(): key for key in row_dict}
     for col_name in header_row:
         # Normalize column name (strip whitespace, handle case variations)
         col_name_normalized = col_name.strip()
-        # Try exact match first
+        # Try exact match first, then case-insensitive; missing columns stay empty
         if col_name_normalized in row_dict:
             values.append(row_dict[col_name_normalized])
+        elif col_name_normalized.lower() in lowered:
+            values.append(row_dict[lowered[col_name_normalized.lower()]])
         else:
-            # Try case-insensitive match
-            found = False
-            for key in row_dict.keys():
-                if key.lower() == col_name_normalized.lower():
-                    values.append(row_dict[key])
-                    found = True
-                    break
-            if not found:
-                # Column not found in row_dict, append empty string
-                values.append("")
-    
-    ws.append_row(values, value_input_option="USER_ENTERED")
-    return True
\ No newline at end of file
+            values.append("")
+    return values
+
+
+# ============================================================================
+# QUOTA
+# ============================================================================
+
+class QuotaBudget:
+    """Token bucket shared by all shards: at most `per_minute` write calls per minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one write call is allowed; DeadlineExceeded if that would outlast the update's deadline."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if waited:
+                        set_attribute("quota_wait_ms", round(waited * 1000, 1))
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if not sleep_within(wait):
+                raise DeadlineExceeded("sheets_quota")
+            waited += wait
+
+
+_quota = QuotaBudget(SHEETS_WRITES_PER_MINUTE)
+
+
+# ============================================================================
+# SHARDS
+# ============================================================================
+
+class SheetShard:
+    """One shop's worksheet: cached handle and its own write lock."""
+
+    def __init__(self, name: str, spreadsheet: str, worksheet: str):
+        self.name = name
+        self.spreadsheet = spreadsheet
+        self.worksheet = worksheet
+        self._handle: Optional[Tuple[Any, List[str]]] = None
+        self._handle_lock = threading.Lock()
+        # Serializes writes (and sync passes) of this shop only; other shops write in parallel
+        self.write_lock = threading.RLock()
+        # Per shop too: one shop's broken sheet or lost permission must not fast-fail the others
+        self.breaker = get_breaker(f"sheets:{name}")
+
+    def get_worksheet(self) -> Tuple[Any, List[str]]:
+        """
+        Return cached (worksheet, header_row). The first call opens the spreadsheet and
+        reads the header; later writes reuse both instead of extra API round trips per row.
+        """
+        with self._handle_lock:
+            set_attribute("worksheet_cached", self._handle is not None)
+            if self._handle is None:
+                ws = get_sheet(self.spreadsheet).worksheet(self.worksheet)
+                # Read actual header row from the sheet to get the correct column order
+                header_row = ws.row_values(1)
+                if header_row and VISIT_KEY_COLUMN not in (h.strip() for h in header_row):
+                    header_row = self._add_key_column(ws, header_row)
+                self._handle = (ws, header_row)
+            return self._handle
+
+    def _add_key_column(self, ws, header_row: List[str]) -> List[str]:
+        """Append the Visit_key header cell; the header as it is now (unchanged if that failed)."""
+        from gspread.utils import rowcol_to_a1
+
+        col = len(header_row) + 1
+        try:
+            if ws.col_count < col:
+                ws.add_cols(col - ws.col_count)
+            _quota.acquire()
+            ws.batch_update([{"range": rowcol_to_a1(1, col), "values": [[VISIT_KEY_COLUMN]]}])
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Shop {self.name}: worksheet '{self.worksheet}' has no {VISIT_KEY_COLUMN} column "
+                         f"and adding it failed ({e}); failed appends will not be retried until it exists")
+            return header_row
+        logger.warning(f"Shop {self.name}: added the {VISIT_KEY_COLUMN} column to worksheet '{self.worksheet}'")
+        return header_row + [VISIT_KEY_COLUMN]
+
+    def has_key_column(self) -> bool:
+        _ws, header_row = self.get_worksheet()
+        return VISIT_KEY_COLUMN in (h.strip() for h in header_row)
+
+    def reset(self):
+        """Forget the cached handle (e.g. after a failed write or a header change in the sheet)."""
+        with self._handle_lock:
+            self._handle = None
+
+    def append_rows(self, rows: List[Dict[str, Any]],
+                    before_send: Optional[Callable[[], None]] = None) -> Optional[int]:
+        """
+        Append rows in one API call. Returns the sheet row number of the first one (if reported).
+        before_send is called right before the request goes out, once the breaker, the
+        worksheet and the quota let it (the point from which the rows may land even if it errors).
+        """
+        with self.write_lock, span("sheets.append_rows", shop=self.name, rows=len(rows)):
+            self.breaker.check()
+            try:
+                ws, header_row = self.get_worksheet()
+                _quota.acquire()
+                values = [_row_values(header_row, r) for r in rows]
+                if before_send is not None:
+                    before_send()
+                resp = ws.append_rows(values, value_input_option="USER_ENTERED")
+            except DeadlineExceeded:
+                raise  # out of time waiting for quota, not a Sheets failure
+            except Exception:
+                # Token/handle may be stale; reopen on the next attempt
+                self.breaker.record_failure()
+                self.reset()
+                raise
+            self.breaker.record_success()
+        m = _RANGE_START_RE.search(((resp or {}).get("updates") or {}).get("updatedRange", ""))
+        return int(m.group(1)) if m else None
+
+    def find_keys(self, keys: List[str]) -> Dict[str, int]:
+        """
+        {visit key: sheet row} for the keys already present in the sheet's Visit_key column.
+        Empty if the sheet has no such column (nothing to check against). One read call.
+        """
+        keys = set(k for k in keys if k)
+        if not keys:
+            return {}
+        with span("sheets.find_keys", shop=self.name, keys=len(keys)):
+            self.breaker.check()
+            try:
+                ws, header_row = self.get_worksheet()
+                stripped = [h.strip() for h in header_row]
+                column = (ws.col_values(stripped.index(VISIT_KEY_COLUMN) + 1)
+                          if VISIT_KEY_COLUMN in stripped else [])
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                self.reset()
+                raise
+            self.breaker.record_success()
+        return {value: i + 1 for i, value in enumerate(column) if value in keys}
+
+    def update_rows(self, rows_by_sheet_row: Dict[int, Dict[str, Any]]):
+        """Overwrite already written rows in place, in one batch call."""
+        if not rows_by_sheet_row:
+            return
+        with self.write_lock, span("sheets.update_rows", shop=self.name, rows=len(rows_by_sheet_row)):
+            self.breaker.check()
+            try:
+                ws, header_row = self.get_worksheet()
+                _quota.acquire()
+                ws.batch_update(
+                    [{"range": f"A{n}", "values": [_row_values(header_row, r)]}
+                     for n, r in rows_by_sheet_row.items()],
+                    value_input_option="USER_ENTERED",
+                )
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                self.reset()
+                raise
+            self.breaker.record_success()
+
+
+_shards: Dict[str, SheetShard] = {}
+_shards_lock = threading.Lock()
+
+
+def get_shard(shop: Optional[str] = None) -> SheetShard:
+    """Shard for a shop name (None = the configured default shop)."""
+    if shop is None:
+        shop = resolve_shop(None, None)
+    with _shards_lock:
+        shard = _shards.get(shop)
+        if shard is None:
+            cfg = get_shop(shop)
+            shard = _shards[shop] = SheetShard(shop, cfg["spreadsheet"], cfg["worksheet"])
+        return shard
+
+
+def get_worksheet(shop: Optional[str] = None):
+    """Cached (worksheet, header_row) of a shop's shard."""
+    return get_shard(shop).get_worksheet()
+
+
+def warm_up():
+    """Open every shop's worksheet ahead of the first save (called in the background at startup)."""
+    for shop in list_shops():
+        get_shard(shop).get_worksheet()
+
+
+def append_offline_row(row_dict: dict, shop: Optional[str] = None):
+    """
+    Write one row straight to the shop's worksheet (bypassing the local store).
+    The bot saves through app.services.sync; this stays for one-off/manual writes.
+
+    row_dict keys:
+    Date, Time, Client_ID, Type_of_client, Behavior, Purchase_status, Ticket_amount, Cost_Price, Source,
+    Reason_not_buying, Product_name, Quantity, Transcription_raw, Repeat_visit, Contact_left, Short_note
+    """
+    get_shard(shop).append_rows([row_dict])
+    return True
@@ -0,0 +1,129 @@
+# app/services/shops.py
+"""
+Shop routing: which spreadsheet/worksheet a chat or user writes to.
+
+One bot can serve several wallpaper shops. Shops are described in a JSON file
+(SHOPS_CONFIG, default ./shops.json):
+
+    {
+      "default": "center",
+      "shops": {
+        "center": {"spreadsheet": "Anuar Traffic 2026", "worksheet": "Offline Traffic",
+                   "chats": [], "users": [111]},
+        "mega":   {"spreadsheet": "Anuar Mega 2026", "worksheet": "Offline Traffic",
+                   "chats": [-1001234567890], "users": [222, 333]}
+      }
+    }
+
+Without the file there is a single "default" shop built from SPREADSHEET_NAME,
+so existing single-shop deployments behave exactly as before. Assignments made
+at runtime with /shop are kept in SHOP_ASSIGNMENTS_FILE and win over the config.
+A user can only /shop themselves into a shop whose "users" list has them;
+anything else takes the admin (ADMIN_CHAT_ID).
+"""
+import os
+import json
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+SHOPS_CONFIG = os.getenv("SHOPS_CONFIG", "shops.json")
+SHOP_ASSIGNMENTS_FILE = "shop_assignments.json"
+DEFAULT_SHOP = "default"
+
+_lock = threading.Lock()
+_config: Optional[Dict[str, Any]] = None
+_assignments: Optional[Dict[str, str]] = None
+
+
+def _load_config() -> Dict[str, Any]:
+    global _config
+    if _config is not None:
+        return _config
+    if os.path.exists(SHOPS_CONFIG):
+        with open(SHOPS_CONFIG, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        shops = cfg.get("shops") or {}
+        if not shops:
+            raise RuntimeError(f"{SHOPS_CONFIG} has no shops")
+        default = cfg.get("default") or next(iter(shops))
+        if default not in shops:
+            raise RuntimeError(f"{SHOPS_CONFIG}: default shop '{default}' is not defined")
+    else:
+        shops = {DEFAULT_SHOP: {}}
+        default = DEFAULT_SHOP
+    # Fill per-shop defaults from the single-shop env settings
+    for shop in shops.values():
+        shop.setdefault("spreadsheet", os.getenv("SPREADSHEET_NAME", "Anuar Traffic 2026"))
+        shop.setdefault("worksheet", "Offline Traffic")
+        shop["chats"] = [int(c) for c in shop.get("chats", [])]
+        shop["users"] = [int(u) for u in shop.get("users", [])]
+    _config = {"default": default, "shops": shops}
+    logger.info(f"Shops loaded: {', '.join(shops)} (default: {default})")
+    return _config
+
+
+def _load_assignments() -> Dict[str, str]:
+    global _assignments
+    if _assignments is None:
+        _assignments = {}
+        if os.path.exists(SHOP_ASSIGNMENTS_FILE):
+            try:
+                with open(SHOP_ASSIGNMENTS_FILE, "r", encoding="utf-8") as f:
+                    _assignments = json.load(f)
+            except json.JSONDecodeError:
+                _assignments = {}
+    return _assignments
+
+
+def list_shops() -> Dict[str, Dict[str, Any]]:
+    """name -> {"spreadsheet", "worksheet", "chats", "users"}"""
+    with _lock:
+        return _load_config()["shops"]
+
+
+def get_shop(name: str) -> Dict[str, Any]:
+    shops = list_shops()
+    if name not in shops:
+        raise KeyError(f"Unknown shop: {name}")
+    return shops[name]
+
+
+def resolve_shop(chat_id: Optional[int], user_id: Optional[int]) -> str:
+    """
+    Shop for a message: runtime /shop assignment of the user, then the config's
+    "users" and "chats" lists, then the default shop.
+    """
+    with _lock:
+        cfg = _load_config()
+        shop = _load_assignments().get(f"user:{user_id}")
+        if shop in cfg["shops"]:
+            return shop
+        for name, shop in cfg["shops"].items():
+            if user_id is not None and user_id in shop["users"]:
+                return name
+        for name, shop in cfg["shops"].items():
+            if chat_id is not None and chat_id in shop["chats"]:
+                return name
+        return cfg["default"]
+
+
+def assign_shop(user_id: int, shop: str, by_admin: bool = False):
+    """
+    Persist a per-user assignment (used by /shop <name>). KeyError for an unknown shop;
+    PermissionError unless the user is on the shop's allow-list or an admin does it.
+    """
+    with _lock:
+        cfg = _load_config()["shops"].get(shop)
+        if cfg is None:
+            raise KeyError(f"Unknown shop: {shop}")
+        if not by_admin and user_id not in cfg["users"]:
+            raise PermissionError(f"User {user_id} is not allowed to write to shop {shop}")
+        assignments = _load_assignments()
+        assignments[f"user:{user_id}"] = shop
+        tmp = SHOP_ASSIGNMENTS_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(assignments, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, SHOP_ASSIGNMENTS_FILE)
@@ -1,136 +1,538 @@
 # app/services/stt.py
-import chunk
 import os
-import wave
 import json
-from pydub import AudioSegment
-from typing import Optional
+import shutil
+import logging
+import tempfile
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Union, BinaryIO
 
+from app.services.metrics import percentile
+from app.services.tracing import span, set_attribute
+from app.services.deadline import DeadlineExceeded, current as current_deadline
+
+# pydub and vosk are imported inside the functions that use them, so importing
+# this module (and app.bot) stays cheap; warm_up() pays for them in the background.
+
+logger = logging.getLogger(__name__)
+
+# Engine used by transcribe(): any name registered with register_backend ("vosk", "whisper")
 STT_BACKEND = os.getenv("STT_BACKEND", "vosk")
+# Write every decoded note to debug_last.wav in the CWD (for ear-checking the conversion)
+STT_DEBUG_WAV = os.getenv("STT_DEBUG_WAV", "0") == "1"
+# With LOG_LEVEL=DEBUG, log the partial hypothesis of every N-th audio chunk
+STT_LOG_EVERY = int(os.getenv("STT_LOG_EVERY", "25"))
+# Vosk notes at least this long are split at pauses and the pieces decoded in parallel
+STT_PARALLEL_MIN_S = float(os.getenv("STT_PARALLEL_MIN_S", "30"))
+# Target piece length; the actual cut is the longest pause within +-STT_CUT_WINDOW_S of it
+STT_SEGMENT_S = float(os.getenv("STT_SEGMENT_S", "20"))
+STT_CUT_WINDOW_S = float(os.getenv("STT_CUT_WINDOW_S", "5"))
+# Recognizers running at once across all notes (shared pool, one model)
+STT_SEGMENT_WORKERS = int(os.getenv("STT_SEGMENT_WORKERS", str(os.cpu_count() or 1)))
+# Decoder: ffmpeg binary (pydub's converter setting is honoured too) and its hard time limit
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+STT_DECODE_TIMEOUT_S = float(os.getenv("STT_DECODE_TIMEOUT_S", "60"))
 
 # Default path to bundled Vosk model (can be overridden via env)
 BASE_DIR = os.path.dirname(__file__)
 DEFAULT_VOSK_MODEL_PATH = os.path.join(BASE_DIR, "models", "vosk-model-small-ru-0.22")
 
-# ---- VOSK offline backend ----
-def vosk_transcribe(filepath: str, model_path: Optional[str] = None) -> str:
-    """
-    filepath: path to audio file (ogg/oga/ogg/opus/etc). We'll convert to wav 16k mono.
-    model_path: local vosk model directory (you must download manually or use bundled one).
-    """
+# Loaded Vosk models keyed by path. Loading the small RU model takes seconds,
+# so every caller in the process (bot thread pool, batch workers) shares one.
+_vosk_models = {}
+_vosk_models_lock = threading.Lock()
+
+
+def load_vosk_model(model_path: Optional[str] = None):
+    """Return a cached vosk.Model for model_path, loading it on first use."""
     if model_path is None:
         model_path = DEFAULT_VOSK_MODEL_PATH
-    try:
-        from vosk import Model, KaldiRecognizer
-    except Exception as e:
-        raise RuntimeError("Vosk not installed or import failed: " + str(e))
-
-    # convert to wav 16k mono
-    try: 
-        sound = AudioSegment.from_file(filepath)
-        print("DEBUG: original: channels=", sound.channels, "frame_rate=", sound.frame_rate, "duration_s=", len(sound)/1000.0, "sample_width=", sound.sample_width)
-    except Exception as e:
-        raise RuntimeError("pydub failed to read input: " + str(e))
+    with _vosk_models_lock:
+        model = _vosk_models.get(model_path)
+        set_attribute("model_cache_hit", model is not None)
+        if model is not None:
+            return model
+        try:
+            from vosk import Model
+        except Exception as e:
+            raise RuntimeError("Vosk not installed or import failed: " + str(e))
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Vosk model not found at {model_path}. Download and extract it there.")
+        logger.debug("Loading Vosk model from %s", model_path)
+        model = Model(model_path)
+        _vosk_models[model_path] = model
+        return model
 
-    sound = sound.set_frame_rate(16000).set_channels(1).set_sample_width(2)
 
-    wav_path = filepath + ".conv.wav"
-    debug_copy = os.path.join(os.getcwd(), "debug_last.wav")
-    
-    try:
-        sound.export(wav_path, format="wav")
-        sound.export(debug_copy, format="wav")
-    except Exception as e:
-        raise RuntimeError("Failed to export wav: " + str(e))
+# ---- VOSK offline backend ----
+# A path, or a file object (BytesIO of an in-memory download)
+AudioSource = Union[str, BinaryIO]
 
+SAMPLE_RATE = 16000
+# Bytes fed to the recognizer per call: 4000 frames of 16-bit mono
+CHUNK_BYTES = 4000 * 2
 
-    try:
-        wf = wave.open(wav_path, "rb")
-        params = (wf.getnchannels(), wf.getsampwidth(), wf.getframerate(), wf.getnframes())
-        duration = wf.getnframes() / wf.getframerate() if wf.getframerate() else 0
-        print(f"DEBUG: converted wav: channels={params[0]}, sampwidth={params[1]}, framerate={params[2]}, nframes={params[3]}, duration_s={duration:.3f}")
-    except Exception as e:
-        raise RuntimeError("Failed to open converted wav: " + str(e))  
 
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Vosk model not found at {model_path}. Download and extract it there.")
-    print("DEBUG: Using Vosk model at", model_path)
+def _recognize(pcm: bytes, model, deadline=None):
+    """
+    Feed 16 kHz mono 16-bit PCM through Vosk. Returns (final texts, word timings, chunk count).
+    Stops with DeadlineExceeded between chunks once deadline has expired or was cancelled.
+    """
+    from vosk import KaldiRecognizer
 
-    model = Model(model_path)
-    rec = KaldiRecognizer(model, wf.getframerate())
+    rec = KaldiRecognizer(model, SAMPLE_RATE)
     rec.SetWords(True)
 
     result_texts = []
-    wf.rewind()
+    words = []
+    # Partial hypotheses are only needed for debug output: skip PartialResult()
+    # entirely unless DEBUG is on, and then log every STT_LOG_EVERY-th chunk.
+    log_partials = logger.isEnabledFor(logging.DEBUG)
+    view = memoryview(pcm)
     chunk_i = 0
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
+    for offset in range(0, len(view), CHUNK_BYTES):
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded("stt")
+        data = view[offset:offset + CHUNK_BYTES].tobytes()
         chunk_i += 1
         if rec.AcceptWaveform(data):
             res = rec.Result()
             # res is JSON string; simple extraction
             try:
-                t = json.loads(res).get("text", "")
-            except:
-                t = ""
+                parsed = json.loads(res)
+            except Exception:
+                parsed = {}
+            t = parsed.get("text", "")
             if t: 
-                print(f"DEBUG: chunk {chunk_i} final ->", repr(t))
+                logger.debug("chunk %s final -> %r", chunk_i, t)
                 result_texts.append(t)
-        else:
+                words.extend(parsed.get("result", []))
+        elif log_partials and chunk_i % STT_LOG_EVERY == 0:
             try:
                 part = json.loads(rec.PartialResult()).get("partial", "")
                 if part:
-                    print(f"DEBUG: chunk {chunk_i} partial ->", repr(part))
-            except:
+                    logger.debug("chunk %s partial -> %r", chunk_i, part)
+            except Exception:
                 pass
     # final partial
     final = rec.FinalResult()
     try:
-        t = json.loads(final).get("text", "")
+        parsed = json.loads(final)
+        t = parsed.get("text", "")
         if t:
-            print("DEBUG: final result ->", repr(t))
+            logger.debug("final result -> %r", t)
             result_texts.append(t)
+            words.extend(parsed.get("result", []))
     except Exception as e:
-        print("DEBUG: failed parse final: ", e)
+        logger.debug("failed parse final: %s", e)
+    return result_texts, words, chunk_i
 
-    wf.close()
 
-    full = " ".join([s for s in result_texts if s]).strip()
-    print("DEBUG vosk full result: ", repr(full))
-    return full
-
-# ---- Optional OpenAI backend (paid) ----
-#def openai_transcribe(filepath: str):
- #   import openai, os
-  #  openai.api_key = os.getenv("OPENAI_API_KEY")
-  #  if not openai.api_key:
-  #      raise RuntimeError("OPENAI_API_KEY not set")
-    # Convert to acceptable format if needed
-   # audio_file = open(filepath, "rb")
-    #resp = openai.Audio.transcribe("gpt-4o-transcribe", audio_file)  # example; check API model name
-    #return resp.get("text", "")
+# ---- Parallel decoding of long notes ----
+# Silence detection works on 30 ms frames of the 16 kHz PCM
+FRAME_SAMPLES = SAMPLE_RATE * 30 // 1000
+# A frame is silent below this share of the note's loud (95th percentile) frame peak: -20 dB
+SILENCE_RATIO = 0.1
+SILENCE_FLOOR = 300
 
-# ---- Public function ----
-def transcribe(filepath: str) -> str:
-    print("DEBUG: transcribe called with", filepath)
+_segment_pool: Optional[ThreadPoolExecutor] = None
+_segment_pool_lock = threading.Lock()
+
+
+def _get_segment_pool() -> ThreadPoolExecutor:
+    global _segment_pool
+    with _segment_pool_lock:
+        if _segment_pool is None:
+            _segment_pool = ThreadPoolExecutor(max_workers=max(1, STT_SEGMENT_WORKERS),
+                                               thread_name_prefix="vosk-seg")
+        return _segment_pool
+
+
+def _frame_peaks(pcm: bytes) -> List[int]:
+    """
+    Peak absolute amplitude per frame. Every 4th sample is enough to tell speech
+    from a pause, and max/min over an array slice run in C: under 100 ms for 3 minutes.
+    """
+    samples = array("h")
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    peaks = []
+    for i in range(0, len(samples), FRAME_SAMPLES):
+        frame = samples[i:i + FRAME_SAMPLES:4]
+        peaks.append(max(max(frame), -min(frame)))
+    return peaks
+
+
+def split_at_silences(pcm: bytes) -> List[Tuple[int, int]]:
+    """
+    (start, end) byte ranges covering pcm, each about STT_SEGMENT_S long, cut in
+    the middle of the longest pause near each target boundary (or the quietest
+    frame if the speaker never pauses there).
+    """
+    peaks = _frame_peaks(pcm)
+    if not peaks:
+        return [(0, len(pcm))]
+    loud = percentile(sorted(peaks), 0.95)
+    threshold = max(SILENCE_FLOOR, loud * SILENCE_RATIO)
+    frame_s = FRAME_SAMPLES / SAMPLE_RATE
+    seg_frames = max(1, int(STT_SEGMENT_S / frame_s))
+    window = int(STT_CUT_WINDOW_S / frame_s)
+
+    cuts = [0]
+    while len(peaks) - cuts[-1] > seg_frames + window:
+        target = cuts[-1] + seg_frames
+        lo, hi = max(cuts[-1] + 1, target - window), min(len(peaks) - 1, target + window)
+        best, best_len = None, 0
+        run_start = None
+        for i in range(lo, hi + 1):
+            if peaks[i] < threshold:
+                if run_start is None:
+                    run_start = i
+                if i - run_start + 1 > best_len:
+                    best, best_len = (run_start + i) // 2, i - run_start + 1
+            else:
+                run_start = None
+        if best is None:
+            best = min(range(lo, hi + 1), key=peaks.__getitem__)
+        cuts.append(best)
+
+    frame_bytes = FRAME_SAMPLES * 2
+    bounds = [c * frame_bytes for c in cuts] + [len(pcm)]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def _recognize_parallel(pcm: bytes, model, deadline=None):
+    """
+    Decode the pieces from split_at_silences on the shared pool (one recognizer
+    per piece, all on the same model; Vosk releases the GIL while decoding) and
+    stitch texts and word timings back in order. Same return as _recognize.
+    """
+    ranges = split_at_silences(pcm)
+    set_attribute("segments", len(ranges))
+    if len(ranges) == 1:
+        return _recognize(pcm, model, deadline)
+    pool = _get_segment_pool()
+    # Pool threads don't inherit the caller's context: the deadline is passed explicitly
+    futures = [pool.submit(_recognize, pcm[start:end], model, deadline) for start, end in ranges]
+
+    result_texts, words, chunks = [], [], 0
+    for (start, _end), fut in zip(ranges, futures):
+        try:
+            texts, seg_words, seg_chunks = fut.result()
+        except Exception:
+            for f in futures:
+                f.cancel()  # pieces not started yet never run
+            raise
+        offset = start / (SAMPLE_RATE * 2)
+        result_texts.extend(texts)
+        for w in seg_words:
+            w = dict(w)
+            w["start"] = round(w["start"] + offset, 3)
+            w["end"] = round(w["end"] + offset, 3)
+            words.append(w)
+        chunks += seg_chunks
+    logger.debug("decoded %d segments in parallel", len(ranges))
+    return result_texts, words, chunks
+
+
+def _write_debug_wav(sound):
+    """
+    Replace debug_last.wav in the CWD atomically: each call writes its own temp
+    file and renames it over the target, so concurrent notes can't interleave.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=".debug_last.", suffix=".wav", dir=os.getcwd())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            sound.export(f, format="wav")
+        os.replace(tmp, os.path.join(os.getcwd(), "debug_last.wav"))
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def vosk_transcribe(source: AudioSource, model_path: Optional[str] = None) -> str:
+    """
+    source: path to an audio file (ogg/oga/opus/etc) or a binary file object holding one.
+    model_path: local vosk model directory (you must download manually or use bundled one).
+    """
+    return vosk_transcribe_detailed(source, model_path=model_path)["text"]
+
+
+def vosk_transcribe_detailed(
+    source: AudioSource,
+    model_path: Optional[str] = None,
+    debug_copy: bool = False,
+    keep_wav: bool = False,
+    parallel: bool = True,
+) -> Dict[str, Any]:
+    """
+    Same as vosk_transcribe, but also returns word timings and audio duration.
+
+    Audio is decoded and resampled to 16 kHz mono in memory and fed to Vosk
+    from there; nothing is written to disk unless asked for. Notes longer than
+    STT_PARALLEL_MIN_S are split at pauses and decoded in parallel.
+
+    Returns dict: {"text": str, "words": [{"word", "start", "end", "conf"}], "duration": float}
+    debug_copy: also write debug_last.wav into the CWD.
+    keep_wav: write the converted audio to <path>.conv.wav (path sources only).
+    parallel: False keeps decoding on the calling thread (batch workers already use every core).
+    """
     try:
-        from pydub import AudioSegment
-        s = AudioSegment.from_file(filepath)
-        print("DEBUG: pydub read: channels", s.channels, "framerate", s.frame_rate, "duration_s", len(s)/1000.0)
+        from vosk import KaldiRecognizer  # noqa: F401
     except Exception as e:
-        print("DEBUG: pydub read failed:", e)
+        raise RuntimeError("Vosk not installed or import failed: " + str(e))
+
+    pcm, duration = decode_pcm(source, debug_copy=debug_copy, keep_wav=keep_wav)
+    with span("load_model"):
+        model = load_vosk_model(model_path)
+    deadline = current_deadline()
+    with span("vosk_loop", audio_duration_s=round(duration, 3)) as sp:
+        if parallel and duration >= STT_PARALLEL_MIN_S:
+            result_texts, words, chunks = _recognize_parallel(pcm, model, deadline)
+        else:
+            result_texts, words, chunks = _recognize(pcm, model, deadline)
+        sp.set_attribute("chunks", chunks)
+
+    full = " ".join([s for s in result_texts if s]).strip()
+    logger.debug("vosk full result: %r", full)
+    return {"text": full, "words": words, "duration": duration}
+
+
+def _ffmpeg_path() -> Optional[str]:
+    from pydub import AudioSegment
+
+    # AudioSegment.converter may have been pointed at a specific binary
+    return shutil.which(FFMPEG_BINARY) or shutil.which(AudioSegment.converter)
+
+
+def _ffmpeg_decode(ffmpeg: str, source: AudioSource) -> bytes:
+    """
+    One ffmpeg run straight to 16 kHz mono s16le on stdout (pydub would probe with
+    ffprobe first and can't be interrupted). Killed after STT_DECODE_TIMEOUT_S or
+    as soon as the update's deadline is cancelled.
+    """
+    path = source if isinstance(source, str) else None
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", path or "pipe:0",
+           "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    data = None if path else source.read()
+    deadline = current_deadline()
+    timeout = STT_DECODE_TIMEOUT_S if deadline is None else min(STT_DECODE_TIMEOUT_S, deadline.remaining())
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL if path else subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with (deadline.on_cancel(proc.kill) if deadline else nullcontext()):
+        try:
+            out, err = proc.communicate(input=data, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise DeadlineExceeded("decode")
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded("decode")
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({proc.returncode}): {err.decode(errors='replace').strip()[-300:]}")
+    return out
+
+
+def decode_pcm(source: AudioSource, debug_copy: bool = False, keep_wav: bool = False):
+    """
+    Decode and resample to 16 kHz mono 16-bit PCM in memory; every backend starts from this.
+    Returns (pcm bytes, duration in seconds).
+    """
+    from pydub import AudioSegment
+
+    # convert to wav 16k mono
+    with span("decode") as sp:
+        ffmpeg = _ffmpeg_path()
+        if ffmpeg:
+            pcm = _ffmpeg_decode(ffmpeg, source)
+            sound = AudioSegment(data=pcm, sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+        else:
+            # No ffmpeg: pydub can still read WAV in-process
+            try:
+                sound = AudioSegment.from_file(source)
+                logger.debug("original: channels=%s frame_rate=%s duration_s=%s sample_width=%s",
+                             sound.channels, sound.frame_rate, len(sound) / 1000.0, sound.sample_width)
+            except Exception as e:
+                raise RuntimeError("pydub failed to read input: " + str(e))
+            sound = sound.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+            pcm = sound.raw_data
+        duration = len(pcm) / (SAMPLE_RATE * 2)
+        sp.set_attribute("audio_duration_s", duration)
+        logger.debug("converted: %s bytes of 16k mono PCM, duration_s=%.3f", len(pcm), duration)
+
+        try:
+            if keep_wav and isinstance(source, str):
+                sound.export(source + ".conv.wav", format="wav")
+            if debug_copy:
+                _write_debug_wav(sound)
+        except Exception as e:
+            raise RuntimeError("Failed to export wav: " + str(e))
+    return pcm, duration
+
+# ---- faster-whisper offline backend (CTranslate2, int8 on CPU) ----
+# Optional dependency: pip install faster-whisper. Model names ("small", "medium",
+# "large-v3") are downloaded to the HF cache on first use; a local directory works too.
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+# 0 = let CTranslate2 pick (all physical cores)
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+# Greedy decoding: beam 5 is a bit more accurate and ~2x slower on CPU
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "1"))
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "ru")
+
+_whisper_models = {}
+_whisper_models_lock = threading.Lock()
+
+
+def load_whisper_model(model_name: Optional[str] = None):
+    """Return a cached faster_whisper.WhisperModel, loading it on first use."""
+    model_name = model_name or WHISPER_MODEL
+    key = (model_name, WHISPER_COMPUTE_TYPE, WHISPER_CPU_THREADS)
+    with _whisper_models_lock:
+        model = _whisper_models.get(key)
+        set_attribute("model_cache_hit", model is not None)
+        if model is not None:
+            return model
+        try:
+            from faster_whisper import WhisperModel
+        except Exception as e:
+            raise RuntimeError("faster-whisper not installed or import failed: " + str(e))
+        logger.debug("Loading Whisper model %s (%s, %s threads)", model_name, WHISPER_COMPUTE_TYPE,
+                     WHISPER_CPU_THREADS or "auto")
+        model = WhisperModel(model_name, device="cpu", compute_type=WHISPER_COMPUTE_TYPE,
+                             cpu_threads=WHISPER_CPU_THREADS)
+        _whisper_models[key] = model
+        return model
+
+
+def whisper_transcribe_detailed(
+    source: AudioSource,
+    model_name: Optional[str] = None,
+    debug_copy: bool = False,
+) -> Dict[str, Any]:
+    """Same result shape as vosk_transcribe_detailed, from faster-whisper."""
+    import numpy as np  # installed with faster-whisper
+
+    pcm, duration = decode_pcm(source, debug_copy=debug_copy)
+    with span("load_model"):
+        model = load_whisper_model(model_name)
+    with span("whisper_loop", audio_duration_s=round(duration, 3)) as sp:
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        segments, _info = model.transcribe(
+            audio,
+            language=WHISPER_LANGUAGE,
+            beam_size=WHISPER_BEAM_SIZE,
+            word_timestamps=True,
+            vad_filter=True,
+            condition_on_previous_text=False,
+        )
+        texts = []
+        words = []
+        # segments is a generator: decoding happens while iterating
+        deadline = current_deadline()
+        for seg in segments:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded("stt")
+            texts.append(seg.text.strip())
+            for w in seg.words or []:
+                words.append({"word": w.word.strip(), "start": round(w.start, 2),
+                              "end": round(w.end, 2), "conf": round(w.probability, 3)})
+        sp.set_attribute("segments", len(texts))
+
+    full = " ".join(t for t in texts if t).strip()
+    logger.debug("whisper full result: %r", full)
+    return {"text": full, "words": words, "duration": duration}
 
 
-    if STT_BACKEND == "vosk":
+# ---- Backend registry ----
+class SttBackend(ABC):
+    """
+    One speech-to-text engine. transcribe_detailed returns
+    {"text", "words": [{"word", "start", "end", "conf"}], "duration"}.
+    """
+    name = ""
+
+    def warm_up(self):
+        """Load the model ahead of the first voice note."""
+
+    @abstractmethod
+    def transcribe_detailed(self, source: AudioSource, debug_copy: bool = False) -> Dict[str, Any]:
+        """Transcribe one note (a path or a file object)."""
+
+
+_backends: Dict[str, SttBackend] = {}
+
+
+def register_backend(cls):
+    """
+    Class decorator: make an SttBackend selectable by its name (STT_BACKEND, benchmarks).
+    Instantiates the class right away, so a backend missing transcribe_detailed fails here.
+    """
+    if not cls.name:
+        raise TypeError(f"{cls.__name__} has no backend name")
+    _backends[cls.name] = cls()
+    return cls
+
+
+def available_backends() -> List[str]:
+    return sorted(_backends)
+
+
+def get_backend(name: Optional[str] = None) -> SttBackend:
+    name = name or STT_BACKEND
+    backend = _backends.get(name)
+    if backend is None:
+        raise RuntimeError(f"Unknown STT_BACKEND: {name} (available: {', '.join(available_backends())})")
+    return backend
+
+
+@register_backend
+class VoskBackend(SttBackend):
+    name = "vosk"
+
+    @staticmethod
+    def _model_path() -> str:
         # model path can be overridden via env, fallback to bundled default
-        model_path = os.getenv("VOSK_MODEL_PATH", DEFAULT_VOSK_MODEL_PATH)
-        print("DEBUG: using VOSK model at", model_path)
-        result = vosk_transcribe(filepath, model_path=model_path)
-        print("DEBUG: vosk result raw:", repr(result))
-        return result
-    #elif STT_BACKEND == "openai":
-       # return openai_transcribe(filepath)
-    else:
-        raise RuntimeError("Unknown STT_BACKEND: " + STT_BACKEND)
+        return os.getenv("VOSK_MODEL_PATH", DEFAULT_VOSK_MODEL_PATH)
+
+    def warm_up(self):
+        load_vosk_model(self._model_path())
+
+    def transcribe_detailed(self, source: AudioSource, debug_copy: bool = False) -> Dict[str, Any]:
+        return vosk_transcribe_detailed(source, model_path=self._model_path(), debug_copy=debug_copy)
+
+
+@register_backend
+class WhisperBackend(SttBackend):
+    name = "whisper"
+
+    def warm_up(self):
+        load_whisper_model()
+
+    def transcribe_detailed(self, source: AudioSource, debug_copy: bool = False) -> Dict[str, Any]:
+        return whisper_transcribe_detailed(source, debug_copy=debug_copy)
+
+
+# ---- Public function ----
+def warm_up():
+    """Import pydub and load the configured backend's model ahead of the first voice note."""
+    import pydub  # noqa: F401
+    get_backend().warm_up()
+
+
+def transcribe(source: AudioSource) -> str:
+    """source: path to the downloaded note, or a BytesIO holding it."""
+    logger.debug("transcribe called with %s", getattr(source, "name", source))
+    backend = get_backend()
+    set_attribute("stt_backend", backend.name)
+    result = backend.transcribe_detailed(source, debug_copy=STT_DEBUG_WAV)["text"]
+    logger.info("transcribed %d chars", len(result))
+    logger.debug("%s result raw: %r", backend.name, result)
+    return result
@@ -0,0 +1,94 @@
+# app/services/sync.py
+"""
+Incremental sync from the local visit store to Google Sheets.
+
+A pass for a shop reads visits changed since the shop's high-water mark,
+appends the new ones in a single append_rows call, rewrites already synced
+ones in place with one batch_update, then advances the mark. Passes of the
+same shop are serialized by the shard's write lock; rows committed while a
+pass is running simply go out in the next one.
+
+An append that raised may still have reached Google (e.g. a timeout after the
+write). Such visits are counted in append_attempts; before appending them
+again, their keys are looked up in the sheet's Visit_key column and the ones
+already there are only recorded, not written twice. Without that column there
+is no way to tell, so those visits are held back (logged, kept pending and
+retried every pass) instead of risking duplicates, while the rest of the shop's
+visits sync as usual; the shard adds the column itself when it can. The
+attempt is counted only once the append request actually goes out.
+"""
+import os
+import logging
+from typing import Dict, Optional
+
+from app.services.sheets import get_shard
+from app.services.shops import list_shops
+from app.services.visit_store import pending_changes, mark_synced, pending_counts, mark_append_attempt
+
+logger = logging.getLogger(__name__)
+
+SYNC_BATCH = int(os.getenv("SYNC_BATCH", "200"))
+# Seconds between background sync passes (retries rows left over from failed passes)
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "30"))
+
+
+def sync_shop(shop: str) -> int:
+    """
+    Push all pending changes of one shop. Returns number of rows pushed (held-back rows not counted).
+    Raises the Sheets error if a batch fails; the mark then stays put and the rows are retried later.
+    """
+    shard = get_shard(shop)
+    pushed = 0
+    held = set()
+    with shard.write_lock:
+        while True:
+            changes = pending_changes(shop, SYNC_BATCH)
+            if not changes or all(c["id"] in held for c in changes):
+                return pushed
+
+            new = [c for c in changes if c["sheet_row"] is None]
+            changed = {c["sheet_row"]: c["row"] for c in changes if c["sheet_row"] is not None}
+
+            sheet_rows: Dict[int, int] = {}
+            retried = [c for c in new if c["attempts"]]
+            if retried and not shard.has_key_column():
+                if not held.issuperset(c["id"] for c in retried):
+                    logger.error(f"Shop {shop}: sheet has no Visit_key column, holding back {len(retried)} "
+                                 f"rows whose earlier append may have landed: "
+                                 f"{', '.join(str(c['id']) for c in retried)}")
+                held.update(c["id"] for c in retried)
+                new = [c for c in new if not c["attempts"]]
+            elif retried:
+                landed = shard.find_keys([c["row"].get("Visit_key") for c in retried])
+                for c in retried:
+                    if c["row"].get("Visit_key") in landed:
+                        sheet_rows[c["id"]] = landed[c["row"]["Visit_key"]]
+                if sheet_rows:
+                    logger.info(f"{len(sheet_rows)} rows of shop {shop} had landed on an earlier attempt")
+                new = [c for c in new if c["id"] not in sheet_rows]
+            if new:
+                first_row = shard.append_rows([c["row"] for c in new],
+                                              before_send=lambda: mark_append_attempt([c["id"] for c in new]))
+                if first_row is not None:
+                    sheet_rows.update({c["id"]: first_row + i for i, c in enumerate(new)})
+            shard.update_rows(changed)
+
+            requeue = [c["id"] for c in changes if c["id"] in held]
+            mark_synced(shop, changes[-1]["rev"], sheet_rows, requeue)
+            pushed += len(changes) - len(requeue)
+            logger.info(f"Synced {len(new)} new / {len(changed)} changed rows to shop {shop}"
+                        + (f", {len(requeue)} held back" if requeue else ""))
+
+def sync_all() -> Dict[str, Optional[str]]:
+    """Sync every shop that has pending rows. Returns {shop: error or None}."""
+    results = {}
+    for shop in pending_counts():
+        if shop not in list_shops():
+            continue
+        try:
+            sync_shop(shop)
+            results[shop] = None
+        except Exception as e:
+            logger.warning(f"Sync of shop {shop} failed: {e}")
+            results[shop] = str(e)
+    return results
@@ -0,0 +1,252 @@
+# app/services/tracing.py
+"""
+Per-update trace spans (OpenTelemetry-style, stdlib only).
+
+Every update gets a root span; stages opened with `span("stt")` inside it
+(including in asyncio.to_thread workers, which copy the context) become its
+children, so one slow message can be broken down into get_file, download,
+decode, the Vosk loop, the Gemini call, validation and the Sheets append.
+
+Sampling keeps the overhead bounded at peak:
+- head: only TRACE_HEAD_RATE of updates record spans at all; the rest get a
+  no-op span and cost one ContextVar lookup per stage;
+- tail: a recorded trace is exported only if it failed, took longer than
+  TRACE_SLOW_MS, or falls into TRACE_TAIL_RATE of the remaining ones.
+
+Finished traces go through a bounded queue (dropped when full) to a background
+thread that appends JSONL to TRACE_FILE and/or POSTs OTLP/HTTP JSON to
+TRACE_OTLP_ENDPOINT (a collector or any stand-in listening on /v1/traces).
+Tracing is off unless one of the two is set.
+"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+TRACE_HEAD_RATE = float(os.getenv("TRACE_HEAD_RATE", "1.0"))
+TRACE_TAIL_RATE = float(os.getenv("TRACE_TAIL_RATE", "0.05"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "5000"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+SERVICE_NAME = "traffic-bot"
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is off or the update was not head-sampled."""
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        # list.append is atomic, so spans finishing in worker threads need no lock
+        self.spans: List[Span] = []
+        self.failed = False
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def enabled() -> bool:
+    return bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def set_attribute(key: str, value: Any):
+    """Set an attribute on the innermost active span (no-op when not tracing)."""
+    s = _current.get()
+    if s is not None:
+        s.attributes[key] = value
+
+
+@contextmanager
+def _run(s: Span):
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        s.trace.failed = True
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current.reset(token)
+        s.trace.spans.append(s)
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Root span of one unit of work (an update). Head sampling is decided here."""
+    if not enabled() or random.random() >= TRACE_HEAD_RATE:
+        yield NOOP_SPAN
+        return
+    trace = Trace()
+    root = Span(trace, name, None, attributes)
+    try:
+        with _run(root):
+            yield root
+    finally:
+        _finish(trace, root)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the active span; no-op outside a sampled trace."""
+    parent = _current.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    with _run(Span(parent.trace, name, parent.span_id, attributes)) as s:
+        yield s
+
+
+# ============================================================================
+# TAIL SAMPLING + EXPORT
+# ============================================================================
+
+_queue: "queue.Queue[List[Dict[str, Any]]]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_exporter_lock = threading.Lock()
+_exporter: Optional[threading.Thread] = None
+dropped = 0
+
+
+def _finish(trace: Trace, root: Span):
+    global dropped
+    duration_ms = (root.end_ns - root.start_ns) / 1e6
+    if not (trace.failed or duration_ms >= TRACE_SLOW_MS or random.random() < TRACE_TAIL_RATE):
+        return
+    _ensure_exporter()
+    try:
+        _queue.put_nowait([s.to_dict() for s in trace.spans])
+    except queue.Full:
+        dropped += 1
+
+
+def _ensure_exporter():
+    global _exporter
+    if _exporter is not None:
+        return
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+            _exporter.start()
+
+
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def _to_otlp(batch: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    spans = []
+    for trace in batch:
+        for s in trace:
+            end_ns = s["start_ns"] + int(s["duration_ms"] * 1e6)
+            spans.append({
+                "traceId": s["trace_id"],
+                "spanId": s["span_id"],
+                "parentSpanId": s["parent_id"] or "",
+                "name": s["name"],
+                "startTimeUnixNano": str(s["start_ns"]),
+                "endTimeUnixNano": str(end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+                "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+            })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+def _export(batch: List[List[Dict[str, Any]]]):
+    if TRACE_FILE:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            for trace in batch:
+                for s in trace:
+                    f.write(json.dumps(s, ensure_ascii=False, default=str) + "\n")
+    if TRACE_OTLP_ENDPOINT:
+        req = urllib.request.Request(
+            TRACE_OTLP_ENDPOINT.rstrip("/") + "/v1/traces",
+            data=json.dumps(_to_otlp(batch), default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        urllib.request.urlopen(req, timeout=5).close()
+
+
+def _export_loop():
+    while True:
+        batch = [_queue.get()]
+        # Drain whatever else is waiting so one write/POST carries many traces
+        while len(batch) < 100:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _export(batch)
+        except Exception as e:
+            logger.warning(f"Trace export failed ({len(batch)} traces dropped): {e}")
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def flush(timeout: float = 5.0):
+    """Wait until queued traces are exported (for CLIs and the replay harness)."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
@@ -4,22 +4,18 @@ from typing import Tuple, Dict, Any, List, Optional
 from difflib import get_close_matches
 import math
 
+from app.services.enum_config import DEFAULT_ALLOWED, current as current_enums
+
 # --- CONFIG: allowed lists ---
-ALLOWED = {
-    "Type_of_client": ["новый", "повторный", "контрактник/мастер", "оптовик"],
-    "Behavior": ["мимо прошли", "поспрашивали", "посмотрели", "замеряли/считали"],
-    "Purchase_status": ["купили", "не купили", "думают", "обмен"],
-    "Reason_not_buying": ["дорого", "нет дизайна/цвета", "нет в наличии", "сравнивают",
-                         "зайдут позже", "не целевой", "не успел обработать", "другое"],
-    "Source": ["Instagram", "2ГИС", "рекомендация", "вывеска", "TikTok", "другое"],
-    "YesNo": ["да", "нет"]
-}
+# Live values come from app.services.enum_config (hot-reloaded file); ALLOWED is the
+# built-in default set, kept for tools that need a fixed vocabulary.
+ALLOWED = DEFAULT_ALLOWED
 
 # Sheet column order (adjust to match your actual sheet!)
 SHEET_COLUMNS = [
     "Date", "Time", "Client_ID", "Type_of_client", "Behavior", "Purchase_status",
     "Ticket_amount", "Cost_Price", "Source", "Reason_not_buying", "Product_name",
-    "Quantity", "Transcription_raw", "Repeat_visit", "Contact_left", "Short_note"
+    "Quantity", "Transcription_raw", "Repeat_visit", "Contact_left", "Short_note", "Visit_key"
 ]
 
 # --- Helpers ---
@@ -159,28 +155,27 @@ def match_enum(s: Optional[str], key: str, cutoff: float = 0.6) -> str:
     if not s0:
         return ""
     
-    choices = ALLOWED.get(key, [])
+    config = current_enums()
+    by_lower = config.by_lower.get(key, {})
+    lowered = config.lowered.get(key, ())
     
     # Exact match (case-insensitive)
-    for c in choices:
-        if s0 == c.lower():
-            return c
+    exact = by_lower.get(s0)
+    if exact:
+        return exact
     
     # Substring match
-    for c in choices:
-        if s0 in c.lower() or c.lower() in s0:
-            return c
+    for c in lowered:
+        if s0 in c or c in s0:
+            return by_lower[c]
     
     # Fuzzy match
-    matches = get_close_matches(s0, [c.lower() for c in choices], n=1, cutoff=cutoff)
+    matches = get_close_matches(s0, lowered, n=1, cutoff=cutoff)
     if matches:
-        # Find original case version
-        for c in choices:
-            if c.lower() == matches[0]:
-                return c
+        return by_lower[matches[0]]
     
     # Fallback: if "другое" exists, return it for unmatched values
-    if "другое" in choices:
+    if "другое" in by_lower:
         return "другое"
     
     return ""
@@ -326,6 +321,9 @@ def validate_and_normalize_row(row: Dict[str, Any]) -> Tuple[bool, Dict[str, Any
     
     # Transcription (keep as-is)
     out["Transcription_raw"] = safe_string_for_sheet(row.get("Transcription_raw", ""))
+
+    # Idempotency key (chat:message:timestamp), written as-is
+    out["Visit_key"] = str(row.get("Visit_key") or "")
     
     # --- VALIDATION SUMMARY ---
     all_messages = errors + warnings
@@ -0,0 +1,92 @@
+# app/services/visit_segmenter.py
+"""
+Split one voice note that describes several visits into one text per visit.
+
+At the end of a rush staff dictate "первый — оптовик купил на 50 тысяч, второй
+просто посмотрел, третья ...". Visits are recognized by ordinal markers that
+count up from one ("первый/первая", "второй/вторая", ... or "1)", "2.") with
+"следующий/следующая" accepted as the next number. A word marker counts only
+where a visit can begin: at the start of the text or of a clause (after
+punctuation or a line break), and followed by a dash, comma or stop, a client
+word ("второй покупатель"), or a past-tense verb ("третья ушла"). So
+"на первый этаж и на второй этаж", "второй раз" or "первая жена выбирала,
+второй муж ..." stay one visit. A split also needs at least two markers in order.
+"""
+import re
+from typing import List, Optional, Tuple
+
+_ORDINAL_STEMS = {
+    "перв": 1, "втор": 2, "трет": 3, "четверт": 4, "пят": 5,
+    "шест": 6, "седьм": 7, "восьм": 8, "девят": 9, "десят": 10,
+}
+# "второй", "вторая", "третий", "третья", ...
+_ORDINAL_RE = re.compile(r"\b(" + "|".join(_ORDINAL_STEMS) + r")(?:ый|ой|ий|ая|ья|ые|ьи)\b")
+# Typed lists: "1) ...", "2. ..."
+_NUMBER_RE = re.compile(r"(?:^|(?<=\s))(\d{1,2})[).]\s")
+_NEXT_RE = re.compile(r"\bследующ(?:ий|ая|ие)\b")
+# Where a visit can begin: start of the text or of a clause ("..., а второй купил")
+_CLAUSE_START_RE = re.compile(r"(?:^|[.,;:!?—–\-\n])\s*((?:а|и|потом|затем)\s+)?$")
+# What may follow a word marker: punctuation, end, or the next word
+_AFTER_RE = re.compile(r"\s*(?:([.,;:!?—–\-]|$)|(\w+))")
+_CLIENT_WORD_RE = re.compile(
+    r"(?:клиент|покупател|посетител|оптовик|мастер|контрактник|заказчи|дизайнер|прораб|строител"
+    r"|мужчин|женщин|девушк|парен|пар[аы]|семь|бабушк|дедушк|человек)"
+)
+# Past tense ("купил", "ушла", "посмотрели", "вернулся"), as visits are told after the fact
+_PAST_VERB_RE = re.compile(r"\w{2,}(?:л|ла|ло|ли)(?:ся|сь)?")
+_NOT_VERBS = {"зал", "пол", "стол", "угол", "материал", "сигнал", "канал", "пенал"}
+# Adverbs that start a visit's story: "второй просто посмотрел"
+_LEAD_WORDS = {"просто", "только", "сразу", "тоже", "же", "не", "ничего", "уже", "еще", "сначала", "вообще"}
+
+# Visits shorter than this (chars) are merged into the previous one: a stray marker, not a visit
+MIN_VISIT_CHARS = 15
+
+
+def _visit_start(lowered: str, start: int, end: int) -> Optional[int]:
+    """
+    Where the visit begins if the word marker at [start, end) opens one (a leading
+    "а"/"потом" goes with it), else None.
+    """
+    clause = _CLAUSE_START_RE.search(lowered, 0, start)
+    m = _AFTER_RE.match(lowered, end)
+    if clause is None or m is None:
+        return None
+    word = m.group(2)
+    if (m.group(1) is not None or _CLIENT_WORD_RE.match(word) or word in _LEAD_WORDS
+            or (word not in _NOT_VERBS and _PAST_VERB_RE.fullmatch(word))):
+        return clause.start(1) if clause.group(1) else start
+    return None
+
+
+def _markers(text: str) -> List[Tuple[int, Optional[int]]]:
+    """(position, number) of every candidate marker; number None = "следующий"."""
+    lowered = text.lower().replace("ё", "е")
+    found = [(_visit_start(lowered, m.start(), m.end()), _ORDINAL_STEMS[m.group(1)])
+             for m in _ORDINAL_RE.finditer(lowered)]
+    found += [(m.start(1), int(m.group(1))) for m in _NUMBER_RE.finditer(lowered)]
+    found += [(_visit_start(lowered, m.start(), m.end()), None) for m in _NEXT_RE.finditer(lowered)]
+    return sorted((pos, number) for pos, number in found if pos is not None)
+
+
+def split_visits(text: str) -> List[str]:
+    """One text per visit, in order; [text] when the note describes a single visit."""
+    text = (text or "").strip()
+    starts = []
+    expected = 1
+    for pos, number in _markers(text):
+        if number == expected or (number is None and expected > 1):
+            starts.append(pos)
+            expected += 1
+    if len(starts) < 2:
+        return [text] if text else []
+
+    # Anything before the first marker ("за час было три клиента") goes with the first visit
+    bounds = [0] + starts[1:] + [len(text)]
+    visits: List[str] = []
+    for a, b in zip(bounds, bounds[1:]):
+        part = text[a:b].strip(" ,.;—-")
+        if visits and len(part) < MIN_VISIT_CHARS:
+            visits[-1] = f"{visits[-1]} {part}"
+        elif part:
+            visits.append(part)
+    return visits
@@ -0,0 +1,345 @@
+# app/services/visit_store.py
+"""
+Local SQLite system of record for visits.
+
+Every validated row is committed here first (indexed by date, client, status
+and source); Google Sheets is filled from this table by app.services.sync.
+Each insert or update takes the next value of a global change counter (`rev`),
+and sync_state keeps a per-shop high-water mark, so a sync pass only reads
+rows changed since the last successful push. Daily rollups for /report are
+updated in the same transaction as the visit itself.
+
+Visits carry an idempotency key (chat:message:timestamp of the message that
+started them, see make_visit_key) with a unique index on it: committing the
+same visit again returns the existing id instead of a second row, so retries
+and replays are safe. The key also goes to the sheet's Visit_key column, which
+lets sync check whether an append that errored out had in fact landed.
+"""
+import os
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VISITS_DB = os.getenv("VISITS_DB", "visits.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS visits (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    shop              TEXT NOT NULL,
+    date              TEXT NOT NULL,
+    time              TEXT,
+    client_id         TEXT,
+    type_of_client    TEXT,
+    behavior          TEXT,
+    purchase_status   TEXT,
+    ticket_amount     REAL,
+    cost_price        REAL,
+    source            TEXT,
+    reason_not_buying TEXT,
+    data              TEXT NOT NULL,
+    created_at        TEXT NOT NULL,
+    updated_at        TEXT NOT NULL,
+    rev               INTEGER NOT NULL,
+    sheet_row         INTEGER,
+    visit_key         TEXT,
+    append_attempts   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_visits_date ON visits(date);
+CREATE INDEX IF NOT EXISTS idx_visits_client ON visits(client_id);
+CREATE INDEX IF NOT EXISTS idx_visits_status ON visits(purchase_status);
+CREATE INDEX IF NOT EXISTS idx_visits_source ON visits(source);
+CREATE INDEX IF NOT EXISTS idx_visits_shop_rev ON visits(shop, rev);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    shop           TEXT PRIMARY KEY,
+    high_water_rev INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+-- Daily rollups, maintained in the same transaction as every insert/update,
+-- so reports never scan raw visits however much history builds up.
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    shop       TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    visits     INTEGER NOT NULL DEFAULT 0,
+    purchases  INTEGER NOT NULL DEFAULT 0,
+    revenue    REAL NOT NULL DEFAULT 0,
+    margin     REAL NOT NULL DEFAULT 0,
+    margin_n   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (shop, date)
+);
+CREATE TABLE IF NOT EXISTS daily_dim (
+    shop       TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    dim        TEXT NOT NULL,      -- 'source' or 'reason'
+    value      TEXT NOT NULL,
+    visits     INTEGER NOT NULL DEFAULT 0,
+    purchases  INTEGER NOT NULL DEFAULT 0,
+    revenue    REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (shop, date, dim, value)
+);
+"""
+
+# Columns added after the first release: (name, definition) for ALTER TABLE on old stores
+_ADDED_COLUMNS = [
+    ("visit_key", "TEXT"),
+    ("append_attempts", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+PURCHASED = "купили"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def _connect() -> sqlite3.Connection:
+    """One connection per thread (handlers run store calls in asyncio.to_thread workers)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == VISITS_DB:
+        return conn
+    conn = sqlite3.connect(VISITS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL: readers (reports, sync) don't block the writer and vice versa
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    backfill = False
+    with _init_lock:
+        if VISITS_DB not in _initialized:
+            conn.executescript(_SCHEMA)
+            _migrate(conn)
+            _initialized.add(VISITS_DB)
+            backfill = (conn.execute("SELECT 1 FROM visits LIMIT 1").fetchone() is not None
+                        and conn.execute("SELECT 1 FROM daily_rollup LIMIT 1").fetchone() is None)
+    _local.conn = conn
+    _local.path = VISITS_DB
+    if backfill:
+        # Store created before rollups existed: build them once from raw visits
+        rebuild_rollups()
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(visits)")}
+    for name, definition in _ADDED_COLUMNS:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE visits ADD COLUMN {name} {definition}")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_visits_key ON visits(visit_key) "
+                 "WHERE visit_key IS NOT NULL")
+    conn.commit()
+
+
+def make_visit_key(chat_id: int, message_id: int, timestamp: datetime) -> str:
+    """Idempotency key of a visit: the chat, message and send time of the message that started it."""
+    return f"{chat_id}:{message_id}:{int(timestamp.timestamp())}"
+
+
+def _next_rev(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        "INSERT INTO counters(name, value) VALUES('rev', 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+    )
+    return conn.execute("SELECT value FROM counters WHERE name = 'rev'").fetchone()[0]
+
+
+def _num(v) -> Optional[float]:
+    return float(v) if isinstance(v, (int, float)) else None
+
+
+def _columns(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Indexed/aggregated columns pulled out of the normalized row."""
+    return {
+        "date": row.get("Date", ""),
+        "time": row.get("Time", ""),
+        "client_id": row.get("Client_ID", "") or None,
+        "type_of_client": row.get("Type_of_client", ""),
+        "behavior": row.get("Behavior", ""),
+        "purchase_status": row.get("Purchase_status", ""),
+        "ticket_amount": _num(row.get("Ticket_amount")),
+        "cost_price": _num(row.get("Cost_Price")),
+        "source": row.get("Source", ""),
+        "reason_not_buying": row.get("Reason_not_buying", ""),
+        "visit_key": row.get("Visit_key", "") or None,
+        "data": json.dumps(row, ensure_ascii=False),
+    }
+
+
+def _apply_rollup(conn: sqlite3.Connection, shop: str, cols: Dict[str, Any], sign: int):
+    """Add (sign=1) or remove (sign=-1) one visit's contribution to the daily rollups."""
+    bought = cols["purchase_status"] == PURCHASED
+    ticket = cols["ticket_amount"] or 0.0
+    revenue = ticket if bought else 0.0
+    has_margin = bought and cols["ticket_amount"] is not None and cols["cost_price"] is not None
+    margin = (cols["ticket_amount"] - cols["cost_price"]) if has_margin else 0.0
+    conn.execute(
+        "INSERT INTO daily_rollup(shop, date, visits, purchases, revenue, margin, margin_n) "
+        "VALUES(?, ?, ?, ?, ?, ?, ?) ON CONFLICT(shop, date) DO UPDATE SET "
+        "visits = visits + excluded.visits, purchases = purchases + excluded.purchases, "
+        "revenue = revenue + excluded.revenue, margin = margin + excluded.margin, "
+        "margin_n = margin_n + excluded.margin_n",
+        (shop, cols["date"], sign, sign * bought, sign * revenue, sign * margin, sign * has_margin),
+    )
+    dims = [("source", cols["source"])]
+    if not bought:
+        dims.append(("reason", cols["reason_not_buying"]))
+    for dim, value in dims:
+        if not value:
+            continue
+        conn.execute(
+            "INSERT INTO daily_dim(shop, date, dim, value, visits, purchases, revenue) "
+            "VALUES(?, ?, ?, ?, ?, ?, ?) ON CONFLICT(shop, date, dim, value) DO UPDATE SET "
+            "visits = visits + excluded.visits, purchases = purchases + excluded.purchases, "
+            "revenue = revenue + excluded.revenue",
+            (shop, cols["date"], dim, value, sign, sign * bought, sign * revenue),
+        )
+
+
+def record_visit(row: Dict[str, Any], shop: str) -> int:
+    """
+    Commit a validated row (output of validate_and_normalize_row). Returns the visit id.
+    A row whose Visit_key is already committed is not inserted again; the existing id is returned.
+    """
+    return _insert_visit(row, shop)[0]
+
+
+def record_visits(rows: List[Dict[str, Any]], shop: str) -> List[Tuple[int, bool]]:
+    """
+    record_visit for several rows (one multi-visit note), in order. Returns (visit id,
+    inserted) per row; inserted is False for a Visit_key that was already committed.
+    """
+    return [_insert_visit(row, shop) for row in rows]
+
+
+def _insert_visit(row: Dict[str, Any], shop: str) -> Tuple[int, bool]:
+    conn = _connect()
+    now = datetime.now().isoformat(timespec="seconds")
+    cols = _columns(row)
+    try:
+        with conn:
+            rev = _next_rev(conn)
+            cur = conn.execute(
+                f"INSERT INTO visits(shop, {', '.join(cols)}, created_at, updated_at, rev) "
+                f"VALUES(?, {', '.join('?' for _ in cols)}, ?, ?, ?)",
+                [shop, *cols.values(), now, now, rev],
+            )
+            _apply_rollup(conn, shop, cols, 1)
+    except sqlite3.IntegrityError:
+        existing = find_visit_by_key(cols["visit_key"]) if cols["visit_key"] else None
+        if existing is None:
+            raise
+        logger.info(f"Visit {cols['visit_key']} already committed as #{existing}, not inserted again")
+        return existing, False
+    return cur.lastrowid, True
+
+
+def find_visit_by_key(visit_key: str) -> Optional[int]:
+    r = _connect().execute("SELECT id FROM visits WHERE visit_key = ?", (visit_key,)).fetchone()
+    return r[0] if r else None
+
+
+def update_visit(visit_id: int, row: Dict[str, Any]):
+    """Replace a visit's data; the change is picked up by the next sync of its shop."""
+    conn = _connect()
+    cols = _columns(row)
+    with conn:
+        old = conn.execute("SELECT * FROM visits WHERE id = ?", (visit_id,)).fetchone()
+        if old is None:
+            raise KeyError(f"Unknown visit {visit_id}")
+        _apply_rollup(conn, old["shop"], dict(old), -1)
+        rev = _next_rev(conn)
+        conn.execute(
+            f"UPDATE visits SET {', '.join(f'{c} = ?' for c in cols)}, updated_at = ?, rev = ? WHERE id = ?",
+            [*cols.values(), datetime.now().isoformat(timespec="seconds"), rev, visit_id],
+        )
+        _apply_rollup(conn, old["shop"], cols, 1)
+
+
+def rebuild_rollups():
+    """Recompute all rollups from raw visits (after a manual DB edit or restore)."""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM daily_rollup")
+        conn.execute("DELETE FROM daily_dim")
+        for r in conn.execute("SELECT * FROM visits").fetchall():
+            _apply_rollup(conn, r["shop"], dict(r), 1)
+
+
+def query(sql: str, params=()) -> List[sqlite3.Row]:
+    """Read-only helper for reports."""
+    return _connect().execute(sql, params).fetchall()
+
+
+def get_visit(visit_id: int) -> Optional[Dict[str, Any]]:
+    r = _connect().execute("SELECT * FROM visits WHERE id = ?", (visit_id,)).fetchone()
+    return dict(r) if r else None
+
+
+def get_high_water(shop: str) -> int:
+    r = _connect().execute("SELECT high_water_rev FROM sync_state WHERE shop = ?", (shop,)).fetchone()
+    return r[0] if r else 0
+
+
+def pending_changes(shop: str, limit: int) -> List[Dict[str, Any]]:
+    """Visits of a shop changed since its high-water mark, oldest change first."""
+    rows = _connect().execute(
+        "SELECT id, rev, sheet_row, append_attempts, data FROM visits WHERE shop = ? AND rev > ? "
+        "ORDER BY rev LIMIT ?",
+        (shop, get_high_water(shop), limit),
+    ).fetchall()
+    return [{"id": r["id"], "rev": r["rev"], "sheet_row": r["sheet_row"], "attempts": r["append_attempts"],
+             "row": json.loads(r["data"])}
+            for r in rows]
+
+
+def mark_append_attempt(visit_ids: List[int]):
+    """Note that these visits are being sent to the sheet: if the call errors, they may have landed anyway."""
+    conn = _connect()
+    with conn:
+        conn.executemany("UPDATE visits SET append_attempts = append_attempts + 1 WHERE id = ?",
+                         [(vid,) for vid in visit_ids])
+
+
+def mark_synced(shop: str, high_water_rev: int, sheet_rows: Dict[int, int], requeue: List[int] = ()):
+    """
+    Advance a shop's high-water mark and remember where new visits landed in the sheet.
+    requeue: visits of the batch that were held back; they get a new rev past the mark,
+    so they stay pending and come last in the next pass.
+    """
+    conn = _connect()
+    with conn:
+        conn.executemany("UPDATE visits SET sheet_row = ? WHERE id = ?",
+                         [(sheet_row, vid) for vid, sheet_row in sheet_rows.items()])
+        for vid in requeue:
+            conn.execute("UPDATE visits SET rev = ? WHERE id = ?", (_next_rev(conn), vid))
+        conn.execute(
+            "INSERT INTO sync_state(shop, high_water_rev) VALUES(?, ?) "
+            "ON CONFLICT(shop) DO UPDATE SET high_water_rev = MAX(high_water_rev, excluded.high_water_rev)",
+            (shop, high_water_rev),
+        )
+
+
+def pending_counts() -> Dict[str, int]:
+    """shop -> number of visits not yet pushed to Sheets."""
+    rows = _connect().execute(
+        "SELECT v.shop, COUNT(*) FROM visits v LEFT JOIN sync_state s ON s.shop = v.shop "
+        "WHERE v.rev > COALESCE(s.high_water_rev, 0) GROUP BY v.shop"
+    ).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+def is_synced(visit_id: int) -> bool:
+    r = _connect().execute(
+        "SELECT v.rev <= COALESCE(s.high_water_rev, 0) FROM visits v "
+        "LEFT JOIN sync_state s ON s.shop = v.shop WHERE v.id = ?",
+        (visit_id,),
+    ).fetchone()
+    return bool(r and r[0])
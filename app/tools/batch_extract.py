@@ -0,0 +1,153 @@
+# app/tools/batch_extract.py
+"""
+Re-extract stored transcripts with Gemini in packed batches.
+
+For prompt/ALLOWED changes and outage recovery: many transcripts go into one
+request (see ai_extractor.extract_batch) instead of one request each, and one
+JSON line per transcript is appended to the output:
+
+    {"key": ..., "extracted": {...}}   or   {"key": ..., "error": "..."}
+
+Input is either the JSONL written by batch_transcribe (key = audio path) or
+the local visit store (key = visit id, text = Transcription_raw). Keys already
+extracted in the output are skipped, so an interrupted run can be restarted.
+
+Usage:
+    python -m app.tools.batch_extract --transcripts transcripts.jsonl -o extracted.jsonl
+    python -m app.tools.batch_extract --from-store --since 2026-03-01 -o extracted.jsonl -b 25 -c 4
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple, Set, Dict, Any, Optional
+
+from app.services.ai_extractor import extract_batch, MODEL_ID
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens, for the cost estimate only (defaults: gemini-2.5-flash-lite list price)
+PRICE_IN_PER_M = float(os.getenv("GEMINI_PRICE_IN_PER_M", "0.10"))
+PRICE_OUT_PER_M = float(os.getenv("GEMINI_PRICE_OUT_PER_M", "0.40"))
+
+
+def load_transcripts(path: str) -> List[Tuple[str, str]]:
+    """(key, text) from batch_transcribe output; failed or empty transcriptions are skipped."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in entry and entry.get("text"):
+                items.append((entry["path"], entry["text"]))
+    return items
+
+
+def load_from_store(shop: Optional[str], since: Optional[str]) -> List[Tuple[str, str]]:
+    """(visit id, Transcription_raw) of stored visits that have a transcript."""
+    from app.services.visit_store import query
+
+    sql = "SELECT id, data FROM visits WHERE 1 = 1"
+    params: list = []
+    if shop:
+        sql += " AND shop = ?"
+        params.append(shop)
+    if since:
+        sql += " AND date >= ?"
+        params.append(since)
+    items = []
+    for r in query(sql + " ORDER BY id", params):
+        text = json.loads(r["data"]).get("Transcription_raw", "")
+        if text:
+            items.append((str(r["id"]), text))
+    return items
+
+
+def load_done(output_path: str) -> Set[str]:
+    """Keys already extracted successfully in a previous run."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in entry:
+                done.add(entry.get("key"))
+    return done
+
+
+def run(items: List[Tuple[str, str]], output_path: str, batch_size: int, concurrency: int) -> Dict[str, Any]:
+    done = load_done(output_path)
+    todo = [it for it in items if it[0] not in done]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    logger.info(f"{len(items)} transcripts, {len(done)} already done, {len(todo)} in {len(batches)} batches")
+
+    totals = {"ok": 0, "failed": 0, "requests": 0, "prompt_tokens": 0, "output_tokens": 0,
+              "retries": 0, "splits": 0}
+    started = time.perf_counter()
+    if batches:
+        with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(extract_batch, b) for b in batches]
+            for i, fut in enumerate(as_completed(futures), 1):
+                res = fut.result()
+                for key, fields in res["results"].items():
+                    out.write(json.dumps({"key": key, "extracted": fields}, ensure_ascii=False) + "\n")
+                for key, error in res["errors"].items():
+                    out.write(json.dumps({"key": key, "error": error}, ensure_ascii=False) + "\n")
+                out.flush()
+                totals["ok"] += len(res["results"])
+                totals["failed"] += len(res["errors"])
+                for k in ("requests", "prompt_tokens", "output_tokens", "retries", "splits"):
+                    totals[k] += res[k]
+                logger.info(f"{i}/{len(batches)} batches, {totals['ok']} ok, {totals['failed']} failed")
+
+    wall = time.perf_counter() - started
+    processed = totals["ok"] + totals["failed"]
+    cost = totals["prompt_tokens"] / 1e6 * PRICE_IN_PER_M + totals["output_tokens"] / 1e6 * PRICE_OUT_PER_M
+    return {
+        **totals,
+        "total": len(items),
+        "skipped": len(done),
+        "wall_seconds": round(wall, 1),
+        "items_per_second": round(processed / wall, 2) if wall else 0.0,
+        "prompt_tokens_per_item": round(totals["prompt_tokens"] / processed, 1) if processed else 0.0,
+        "requests_per_item": round(totals["requests"] / processed, 3) if processed else 0.0,
+        "cost_usd": round(cost, 4),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Re-extract stored transcripts with Gemini in batches.")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--transcripts", help="JSONL written by app.tools.batch_transcribe")
+    src.add_argument("--from-store", action="store_true", help="Read Transcription_raw from the visit store")
+    parser.add_argument("--shop", help="With --from-store: only this shop")
+    parser.add_argument("--since", help="With --from-store: only visits on/after this date (YYYY-MM-DD)")
+    parser.add_argument("-o", "--output", default="extracted.jsonl", help="Output JSONL (appended, used for resume)")
+    parser.add_argument("-b", "--batch-size", type=int, default=25, help="Transcripts per request")
+    parser.add_argument("-c", "--concurrency", type=int, default=2, help="Requests in flight")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    items = load_transcripts(args.transcripts) if args.transcripts else load_from_store(args.shop, args.since)
+    summary = run(items, args.output, max(1, args.batch_size), max(1, args.concurrency))
+    print(
+        f"Done with {MODEL_ID}: {summary['ok']} ok, {summary['failed']} failed, {summary['skipped']} skipped "
+        f"in {summary['wall_seconds']}s = {summary['items_per_second']} items/s\n"
+        f"{summary['requests']} requests ({summary['requests_per_item']}/item, {summary['retries']} retries, "
+        f"{summary['splits']} splits), {summary['prompt_tokens']} prompt + {summary['output_tokens']} output tokens "
+        f"({summary['prompt_tokens_per_item']} prompt tokens/item), est. ${summary['cost_usd']}"
+    )
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# app/tools/batch_transcribe.py
+"""
+Offline batch transcription of archived voice notes.
+
+Decodes many audio files in parallel (one process per core, one Vosk model per
+worker process) and appends one JSON line per file to the output:
+
+    {"path": ..., "text": ..., "words": [...], "duration": 12.3, "elapsed": 2.1}
+
+Already transcribed paths found in the output are skipped, so an interrupted
+run can simply be restarted with the same arguments (a line torn by the kill is
+cut off before appending).
+
+Usage:
+    python -m app.tools.batch_transcribe <dir|manifest.txt> -o transcripts.jsonl [-w 4]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Set, Dict, Any, Optional
+
+from app.services.stt import DEFAULT_VOSK_MODEL_PATH, load_vosk_model, vosk_transcribe_detailed
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".ogg", ".oga", ".opus", ".mp3", ".m4a", ".wav", ".webm")
+
+# Per-process model path, set by _init_worker
+_worker_model_path: Optional[str] = None
+
+
+def collect_inputs(source: str) -> List[str]:
+    """
+    Resolve a directory (walked recursively) or a manifest file into audio paths.
+    Manifest: one path per line; relative paths are resolved against the manifest's folder.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return paths
+
+
+def load_done(output_path: str) -> Set[str]:
+    """Paths already transcribed successfully in a previous (possibly interrupted) run."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line from a killed run - ignore, it will be redone
+                continue
+            if "error" not in entry:
+                done.add(entry.get("path"))
+    return done
+
+
+def drop_torn_tail(output_path: str):
+    """Cut a partial last line left by a killed run, so the next appended entry starts on its own line."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        pos = end
+        while pos > 0:
+            step = min(64 * 1024, pos)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            if pos == end and chunk.endswith(b"\n"):
+                return
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        f.truncate(pos)
+    logger.warning(f"Dropped a torn last line ({end - pos} bytes) from {output_path}")
+
+
+def _init_worker(model_path: str):
+    """Load the model once per worker process instead of once per file."""
+    global _worker_model_path
+    _worker_model_path = model_path
+    load_vosk_model(model_path)
+
+
+def _transcribe_one(path: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        result = vosk_transcribe_detailed(path, model_path=_worker_model_path, parallel=False)
+    except Exception as e:
+        return {"path": path, "error": str(e), "elapsed": round(time.perf_counter() - started, 3)}
+    return {
+        "path": path,
+        "text": result["text"],
+        "words": result["words"],
+        "duration": round(result["duration"], 3),
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_batch(paths: List[str], output_path: str, workers: int, model_path: str) -> Dict[str, Any]:
+    """Transcribe paths not yet in output_path. Returns run summary."""
+    done = load_done(output_path)
+    todo = [p for p in paths if p not in done]
+    logger.info(f"{len(paths)} files, {len(done)} already done, {len(todo)} to transcribe")
+
+    audio_seconds = 0.0
+    ok = failed = 0
+    started = time.perf_counter()
+
+    if todo:
+        drop_torn_tail(output_path)
+        with open(output_path, "a", encoding="utf-8") as out, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(model_path,)
+        ) as pool:
+            futures = [pool.submit(_transcribe_one, p) for p in todo]
+            for i, fut in enumerate(as_completed(futures), 1):
+                entry = fut.result()
+                # One line per file, flushed immediately so a crash loses at most the in-flight files
+                out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                out.flush()
+                if "error" in entry:
+                    failed += 1
+                    logger.warning(f"Failed {entry['path']}: {entry['error']}")
+                else:
+                    ok += 1
+                    audio_seconds += entry["duration"]
+                if i % 10 == 0 or i == len(futures):
+                    wall = time.perf_counter() - started
+                    logger.info(
+                        f"{i}/{len(futures)} files, {audio_seconds:.0f}s audio, "
+                        f"{audio_seconds / wall if wall else 0:.2f} audio-s/wall-s"
+                    )
+
+    wall = time.perf_counter() - started
+    return {
+        "total": len(paths),
+        "skipped": len(done),
+        "ok": ok,
+        "failed": failed,
+        "audio_seconds": round(audio_seconds, 1),
+        "wall_seconds": round(wall, 1),
+        "throughput": round(audio_seconds / wall, 2) if wall else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Batch-transcribe archived voice notes to JSONL.")
+    parser.add_argument("source", help="Directory with audio files or manifest (one path per line)")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl", help="Output JSONL (appended, used for resume)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("-m", "--model", default=os.getenv("VOSK_MODEL_PATH", DEFAULT_VOSK_MODEL_PATH),
+                        help="Vosk model directory")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.model):
+        parser.error(f"Vosk model not found at {args.model}")
+
+    logging.basicConfig(level=logging.INFO)
+    paths = collect_inputs(args.source)
+    summary = run_batch(paths, args.output, max(1, args.workers), args.model)
+    print(
+        f"Done: {summary['ok']} ok, {summary['failed']} failed, {summary['skipped']} skipped. "
+        f"{summary['audio_seconds']}s audio in {summary['wall_seconds']}s "
+        f"= {summary['throughput']} audio-s/wall-s"
+    )
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
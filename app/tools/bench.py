@@ -0,0 +1,286 @@
+# app/tools/bench.py
+"""
+Micro-benchmarks for the validator, parser and conversation hot paths.
+
+Runs each hot path over a generated, seeded corpus (Russian amounts with
+spaces and currencies, misspelled enum values, long transcripts) and reports
+the best-of-N time per call. Results can be stored as a baseline; later runs
+compare against it and exit non-zero when a path is slower than the baseline
+by more than --threshold (default 25%).
+
+Usage:
+    python -m app.tools.bench --save            # record baseline
+    python -m app.tools.bench                   # compare, exit 1 on regression
+    python -m app.tools.bench -k parse_number   # run a subset
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional
+
+from app.services.validator import ALLOWED, parse_number, match_enum, norm_text, validate_and_normalize_row
+from app.conversation_flow import ConversationState
+
+DEFAULT_BASELINE = "bench_baseline.json"
+
+_WORDS = (
+    "клиент зашел посмотрел обои флизелиновые виниловые рулон каталог спросил цену "
+    "дорого подумает вернется завтра муж жена ремонт квартира зал спальня детская "
+    "оптовик мастер замерял купил тысяч тенге скидка наличии цвет дизайн инстаграм "
+    "вывеска рекомендация соседи двагис тикток позвонит оставил номер"
+).split()
+_CURRENCIES = ["", " тг", " ₸", " тенге", "₸", " руб"]
+_RU_TO_LAT_TYPOS = {"о": "0", "а": "a", "е": "e", "с": "c", "р": "p"}
+
+
+# ============================================================================
+# CORPORA
+# ============================================================================
+
+def gen_amounts(rng: random.Random, n: int) -> List[str]:
+    """Amounts the way staff type them: '15 000', '1 250 000 тг', '15000.50', '15,5', plus junk."""
+    out = []
+    for _ in range(n):
+        value = rng.choice([rng.randint(1, 999), rng.randint(1000, 99999), rng.randint(100000, 5000000)])
+        kind = rng.random()
+        if kind < 0.4:
+            s = f"{value:,}".replace(",", " ")
+        elif kind < 0.6:
+            s = str(value)
+        elif kind < 0.75:
+            s = f"{value}{rng.choice(['.', ','])}{rng.randint(0, 99):02d}"
+        elif kind < 0.9:
+            s = f"{value:,}".replace(",", " ") + rng.choice([".5", ",50"])
+        else:
+            s = rng.choice(["15 и 20", "1+5", "abc123", "1 2 3 4 5", "пятнадцать тысяч", "1.2.3"])
+        out.append(s + rng.choice(_CURRENCIES))
+    return out
+
+
+def _misspell(rng: random.Random, s: str) -> str:
+    chars = list(s)
+    for _ in range(rng.randint(0, 2)):
+        if not chars:
+            break
+        i = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.3:
+            del chars[i]
+        elif op < 0.6:
+            chars.insert(i, rng.choice("абвгдеклмнопрст"))
+        elif chars[i] in _RU_TO_LAT_TYPOS:
+            chars[i] = _RU_TO_LAT_TYPOS[chars[i]]
+        else:
+            chars[i] = chars[i].upper()
+    return "".join(chars)
+
+
+def gen_enum_inputs(rng: random.Random, n: int) -> List[tuple]:
+    keys = [k for k in ALLOWED if k != "YesNo"]
+    out = []
+    for _ in range(n):
+        key = rng.choice(keys)
+        value = rng.choice(ALLOWED[key]) if rng.random() < 0.9 else rng.choice(_WORDS)
+        out.append((_misspell(rng, value), key))
+    return out
+
+
+def gen_transcript(rng: random.Random, words: int) -> str:
+    parts = []
+    for i in range(words):
+        parts.append(rng.choice(_WORDS))
+        if i % 17 == 16:
+            parts.append(f"{rng.randint(1, 99)} {rng.randint(100, 999)}")
+    return " ".join(parts)
+
+
+def gen_rows(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    rows = []
+    for _ in range(n):
+        bought = rng.random() < 0.5
+        rows.append({
+            "Date": "2026-03-14",
+            "Time": "15:42",
+            "Client_ID": f"+7 701 {rng.randint(100, 999)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+            "Type_of_client": _misspell(rng, rng.choice(ALLOWED["Type_of_client"])),
+            "Behavior": _misspell(rng, rng.choice(ALLOWED["Behavior"])),
+            "Purchase_status": "купили" if bought else _misspell(rng, rng.choice(ALLOWED["Purchase_status"][1:])),
+            "Ticket_amount": gen_amounts(rng, 1)[0] if bought else "",
+            "Cost_Price": gen_amounts(rng, 1)[0] if bought else "",
+            "Source": _misspell(rng, rng.choice(ALLOWED["Source"])),
+            "Reason_not_buying": "" if bought else _misspell(rng, rng.choice(ALLOWED["Reason_not_buying"])),
+            "Product_name": "флизелиновые обои" if bought else "",
+            "Quantity": str(rng.randint(1, 20)) if bought else "",
+            "Transcription_raw": gen_transcript(rng, rng.randint(50, 400)),
+            "Repeat_visit": rng.choice(["да", "нет", ""]),
+            "Contact_left": rng.choice(["да", "нет", ""]),
+            "Short_note": gen_transcript(rng, rng.randint(0, 30)),
+        })
+    return rows
+
+
+def gen_extractions(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    out = []
+    for _ in range(n):
+        bought = rng.random() < 0.5
+        out.append({
+            "Type_of_client": rng.choice(ALLOWED["Type_of_client"] + [None]),
+            "Behavior": rng.choice(ALLOWED["Behavior"] + [None]),
+            "Purchase_status": "купили" if bought else rng.choice(ALLOWED["Purchase_status"][1:] + [None]),
+            "Ticket_amount": rng.choice([rng.randint(1000, 500000), None]) if bought else None,
+            "Cost_Price": rng.choice([rng.randint(500, 200000), None]) if bought else None,
+            "Source": rng.choice(ALLOWED["Source"] + [None]),
+            "Reason_not_buying": None if bought else rng.choice(ALLOWED["Reason_not_buying"] + [None]),
+            "Product_name": "обои" if bought else None,
+            "Quantity": rng.choice([3, 2.5, None]) if bought else None,
+        })
+    return out
+
+
+# Answers that walk the whole "bought" branch of the state machine
+_ANSWER_SCRIPT = ["новый", "посмотрели", "купили", "15 000", "8 000", "Instagram", "обои 3 рулона", "ничего"]
+
+
+# ============================================================================
+# BENCHMARKS
+# ============================================================================
+
+def build_benchmarks(seed: int = 42) -> Dict[str, Callable[[], int]]:
+    """name -> callable running one pass over its corpus and returning the number of calls made."""
+    rng = random.Random(seed)
+    amounts = gen_amounts(rng, 2000)
+    enum_inputs = gen_enum_inputs(rng, 1000)
+    texts = [gen_transcript(rng, rng.randint(50, 600)) for _ in range(200)]
+    rows = gen_rows(rng, 300)
+    extractions = gen_extractions(rng, 500)
+    transcripts = [gen_transcript(rng, 200) for _ in range(20)]
+    ts = datetime(2026, 3, 14, 15, 42)
+
+    def bench_parse_number():
+        for s in amounts:
+            parse_number(s)
+        return len(amounts)
+
+    def bench_match_enum():
+        for s, key in enum_inputs:
+            match_enum(s, key)
+        return len(enum_inputs)
+
+    def bench_norm_text():
+        for s in texts:
+            norm_text(s)
+        return len(texts)
+
+    def bench_validate_row():
+        for row in rows:
+            validate_and_normalize_row(row)
+        return len(rows)
+
+    def bench_apply_extracted():
+        for i, extracted in enumerate(extractions):
+            ConversationState(transcripts[i % len(transcripts)], ts).apply_extracted_data(extracted)
+        return len(extractions)
+
+    def bench_process_answer():
+        calls = 0
+        for i in range(200):
+            state = ConversationState(transcripts[i % len(transcripts)], ts)
+            for answer in _ANSWER_SCRIPT:
+                if state.is_complete():
+                    break
+                state.process_answer(answer)
+                calls += 1
+        return calls
+
+    return {
+        "parse_number": bench_parse_number,
+        "match_enum": bench_match_enum,
+        "norm_text": bench_norm_text,
+        "validate_and_normalize_row": bench_validate_row,
+        "apply_extracted_data": bench_apply_extracted,
+        "process_answer": bench_process_answer,
+    }
+
+
+def run_benchmarks(names: Optional[List[str]] = None, repeat: int = 7) -> Dict[str, float]:
+    """Returns {name: best microseconds per call}."""
+    import logging
+    # apply_extracted_data logs at INFO per field; keep the harness measuring code, not log I/O
+    logging.disable(logging.INFO)
+    try:
+        results = {}
+        for name, fn in build_benchmarks().items():
+            if names and not any(n in name for n in names):
+                continue
+            fn()  # warm-up (regex compile caches, difflib, allocations)
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                calls = fn()
+                best = min(best, (time.perf_counter() - started) / calls)
+            results[name] = best * 1e6
+        return results
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Names of benchmarks slower than baseline by more than threshold (fraction)."""
+    regressed = []
+    for name, us in results.items():
+        base = baseline.get(name)
+        if base and us > base * (1 + threshold):
+            regressed.append(name)
+    return regressed
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for validator/parser/conversation hot paths.")
+    parser.add_argument("-k", dest="names", action="append", help="Only run benchmarks containing this name")
+    parser.add_argument("--repeat", type=int, default=7, help="Passes per benchmark (best is kept)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results file")
+    parser.add_argument("--save", action="store_true", help="Store results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names, repeat=max(1, args.repeat))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    print(f"{'benchmark':<28} {'us/call':>10} {'baseline':>10} {'change':>8}")
+    for name, us in results.items():
+        base = baseline.get(name)
+        change = f"{(us / base - 1) * 100:+.1f}%" if base else "-"
+        base_s = f"{base:.2f}" if base else "-"
+        print(f"{name:<28} {us:>10.2f} {base_s:>10} {change:>8}")
+
+    if args.save:
+        merged = dict(baseline)
+        merged.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "saved_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": merged,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressed = compare(results, baseline, args.threshold)
+    if regressed:
+        print(f"\nREGRESSION (> {args.threshold:.0%} slower than baseline): {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
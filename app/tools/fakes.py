@@ -0,0 +1,336 @@
+# app/tools/fakes.py
+"""
+Local HTTP stand-ins for the Telegram Bot API, Gemini, Google Sheets/Drive and
+an OTLP trace collector.
+
+Each fake runs a stdlib ThreadingHTTPServer on 127.0.0.1 in a background
+thread, answers just the endpoints the bot uses, and can inject latency and
+errors so the real handlers can be load-tested offline:
+
+    tg = FakeTelegramServer(latency=(0.02, 0.05), error_rate=0.01).start()
+    os.environ["TELEGRAM_API_BASE_URL"] = tg.url
+"""
+import json
+import time
+import random
+import threading
+import itertools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict, Any, Optional, Tuple, List
+
+
+class FakeServer:
+    """Base class: threaded HTTP server with latency/error injection."""
+
+    def __init__(self, latency: Tuple[float, float] = (0.0, 0.0), error_rate: float = 0.0,
+                 error_status: int = 500):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with fake._lock:
+                    fake.requests += 1
+                lo, hi = fake.latency
+                if hi > 0:
+                    time.sleep(random.uniform(lo, hi))
+                if fake.error_rate and random.random() < fake.error_rate:
+                    with fake._lock:
+                        fake.errors += 1
+                    return self._reply(fake.error_status, fake.error_body(fake.error_status))
+                parts = urlsplit(self.path)
+                status, payload = fake.handle(self.command, parts.path, parse_qs(parts.query), body,
+                                              self.headers.get("Content-Type", ""))
+                self._reply(status, payload)
+
+            def _reply(self, status: int, payload):
+                if isinstance(payload, (bytes, bytearray)):
+                    data, ctype = bytes(payload), "application/octet-stream"
+                else:
+                    data, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = _serve
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def error_body(self, status: int):
+        return {"error": {"code": status, "message": "injected error"}}
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: bytes,
+               content_type: str) -> Tuple[int, Any]:
+        raise NotImplementedError
+
+
+# ============================================================================
+# TELEGRAM BOT API
+# ============================================================================
+
+class FakeTelegramServer(FakeServer):
+    """
+    Minimal Bot API: getMe, sendMessage, editMessageText, getFile and file downloads.
+    Voice files are registered up front with register_file(); sent messages are kept in `sent`.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.sent: List[Dict[str, Any]] = []
+        self._message_ids = itertools.count(1_000_000)
+
+    def error_body(self, status: int):
+        return {"ok": False, "error_code": status, "description": "injected error"}
+
+    def register_file(self, file_id: str, content: bytes, transcript: str = ""):
+        self.files[file_id] = {"content": content, "transcript": transcript}
+
+    def _params(self, body: bytes, content_type: str, query) -> Dict[str, Any]:
+        if "application/json" in content_type and body:
+            return json.loads(body)
+        if body:
+            return {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+        return {k: v[0] for k, v in query.items()}
+
+    def handle(self, method, path, query, body, content_type):
+        # /file/bot<token>/<file_path>
+        if path.startswith("/file/bot"):
+            file_id = path.rsplit("/", 1)[-1]
+            f = self.files.get(file_id)
+            return (200, f["content"]) if f else (404, {"ok": False, "description": "file not found"})
+
+        # /bot<token>/<method>
+        api_method = path.rsplit("/", 1)[-1]
+        params = self._params(body, content_type, query)
+        now = int(time.time())
+
+        if api_method == "getMe":
+            return 200, {"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "ReplayBot", "username": "replay_bot",
+                "can_join_groups": False, "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }}
+        if api_method in ("sendMessage", "editMessageText", "sendDocument"):
+            chat_id = int(params.get("chat_id") or 0)
+            message = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": now,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+            with self._lock:
+                self.sent.append({"method": api_method, "chat_id": chat_id, "text": params.get("text", "")})
+            return 200, {"ok": True, "result": message}
+        if api_method == "getFile":
+            file_id = params.get("file_id", "")
+            f = self.files.get(file_id)
+            if not f:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}
+            return 200, {"ok": True, "result": {
+                "file_id": file_id, "file_unique_id": file_id,
+                "file_size": len(f["content"]), "file_path": f"voice/{file_id}",
+            }}
+        if api_method in ("deleteWebhook", "setWebhook", "setMyCommands", "close", "logOut"):
+            return 200, {"ok": True, "result": True}
+        if api_method == "getUpdates":
+            return 200, {"ok": True, "result": []}
+        return 404, {"ok": False, "error_code": 404, "description": f"Not Found: {api_method}"}
+
+
+# ============================================================================
+# GEMINI
+# ============================================================================
+
+class FakeGeminiServer(FakeServer):
+    """
+    Answers models/*:generateContent with a canned extraction (and :countTokens
+    with a rough len/4 estimate).
+    `responder(prompt_text) -> dict` decides the JSON the "model" returns.
+    """
+
+    def __init__(self, responder=None, **kwargs):
+        super().__init__(**kwargs)
+        self.responder = responder or (lambda prompt: {})
+
+    def handle(self, method, path, query, body, content_type):
+        if not path.endswith((":generateContent", ":countTokens")):
+            return 404, {"error": {"code": 404, "message": f"unknown path {path}"}}
+        req = json.loads(body or b"{}")
+        prompt = "".join(
+            part.get("text", "")
+            for content in req.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        if path.endswith(":countTokens"):
+            return 200, {"totalTokens": len(prompt) // 4}
+        answer = self.responder(prompt)
+        text = answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False)
+        return 200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+            }],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": (len(prompt) + len(text)) // 4,
+            },
+        }
+
+
+# ============================================================================
+# GOOGLE SHEETS / DRIVE
+# ============================================================================
+
+class FakeSheetsServer(FakeServer):
+    """
+    Enough of Drive v3 + Sheets v4 for gspread's open(), worksheet(), row_values(),
+    col_values(), append_row(s) and get_all_values(). Appended rows are kept in memory per worksheet.
+    """
+
+    SPREADSHEET_ID = "fake-spreadsheet"
+
+    def __init__(self, title: str, worksheets: Dict[str, List[str]], **kwargs):
+        super().__init__(**kwargs)
+        self.title = title
+        # worksheet title -> rows (first row is the header)
+        self.sheets: Dict[str, List[List[Any]]] = {name: [list(header)] for name, header in worksheets.items()}
+
+    def _range_sheet(self, rng: str) -> str:
+        name = rng.split("!", 1)[0]
+        return name.strip("'")
+
+    def handle(self, method, path, query, body, content_type):
+        if path.startswith("/drive/v3/files"):
+            return 200, {"files": [{"id": self.SPREADSHEET_ID, "name": self.title,
+                                    "createdTime": "2026-01-01T00:00:00Z",
+                                    "modifiedTime": "2026-01-01T00:00:00Z"}]}
+
+        prefix = f"/v4/spreadsheets/{self.SPREADSHEET_ID}"
+        if not path.startswith(prefix):
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+        rest = path[len(prefix):]
+
+        if rest == "":
+            return 200, {
+                "spreadsheetId": self.SPREADSHEET_ID,
+                "properties": {"title": self.title},
+                "sheets": [
+                    {"properties": {"sheetId": i, "title": name, "index": i,
+                                    "gridProperties": {"rowCount": 1000, "columnCount": 26}}}
+                    for i, name in enumerate(self.sheets)
+                ],
+            }
+
+        if rest == "/values:batchUpdate":
+            data = json.loads(body or b"{}").get("data", [])
+            with self._lock:
+                for item in data:
+                    name = self._range_sheet(item["range"])
+                    cells = item["range"].split("!", 1)[-1].split(":")[0]
+                    row_no = int("".join(ch for ch in cells if ch.isdigit()))
+                    col = 0
+                    for ch in "".join(ch for ch in cells if ch.isalpha()).upper():
+                        col = col * 26 + ord(ch) - 64
+                    sheet = self.sheets.setdefault(name, [[]])
+                    while len(sheet) < row_no:
+                        sheet.append([])
+                    # Values replace the row from the range's first column on
+                    row = list(sheet[row_no - 1][:col - 1])
+                    row += [""] * (col - 1 - len(row))
+                    sheet[row_no - 1] = row + item["values"][0]
+            return 200, {"spreadsheetId": self.SPREADSHEET_ID, "totalUpdatedRows": len(data)}
+
+        if rest.startswith("/values/"):
+            from urllib.parse import unquote
+            rng = unquote(rest[len("/values/"):])
+            if rng.endswith(":append"):
+                rng = rng[:-len(":append")]
+                name = self._range_sheet(rng)
+                rows = json.loads(body or b"{}").get("values", [])
+                with self._lock:
+                    sheet = self.sheets.setdefault(name, [[]])
+                    start = len(sheet) + 1
+                    sheet.extend(rows)
+                    end = len(sheet)
+                return 200, {
+                    "spreadsheetId": self.SPREADSHEET_ID,
+                    "updates": {"updatedRange": f"'{name}'!A{start}:Z{end}", "updatedRows": len(rows)},
+                }
+            name = self._range_sheet(rng)
+            with self._lock:
+                sheet = [list(r) for r in self.sheets.get(name, [])]
+            # "P1:P"-style column reads (col_values), "A1:Z1"-style single-row reads
+            # (row_values) and whole-sheet reads
+            if query.get("majorDimension") == ["COLUMNS"] and "!" in rng:
+                letters = "".join(ch for ch in rng.split("!", 1)[1].split(":")[0] if ch.isalpha())
+                col = 0
+                for ch in letters.upper():
+                    col = col * 26 + ord(ch) - 64
+                values = [r[col - 1] if len(r) >= col else "" for r in sheet]
+                while values and values[-1] == "":
+                    values.pop()
+                return 200, {"range": rng, "majorDimension": "COLUMNS", "values": [values] if values else []}
+            if "!" in rng:
+                cells = rng.split("!", 1)[1]
+                digits = "".join(ch for ch in cells.split(":")[0] if ch.isdigit())
+                if digits:
+                    row_no = int(digits)
+                    sheet = sheet[row_no - 1:row_no]
+            return 200, {"range": rng, "majorDimension": "ROWS", "values": sheet}
+
+        return 404, {"error": {"code": 404, "message": f"unsupported path {path}"}}
+
+
+# ============================================================================
+# OTLP COLLECTOR
+# ============================================================================
+
+class FakeCollectorServer(FakeServer):
+    """Accepts OTLP/HTTP JSON on /v1/traces and keeps the received spans in `spans`."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.spans: List[Dict[str, Any]] = []
+
+    def handle(self, method, path, query, body, content_type):
+        if path != "/v1/traces":
+            return 404, {"error": f"unknown path {path}"}
+        req = json.loads(body or b"{}")
+        with self._lock:
+            for rs in req.get("resourceSpans", []):
+                for ss in rs.get("scopeSpans", []):
+                    self.spans.extend(ss.get("spans", []))
+        return 200, {}
@@ -0,0 +1,137 @@
+# app/tools/prompt_report.py
+"""
+Compare the extraction prompt against the original (v1) free-text prompt.
+
+v1 inlined the ALLOWED lists as Python reprs and a JSON template into a long
+f-string and relied on response_mime_type alone. The current prompt is a short
+precompiled template; the allowed values travel in the response schema.
+
+For each sample transcript this reports prompt size in characters and tokens
+(via the free countTokens endpoint) for both versions, and with --live N also
+runs N real extractions per version and compares billed tokens (which include
+the response schema, unlike countTokens) and latency.
+
+Usage:
+    python -m app.tools.prompt_report                     # built-in samples, token counts only
+    python -m app.tools.prompt_report --transcripts transcripts.jsonl --limit 20 --live 5
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import List, Optional, Dict, Any
+
+from app.services.ai_extractor import MODEL_ID, build_prompt, get_client, _config, parse_fields
+from app.services.validator import ALLOWED
+
+SAMPLES = [
+    "оптовик купила обоев на пятьдесят тысяч себестоимость двадцать тысяч тенге пришла по рекомендации",
+    "новый клиент зашел посмотрел каталог сказал дорого уйдет подумает узнал из инстаграма",
+    "мастер замерял комнату взял флизелиновые обои шесть рулонов на восемьдесят пять тысяч",
+]
+
+
+def legacy_prompt(transcription_text: str) -> str:
+    """The v1 prompt, verbatim, for comparison only."""
+    return f"""Ты помощник по внесению данных для магазина обоев.
+
+Проанализируй текст разговора с клиентом и заполни JSON со следующими полями:
+
+- Type_of_client: ОДНО значение ИЗ СПИСКА {ALLOWED['Type_of_client']} или null.
+- Behavior: ОДНО значение ИЗ СПИСКА {ALLOWED['Behavior']} или null.
+- Purchase_status: ОДНО значение ИЗ СПИСКА {ALLOWED['Purchase_status']} или null.
+- Reason_not_buying: ОДНО значение ИЗ СПИСКА {ALLOWED['Reason_not_buying']} или null.
+- Source: ОДНО значение ИЗ СПИСКА {ALLOWED['Source']} или null.
+- Ticket_amount: число (сумма чека в тенге) или null.
+- Cost_Price: число (себестоимость в тенге) или null.
+- Product_name: что именно продали (текст) или null.
+- Quantity: количество (число) или null.
+
+Важно:
+- НЕ придумывай значения. ЕСЛИ ТЫ НЕ УВЕРЕН или информация явно не сказана — ставь null.
+- Если в тексте есть фразы про покупку (например, «оптовик купила обоев на пятьдесят тысяч»), тогда:
+  - Purchase_status = "купили"
+  - Type_of_client = подходящее значение из списка (например, "оптовик")
+  - Ticket_amount = соответствующее число (например, 50000)
+- Если есть слова про себестоимость («себестоимость двадцать тысяч тенге»), то это Cost_Price.
+- Если покупка не состоялась, а есть причина, выбери подходящую Reason_not_buying, иначе null.
+- Не добавляй никаких других полей, только перечисленные.
+
+Текст транскрипции (на русском/казахском разговорном языке):
+\"\"\"{transcription_text}\"\"\"
+
+Верни ТОЛЬКО один JSON без комментариев, без пояснений, строго в формате:
+
+{{
+  "Type_of_client": ...,
+  "Behavior": ...,
+  "Purchase_status": ...,
+  "Ticket_amount": ...,
+  "Cost_Price": ...,
+  "Source": ...,
+  "Reason_not_buying": ...,
+  "Product_name": ...,
+  "Quantity": ...
+}}
+"""
+
+
+def _count_tokens(client, prompt: str) -> int:
+    return client.models.count_tokens(model=MODEL_ID, contents=prompt).total_tokens or 0
+
+
+def _live(client, prompt: str, config) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = client.models.generate_content(model=MODEL_ID, contents=prompt, config=config)
+    usage = response.usage_metadata
+    return {
+        "latency_ms": (time.perf_counter() - started) * 1000,
+        "prompt_tokens": (usage.prompt_token_count or 0) if usage else 0,
+        "output_tokens": (usage.candidates_token_count or 0) if usage else 0,
+        "fields": sum(v is not None for v in parse_fields(response.text or "").values()),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare the v1 and current extraction prompts.")
+    parser.add_argument("--transcripts", help="JSONL from batch_transcribe (default: built-in samples)")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--live", type=int, default=0, help="Also run N real extractions per prompt version")
+    args = parser.parse_args(argv)
+
+    texts = SAMPLES
+    if args.transcripts:
+        with open(args.transcripts, "r", encoding="utf-8") as f:
+            texts = [e["text"] for e in map(json.loads, f) if e.get("text")]
+    texts = texts[:max(1, args.limit)]
+
+    client = get_client()
+    if client is None:
+        parser.error("GOOGLE_API_KEY not set")
+    from google.genai import types
+    legacy_config = types.GenerateContentConfig(response_mime_type="application/json")
+
+    chars_old = statistics.mean(len(legacy_prompt(t)) for t in texts)
+    chars_new = statistics.mean(len(build_prompt(t)) for t in texts)
+    tok_old = statistics.mean(_count_tokens(client, legacy_prompt(t)) for t in texts)
+    tok_new = statistics.mean(_count_tokens(client, build_prompt(t)) for t in texts)
+    print(f"{len(texts)} transcripts, model {MODEL_ID}")
+    print(f"prompt chars/call:  v1 {chars_old:.0f}  now {chars_new:.0f}  saved {chars_old - chars_new:.0f}")
+    print(f"prompt tokens/call: v1 {tok_old:.0f}  now {tok_new:.0f}  saved {tok_old - tok_new:.0f} "
+          f"({(1 - tok_new / tok_old) * 100 if tok_old else 0:.0f}%)")
+
+    if args.live:
+        old, new = [], []
+        for t in texts[:args.live]:
+            old.append(_live(client, legacy_prompt(t), legacy_config))
+            new.append(_live(client, build_prompt(t), _config("single")))
+        for key in ("prompt_tokens", "output_tokens", "latency_ms", "fields"):
+            a = statistics.mean(r[key] for r in old)
+            b = statistics.mean(r[key] for r in new)
+            print(f"live {key + ':':<15} v1 {a:8.1f}  now {b:8.1f}  saved {a - b:8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+# app/tools/replay.py
+"""
+Offline replay / load-test harness.
+
+Drives the real handlers from app.bot (voice_handler, collect_data,
+finalize_and_save, ...) through recorded Telegram update sequences, with the
+Bot API, Gemini and Google Sheets replaced by the local fakes in
+app.tools.fakes. Reports p50/p95/p99 per stage and messages per second.
+
+Recordings are JSONL, one Telegram Update dict per line (as returned by
+getUpdates). Updates are grouped by chat and replayed in order per chat;
+`--copies N` clones every chat N times under fresh chat ids. A voice update may
+carry a non-standard "_transcript" key used by the STT stand-in (--fake-stt).
+Without --recording, a synthetic "voice note + /skip" visit per chat is used.
+
+Usage:
+    python -m app.tools.replay --copies 50 --concurrency 20 --fake-stt \\
+        --tg-latency 0.02 0.06 --gemini-latency 0.3 0.8 --sheets-latency 0.2 0.5 --error-rate 0.02
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from app.tools.fakes import FakeTelegramServer, FakeGeminiServer, FakeSheetsServer, FakeCollectorServer
+
+logger = logging.getLogger(__name__)
+
+WORKSHEET = "Offline Traffic"
+
+SYNTHETIC_TRANSCRIPT = (
+    "новый клиент зашел посмотрел каталог купил флизелиновые обои три рулона "
+    "на пятьдесят тысяч себестоимость двадцать тысяч узнал из инстаграма"
+)
+SYNTHETIC_EXTRACTION = {
+    "Type_of_client": "новый",
+    "Behavior": "посмотрели",
+    "Purchase_status": "купили",
+    "Ticket_amount": 50000,
+    "Cost_Price": 20000,
+    "Source": "Instagram",
+    "Reason_not_buying": None,
+    "Product_name": "флизелиновые обои",
+    "Quantity": 3,
+}
+
+
+def load_recording(path: str) -> List[List[Dict[str, Any]]]:
+    """Group recorded updates by chat id, keeping per-chat order."""
+    chats: "OrderedDict[int, List[Dict[str, Any]]]" = OrderedDict()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            upd = json.loads(line)
+            chat_id = (upd.get("message") or {}).get("chat", {}).get("id", 0)
+            chats.setdefault(chat_id, []).append(upd)
+    return list(chats.values())
+
+
+def synthetic_sequence(chat_id: int) -> List[Dict[str, Any]]:
+    """One visit: a voice note the fake Gemini fully extracts, then /skip for the short note."""
+    now = int(time.time())
+    user = {"id": chat_id, "is_bot": False, "first_name": "Replay"}
+    chat = {"id": chat_id, "type": "private"}
+    return [
+        {"update_id": 0, "message": {
+            "message_id": 1, "date": now, "chat": chat, "from": user,
+            # ~12 s of Telegram opus is about 20 KB; the fake serves that many zero bytes
+            "voice": {"file_id": "synthetic", "file_unique_id": "synthetic", "duration": 12, "file_size": 20000},
+            "_transcript": SYNTHETIC_TRANSCRIPT,
+        }},
+        {"update_id": 0, "message": {
+            "message_id": 2, "date": now, "chat": chat, "from": user, "text": "/skip",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+        }},
+    ]
+
+
+def clone_sequences(sequences: List[List[Dict[str, Any]]], copies: int) -> List[List[Dict[str, Any]]]:
+    """Clone each chat's sequence `copies` times under distinct chat/user ids and unique update ids."""
+    out = []
+    update_id = 1
+    base_chat = 10_000_000
+    for copy_i in range(copies):
+        for seq_i, seq in enumerate(sequences):
+            chat_id = base_chat + copy_i * len(sequences) + seq_i
+            cloned = []
+            for upd in seq:
+                upd = json.loads(json.dumps(upd))
+                upd["update_id"] = update_id
+                update_id += 1
+                msg = upd.get("message") or {}
+                if "chat" in msg:
+                    msg["chat"]["id"] = chat_id
+                if "from" in msg:
+                    msg["from"]["id"] = chat_id
+                voice = msg.get("voice") or msg.get("audio")
+                if voice:
+                    # Distinct file ids per clone so concurrent downloads don't share a temp path
+                    voice.setdefault("_source_id", voice["file_id"])
+                    voice["file_id"] = voice["file_unique_id"] = f"{voice['_source_id']}-{chat_id}"
+                cloned.append(upd)
+            out.append(cloned)
+    return out
+
+
+def _register_voice_files(tg: FakeTelegramServer, sequences, audio_dir: Optional[str]) -> Dict[str, str]:
+    """Serve every referenced voice file from the fake Bot API; return file_unique_id -> transcript."""
+    transcripts = {}
+    for seq in sequences:
+        for upd in seq:
+            msg = upd.get("message") or {}
+            voice = msg.get("voice") or msg.get("audio")
+            if not voice:
+                continue
+            source_id = voice.pop("_source_id", voice["file_id"])
+            content = b""
+            if audio_dir:
+                candidate = os.path.join(audio_dir, f"{source_id}.ogg")
+                if os.path.exists(candidate):
+                    with open(candidate, "rb") as f:
+                        content = f.read()
+            if not content and voice.get("file_size"):
+                content = bytes(voice["file_size"])
+            tg.register_file(voice["file_id"], content, msg.get("_transcript", ""))
+            transcripts[voice["file_unique_id"]] = msg.pop("_transcript", "")
+    return transcripts
+
+
+async def replay(sequences, concurrency: int) -> Dict[str, Any]:
+    """Replay sequences through the real Application. Chats run concurrently, updates within a chat in order."""
+    from telegram import Update
+    from app.bot import build_application, wait_for_syncs
+    from app.services.metrics import timed
+    from app.services.tracing import start_trace
+
+    app = build_application()
+    await app.initialize()
+    sem = asyncio.Semaphore(concurrency)
+    processed = 0
+    failed = 0
+
+    async def run_chat(seq):
+        nonlocal processed, failed
+        async with sem:
+            for raw in seq:
+                update = Update.de_json(raw, app.bot)
+                try:
+                    # app.process_update skips the update processor, so open the root span here
+                    with start_trace("update", update_id=update.update_id), timed("update"):
+                        await app.process_update(update)
+                    processed += 1
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Update {raw.get('update_id')} failed: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_chat(seq) for seq in sequences))
+    await wait_for_syncs()  # saves reply before the rows reach the sheet
+    wall = time.perf_counter() - started
+    await app.shutdown()
+    return {"updates": processed, "failed": failed, "wall_seconds": wall}
+
+
+def _print_slowest_spans(spans: List[Dict[str, Any]], top: int = 10):
+    """Slowest non-root spans received by the OTLP stand-in."""
+    def ms(s):
+        return (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+
+    # Skip the roots and the harness's own "update" timer nested right under them
+    children = sorted((s for s in spans if s.get("parentSpanId") and s["name"] != "update"),
+                      key=ms, reverse=True)
+    traces = len({s["traceId"] for s in spans})
+    print(f"\n{len(spans)} spans in {traces} traces; slowest stages:")
+    for s in children[:top]:
+        attrs = ", ".join(f"{a['key']}={next(iter(a['value'].values()))}" for a in s.get("attributes", []))
+        print(f"  {ms(s):>9.1f} ms  {s['name']:<22} trace {s['traceId'][:8]}  {attrs}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay recorded updates against local fakes.")
+    parser.add_argument("--recording", help="JSONL of Telegram updates (default: synthetic visits)")
+    parser.add_argument("--audio-dir", help="Directory with <file_id>.ogg files for recorded voice notes")
+    parser.add_argument("--copies", type=int, default=10, help="Clone each recorded chat N times")
+    parser.add_argument("--concurrency", type=int, default=10, help="Chats replayed at the same time")
+    parser.add_argument("--fake-stt", action="store_true", help="Use recorded _transcript instead of Vosk")
+    parser.add_argument("--stt-latency", type=float, nargs=2, default=(0.5, 1.5), metavar=("MIN", "MAX"))
+    parser.add_argument("--tg-latency", type=float, nargs=2, default=(0.0, 0.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--gemini-latency", type=float, nargs=2, default=(0.0, 0.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--sheets-latency", type=float, nargs=2, default=(0.0, 0.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Injected error rate for Gemini and Sheets")
+    parser.add_argument("--workdir", help="Where local journals are written (default: temp dir)")
+    parser.add_argument("--trace", action="store_true",
+                        help="Export every trace to a local OTLP stand-in and print the slowest spans")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    sheet_name = os.getenv("SPREADSHEET_NAME", "Anuar Traffic 2026")
+    from app.services.validator import SHEET_COLUMNS
+
+    tg = FakeTelegramServer(latency=tuple(args.tg_latency)).start()
+    gemini = FakeGeminiServer(
+        responder=lambda prompt: SYNTHETIC_EXTRACTION,
+        latency=tuple(args.gemini_latency), error_rate=args.error_rate, error_status=429,
+    ).start()
+    sheets = FakeSheetsServer(
+        sheet_name, {WORKSHEET: SHEET_COLUMNS},
+        latency=tuple(args.sheets_latency), error_rate=args.error_rate,
+    ).start()
+
+    # Must be set before app.bot / services are imported (they read env at import time)
+    os.environ["TELEGRAM_TOKEN"] = "123456:REPLAY"
+    os.environ["TELEGRAM_API_BASE_URL"] = tg.url
+    os.environ["GEMINI_BASE_URL"] = gemini.url
+    os.environ["SHEETS_API_BASE_URL"] = sheets.url
+    os.environ.setdefault("GOOGLE_API_KEY", "replay")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    collector = None
+    if args.trace:
+        collector = FakeCollectorServer().start()
+        os.environ["TRACE_OTLP_ENDPOINT"] = collector.url
+        os.environ["TRACE_TAIL_RATE"] = "1.0"
+    workdir = args.workdir or tempfile.mkdtemp(prefix="replay-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    if args.recording:
+        base = load_recording(args.recording)
+    else:
+        base = [synthetic_sequence(1)]
+    sequences = clone_sequences(base, max(1, args.copies))
+    transcripts = _register_voice_files(tg, sequences, args.audio_dir)
+
+    import app.bot as bot
+    if args.fake_stt:
+        lo, hi = args.stt_latency
+
+        def fake_transcribe(source) -> str:
+            # A path, or a BytesIO named after the file for in-memory downloads
+            time.sleep(random.uniform(lo, hi))
+            name = os.path.basename(getattr(source, "name", source))
+            return transcripts.get(name.rsplit(".", 1)[0], "")
+
+        bot.transcribe = fake_transcribe
+
+    try:
+        result = asyncio.run(replay(sequences, max(1, args.concurrency)))
+        if collector:
+            from app.services.tracing import flush
+            flush()
+    finally:
+        for server in (tg, gemini, sheets, collector):
+            if server:
+                server.stop()
+
+    from app.services.metrics import summary
+    print(f"{'stage':<10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, s in summary().items():
+        print(f"{stage:<10} {s['count']:>6} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9}")
+    from app.services.breaker import stats as breaker_stats
+    for name, b in breaker_stats().items():
+        print(f"breaker {name:<16} {b['state']:<9} calls {b['calls']}, failures {b['failures']}, "
+              f"rejected {b['rejected']}, trips {b['trips']}")
+    rows = len(sheets.sheets.get(WORKSHEET, [])) - 1
+    print(
+        f"\n{result['updates']} updates ({result['failed']} failed) in {result['wall_seconds']:.2f}s "
+        f"= {result['updates'] / result['wall_seconds']:.1f} msg/s at concurrency {args.concurrency}; "
+        f"{rows} rows written, {gemini.errors + sheets.errors} injected errors"
+    )
+    if collector:
+        _print_slowest_spans(collector.spans)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# app/tools/stt_bench.py
+"""
+Compare STT backends on a local fixture set of shop voice notes.
+
+Fixtures are audio files with the reference transcript next to them in a
+same-named .txt file (note_01.ogg + note_01.txt); a manifest with one audio
+path per line works as well. Files without a reference are timed but left out
+of the WER.
+
+Each backend runs in a fresh process, so model loading and peak memory are
+measured in isolation. Reported per backend:
+    load      model load time (s)
+    rtf       real-time factor = decode time / audio duration (lower is faster)
+    p95 rtf   95th percentile of per-note RTF
+    rss       peak resident memory of the process (MB)
+    wer       corpus word error rate against the references (case, punctuation
+              and ё/е ignored)
+
+Usage:
+    python -m app.tools.stt_bench fixtures/ -b vosk whisper
+    WHISPER_MODEL=medium python -m app.tools.stt_bench fixtures/ -b whisper --json whisper-medium.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.services.metrics import percentile
+from app.services.stt import available_backends
+from app.tools.batch_transcribe import collect_inputs
+
+logger = logging.getLogger(__name__)
+
+_word_re = re.compile(r"[0-9a-zа-я]+")
+
+
+def load_reference(audio_path: str) -> Optional[str]:
+    ref_path = os.path.splitext(audio_path)[0] + ".txt"
+    if not os.path.exists(ref_path):
+        return None
+    with open(ref_path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def _words(text: str) -> List[str]:
+    return _word_re.findall((text or "").lower().replace("ё", "е"))
+
+
+def word_errors(reference: str, hypothesis: str) -> Tuple[int, int]:
+    """(substitutions + deletions + insertions, reference word count) by word-level edit distance."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1], len(ref)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _bench_backend(name: str, paths: List[str]) -> Dict[str, Any]:
+    """Runs in its own process: load the model, transcribe every path, report timings and memory."""
+    from app.services.stt import get_backend
+
+    backend = get_backend(name)
+    rss_before = _peak_rss_mb()
+    started = time.perf_counter()
+    backend.warm_up()
+    load_s = time.perf_counter() - started
+    rss_loaded = _peak_rss_mb()
+
+    notes = []
+    for path in paths:
+        t0 = time.perf_counter()
+        try:
+            result = backend.transcribe_detailed(path)
+        except Exception as e:
+            notes.append({"path": path, "error": str(e)})
+            continue
+        notes.append({
+            "path": path,
+            "text": result["text"],
+            "duration": result["duration"],
+            "elapsed": time.perf_counter() - t0,
+        })
+    return {
+        "backend": name,
+        "load_s": load_s,
+        "rss_base_mb": rss_before,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": _peak_rss_mb(),
+        "notes": notes,
+    }
+
+
+def summarize(run: Dict[str, Any], references: Dict[str, str]) -> Dict[str, Any]:
+    ok = [n for n in run["notes"] if "error" not in n]
+    audio = sum(n["duration"] for n in ok)
+    elapsed = sum(n["elapsed"] for n in ok)
+    rtfs = sorted(n["elapsed"] / n["duration"] for n in ok if n["duration"])
+    edits = ref_words = 0
+    for n in ok:
+        ref = references.get(n["path"])
+        if ref is not None:
+            e, w = word_errors(ref, n["text"])
+            edits += e
+            ref_words += w
+    return {
+        "backend": run["backend"],
+        "notes": len(ok),
+        "failed": len(run["notes"]) - len(ok),
+        "audio_s": round(audio, 1),
+        "load_s": round(run["load_s"], 2),
+        "rtf": round(elapsed / audio, 3) if audio else None,
+        "rtf_p95": round(percentile(rtfs, 0.95), 3) if rtfs else None,
+        "rss_model_mb": round(run["rss_loaded_mb"] - run["rss_base_mb"], 1),
+        "rss_peak_mb": round(run["rss_peak_mb"], 1),
+        "wer": round(edits / ref_words, 3) if ref_words else None,
+        "ref_words": ref_words,
+    }
+
+
+def _fmt(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare STT backends: real-time factor, memory, WER.")
+    parser.add_argument("source", help="Fixture directory (audio + same-named .txt references) or manifest")
+    parser.add_argument("-b", "--backends", nargs="+", default=["vosk"], choices=available_backends())
+    parser.add_argument("-n", "--limit", type=int, help="Only the first N fixtures")
+    parser.add_argument("--json", help="Also write the summaries and per-note hypotheses here")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    paths = collect_inputs(args.source)[:args.limit]
+    if not paths:
+        parser.error(f"No audio files found in {args.source}")
+    references = {p: ref for p in paths if (ref := load_reference(p)) is not None}
+    logger.info(f"{len(paths)} fixtures, {len(references)} with reference transcripts")
+
+    summaries, runs = [], []
+    # spawn: each backend starts from a clean interpreter, so RSS is its own
+    ctx = multiprocessing.get_context("spawn")
+    for name in args.backends:
+        logger.info(f"Benchmarking {name}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            try:
+                run = pool.submit(_bench_backend, name, paths).result()
+            except Exception as e:
+                logger.error(f"{name} failed: {e}")
+                continue
+        runs.append(run)
+        summaries.append(summarize(run, references))
+
+    print(f"{'backend':<10} {'notes':>5} {'fail':>4} {'audio s':>8} {'load s':>7} {'rtf':>6} "
+          f"{'p95 rtf':>7} {'model MB':>8} {'peak MB':>8} {'wer':>6}")
+    for s in summaries:
+        print(f"{s['backend']:<10} {s['notes']:>5} {s['failed']:>4} {s['audio_s']:>8} {s['load_s']:>7} "
+              f"{_fmt(s['rtf'], '.3f'):>6} {_fmt(s['rtf_p95'], '.3f'):>7} {s['rss_model_mb']:>8} "
+              f"{s['rss_peak_mb']:>8} {_fmt(s['wer'], '.3f'):>6}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summaries": summaries, "runs": runs}, f, ensure_ascii=False, indent=2)
+    return 0 if len(summaries) == len(args.backends) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# app/tools/train_classifier.py
+"""
+Train the local enum classifier (app.services.enum_classifier) on labeled visits.
+
+Rows need Transcription_raw plus the chosen Type_of_client / Behavior /
+Purchase_status / Reason_not_buying / Source. They can come from the local
+visit store, straight from a shop's worksheet, or from a CSV export of it.
+Prints held-out accuracy, how many rows clear the confidence threshold (and how
+accurate those are), and the prediction latency, then writes the model.
+
+Usage:
+    python -m app.tools.train_classifier --from-store
+    python -m app.tools.train_classifier --from-sheet --shop default
+    python -m app.tools.train_classifier --csv export.csv -o enum_classifier.json
+"""
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import statistics
+from typing import List, Dict, Any, Optional
+
+from app.services import enum_classifier
+from app.services.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+
+def rows_from_store() -> List[Dict[str, Any]]:
+    from app.services.visit_store import query
+    return [json.loads(r["data"]) for r in query("SELECT data FROM visits")]
+
+
+def rows_from_sheet(shop: Optional[str]) -> List[Dict[str, Any]]:
+    from app.services.sheets import get_worksheet
+    ws, _header = get_worksheet(shop)
+    return ws.get_all_records()
+
+
+def rows_from_csv(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Train the local enum classifier on labeled visits.")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--from-store", action="store_true", help="Visits in the local SQLite store")
+    src.add_argument("--from-sheet", action="store_true", help="Rows of a shop's worksheet")
+    src.add_argument("--csv", help="CSV export of the worksheet (header row = sheet columns)")
+    parser.add_argument("--shop", help="With --from-sheet: shop name (default shop if omitted)")
+    parser.add_argument("-o", "--output", default=enum_classifier.CLASSIFIER_PATH, help="Model JSON path")
+    parser.add_argument("--min-confidence", type=float, default=enum_classifier.CLASSIFIER_MIN_CONFIDENCE)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of rows used for calibration/eval")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.from_store:
+        rows = rows_from_store()
+    elif args.from_sheet:
+        rows = rows_from_sheet(args.shop)
+    else:
+        rows = rows_from_csv(args.csv)
+
+    started = time.perf_counter()
+    try:
+        model, report = enum_classifier.train(rows, holdout=args.holdout, min_confidence=args.min_confidence)
+    except ValueError as e:
+        parser.error(str(e))
+    enum_classifier.save_model(model, args.output)
+    print(f"Trained on {report['rows']} rows ({report['holdout']} held out) in "
+          f"{time.perf_counter() - started:.1f}s -> {args.output}")
+    print(f"{'field':<18} {'classes':>7} {'acc':>6} {'cover':>6} {'acc@conf':>8} {'temp':>7}")
+    for field, r in report["fields"].items():
+        conf_acc = "-" if r["confident_accuracy"] is None else f"{r['confident_accuracy']:.3f}"
+        print(f"{field:<18} {r['classes']:>7} {r['accuracy']:>6.3f} {r['coverage']:>6.3f} "
+              f"{conf_acc:>8} {r['temperature']:>7.2f}")
+
+    # Prediction latency on the training texts, with the freshly written model
+    enum_classifier.CLASSIFIER_PATH = args.output
+    texts = [r.get("Transcription_raw") for r in rows if r.get("Transcription_raw")][:500]
+    timings = []
+    for t in texts:
+        t0 = time.perf_counter()
+        enum_classifier.predict(t)
+        timings.append((time.perf_counter() - t0) * 1e6)
+    if timings:
+        timings.sort()
+        print(f"predict: p50 {statistics.median(timings):.0f} µs, "
+              f"p95 {percentile(timings, 0.95):.0f} µs over {len(timings)} transcripts "
+              f"(min confidence {args.min_confidence})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# app/update_processor.py
+"""
+Concurrent update processing that keeps per-chat order.
+
+PTB's concurrent_updates lets a slow step (STT, Gemini, Sheets) of one user stop
+blocking everyone else, but on its own it would also let two messages from the
+same chat race through the ConversationHandler. PerChatUpdateProcessor runs up
+to `max_concurrent_updates` updates at once while updates from the same chat
+are processed strictly one after another, in arrival order.
+
+PTB takes its own semaphore before do_process_update, so a chat's queued updates
+would each hold a slot while waiting for the chat's turn, and one chatty user
+could starve every other chat. PTB's semaphore is therefore left unbounded and
+the real limit is a second semaphore taken inside the chat lock: an update
+waiting behind its own chat costs a task, never a worker slot.
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, Awaitable, Any, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from app.services import profiler
+from app.services.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+# Limit handed to PTB's own semaphore, which only ever sees updates waiting for their chat
+_UNBOUNDED = 2 ** 31 - 1
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Concurrent across chats, sequential (FIFO) within a chat."""
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # max_concurrent_updates (PTB's view) is the sentinel; `workers` is the real limit
+        super().__init__(_UNBOUNDED)
+        self.workers = max_concurrent_updates
+        # Taken only once it's the update's turn in its chat
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._running = 0
+        # chat_id -> [lock, number of updates holding or waiting for it]
+        self._chat_locks: Dict[int, list] = {}
+
+    @property
+    def current_concurrent_updates(self) -> int:
+        return self._running
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        Called in arrival order. asyncio.Lock wakes waiters FIFO, so updates of one chat
+        run in the order Telegram delivered them; the worker slot is taken after the
+        chat's turn comes, so a backlog in one chat doesn't hold up the others.
+        """
+        key = self._chat_key(update)
+        update_id = update.update_id if isinstance(update, Update) else 0
+        if key is None:
+            async with self._slots:
+                started = time.perf_counter()
+                self._running += 1
+                try:
+                    with start_trace("update", update_id=update_id):
+                        await coroutine
+                finally:
+                    self._running -= 1
+                    profiler.note_update(started)
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            queued = time.perf_counter()
+            async with entry[0], self._slots:
+                # The root span covers the handlers only; time spent behind earlier
+                # updates of the same chat (and waiting for a slot) is recorded as an attribute
+                started = time.perf_counter()
+                self._running += 1
+                try:
+                    with start_trace("update", chat_id=key, update_id=update_id,
+                                     chat_wait_ms=round((started - queued) * 1000, 1)):
+                        await coroutine
+                finally:
+                    self._running -= 1
+                    # Counted once all its handlers are done, for "/profile N updates"
+                    profiler.note_update(started)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # No one else queued for this chat: drop the lock so memory stays flat
+                self._chat_locks.pop(key, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+# app.bot refuses to import without a token; the tests never talk to Telegram
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:TEST")
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cwd(tmp_path, monkeypatch):
+    """Journals, shop assignments and other relative paths land in a per-test directory."""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def visits_db(tmp_path, monkeypatch):
+    """Fresh SQLite visit store for the test."""
+    from app.services import visit_store
+
+    path = str(tmp_path / "visits.db")
+    monkeypatch.setattr(visit_store, "VISITS_DB", path)
+    return path
+
+
+@pytest.fixture
+def shops_config(tmp_path, monkeypatch):
+    """Write a shops.json for the test; returns a function taking the "shops" mapping."""
+    import json
+    from app.services import shops, sheets
+
+    path = tmp_path / "shops.json"
+    monkeypatch.setattr(shops, "SHOPS_CONFIG", str(path))
+    monkeypatch.setattr(shops, "_config", None)
+    monkeypatch.setattr(shops, "_assignments", None)
+    monkeypatch.setattr(sheets, "_shards", {})
+
+    def write(shop_map, default=None):
+        path.write_text(json.dumps({"default": default, "shops": shop_map}), encoding="utf-8")
+        shops._config = None
+
+    return write
+
+
+@pytest.fixture
+def fake_sheets(monkeypatch, shops_config):
+    """
+    Start a FakeSheetsServer and point the Sheets client at it; returns a function
+    taking {worksheet: header} (one shop per worksheet, named after it).
+    """
+    from app.services import sheets, breaker
+    from app.tools.fakes import FakeSheetsServer
+
+    pytest.importorskip("gspread")
+    monkeypatch.setattr(sheets, "_client", None)
+    monkeypatch.setattr(breaker, "_breakers", {})
+    servers = []
+
+    def start(worksheets, **kwargs):
+        fake = FakeSheetsServer("Test Book", worksheets, **kwargs).start()
+        servers.append(fake)
+        monkeypatch.setattr(sheets, "SHEETS_API_BASE_URL", fake.url)
+        shops_config({name: {"spreadsheet": "Test Book", "worksheet": name} for name in worksheets},
+                     default=next(iter(worksheets)))
+        return fake
+
+    yield start
+    for fake in servers:
+        fake.stop()
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeGemini:
+    """Stand-in for genai.Client: `answer(prompt)` returns the response text or raises."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+        self.models = self
+
+    def generate_content(self, model, contents, config):
+        self.prompts.append(contents)
+        return _Response(self.answer(contents))
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Replace the Gemini client; returns a function taking `answer(prompt)`."""
+    from app.services import ai_extractor, breaker
+
+    monkeypatch.setattr(breaker, "_breakers", {})
+
+    def install(answer):
+        client = FakeGemini(answer)
+        monkeypatch.setattr(ai_extractor, "get_client", lambda: client)
+        return client
+
+    return install
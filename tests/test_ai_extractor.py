@@ -0,0 +1,90 @@
+import json
+
+from app.services import ai_extractor, breaker
+
+
+def _items_of(prompt):
+    return json.loads(prompt[prompt.index("["):])
+
+
+def test_batch_packs_many_transcripts_into_one_request(gemini):
+    client = gemini(lambda p: json.dumps([{"id": it["id"], "Ticket_amount": len(it["text"])}
+                                          for it in _items_of(p)]))
+    res = ai_extractor.extract_batch([("a", "x"), ("b", "yy"), ("c", "zzz")])
+    assert {k: v["Ticket_amount"] for k, v in res["results"].items()} == {"a": 1, "b": 2, "c": 3}
+    assert (res["requests"], res["splits"], res["errors"]) == (1, 0, {})
+    assert len(client.prompts) == 1
+
+
+def test_batch_retries_skipped_items_in_halves(gemini):
+    def answer(prompt):
+        items = _items_of(prompt)
+        # The model skips "bad" whenever it has company, and mangles it when alone
+        if len(items) == 1 and items[0]["text"] == "bad":
+            return "not json"
+        return json.dumps([{"id": it["id"], "Product_name": it["text"]} for it in items if it["text"] != "bad"])
+
+    gemini(answer)
+    res = ai_extractor.extract_batch([("1", "one"), ("2", "bad"), ("3", "three"), ("4", "four")])
+    assert {k: v["Product_name"] for k, v in res["results"].items()} == {"1": "one", "3": "three", "4": "four"}
+    assert res["errors"] == {"2": "missing or invalid in model response"}
+    assert res["splits"] >= 1
+
+
+def test_batch_request_failure_fails_the_chunk_and_counts_for_the_breaker(gemini):
+    def answer(prompt):
+        raise RuntimeError("500 INTERNAL")
+
+    gemini(answer)
+    res = ai_extractor.extract_batch([("a", "x"), ("b", "y")])
+    assert res["results"] == {} and set(res["errors"]) == {"a", "b"}
+    assert breaker.get_breaker("gemini").failures == 1
+
+
+def test_extract_fields_many_sends_unsure_visits_in_one_batch(gemini, monkeypatch):
+    from app.services import enum_classifier
+
+    monkeypatch.setattr(enum_classifier, "confident_fields", lambda text: {})
+    client = gemini(lambda p: json.dumps([{"id": it["id"], "Quantity": it["id"]} for it in _items_of(p)]))
+    out = ai_extractor.extract_fields_many(["first", "second"])
+    assert [o["Quantity"] for o in out] == [1, 2]
+    assert len(client.prompts) == 1
+
+
+def test_parse_fields_keeps_valid_fields_and_drops_invalid_ones():
+    out = ai_extractor.parse_fields(json.dumps({
+        "Purchase_status": "купили", "Type_of_client": "инопланетянин", "Ticket_amount": "15 000 тг",
+        "Cost_Price": True, "Quantity": 3, "Product_name": "  флизелин  ", "Unknown": "x",
+    }))
+    assert set(out) == set(ai_extractor.FIELDS)
+    assert out["Purchase_status"] == "купили"
+    assert out["Ticket_amount"] == 15000.0 and out["Quantity"] == 3
+    assert out["Cost_Price"] is None
+    assert out["Product_name"] == "флизелин"
+    assert out["Source"] is None
+
+
+def test_parse_fields_salvages_truncated_json():
+    out = ai_extractor.parse_fields('{"Purchase_status": "купили", "Ticket_amount": 50000, "Product_na')
+    assert (out["Purchase_status"], out["Ticket_amount"], out["Product_name"]) == ("купили", 50000, None)
+    assert ai_extractor.parse_fields("[1, 2]") == {f: None for f in ai_extractor.FIELDS}
+
+
+def test_allowed_values_travel_in_the_schema_not_the_prompt():
+    from app.services.enum_config import current
+
+    schema = ai_extractor.item_schema()
+    assert schema["properties"]["Purchase_status"]["enum"] == list(current().choices["Purchase_status"])
+    assert schema["properties"]["Ticket_amount"] == {"type": "NUMBER", "nullable": True}
+    prompt = ai_extractor.build_prompt("клиент купил")
+    assert prompt.endswith("клиент купил")
+    assert "контрактник/мастер" not in prompt
+
+    batch = ai_extractor._batch_schema()
+    assert batch["type"] == "ARRAY" and batch["items"]["required"] == ["id"]
+
+
+def test_single_extraction_parses_the_schema_response(gemini):
+    gemini(lambda p: json.dumps({"Purchase_status": "купили", "Ticket_amount": 20000}))
+    out = ai_extractor.extract_data_with_gemini("купила на двадцать тысяч")
+    assert (out["Purchase_status"], out["Ticket_amount"]) == ("купили", 20000)
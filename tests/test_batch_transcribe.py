@@ -0,0 +1,60 @@
+import json
+
+from app.tools import batch_transcribe
+
+
+def _fake_transcribe(path, model_path=None, parallel=True):
+    if path.endswith("bad.ogg"):
+        raise RuntimeError("decode failed")
+    return {"text": f"text of {path}", "words": [], "duration": 2.0}
+
+
+def test_collect_inputs_from_directory(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "1.ogg").write_bytes(b"")
+    (tmp_path / "2.MP3").write_bytes(b"")
+    (tmp_path / "notes.txt").write_text("x")
+    paths = batch_transcribe.collect_inputs(str(tmp_path))
+    assert paths == sorted([str(tmp_path / "a" / "1.ogg"), str(tmp_path / "2.MP3")])
+
+
+def test_collect_inputs_from_manifest(tmp_path):
+    manifest = tmp_path / "list.txt"
+    manifest.write_text("# archive\n\nrel/1.ogg\n/abs/2.ogg\n")
+    assert batch_transcribe.collect_inputs(str(manifest)) == [str(tmp_path / "rel" / "1.ogg"), "/abs/2.ogg"]
+
+
+def test_load_done_skips_errors_and_torn_line(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text('{"path": "a.ogg", "text": "x"}\n{"path": "b.ogg", "error": "boom"}\n{"path": "c.og')
+    assert batch_transcribe.load_done(str(out)) == {"a.ogg"}
+
+
+def test_drop_torn_tail(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_bytes(b'{"path": "a.ogg"}\n{"path": "b.o')
+    batch_transcribe.drop_torn_tail(str(out))
+    assert out.read_bytes() == b'{"path": "a.ogg"}\n'
+
+    batch_transcribe.drop_torn_tail(str(out))
+    assert out.read_bytes() == b'{"path": "a.ogg"}\n'
+
+    out.write_bytes(b'{"pa')
+    batch_transcribe.drop_torn_tail(str(out))
+    assert out.read_bytes() == b""
+
+
+def test_run_batch_resumes_after_torn_line(tmp_path, monkeypatch):
+    # Workers are forked, so they see the patched module
+    monkeypatch.setattr(batch_transcribe, "load_vosk_model", lambda path: None)
+    monkeypatch.setattr(batch_transcribe, "vosk_transcribe_detailed", _fake_transcribe)
+    out = tmp_path / "out.jsonl"
+    out.write_text('{"path": "a.ogg", "text": "old"}\n{"path": "b.og')
+
+    summary = batch_transcribe.run_batch(["a.ogg", "b.ogg", "bad.ogg"], str(out), workers=2, model_path="m")
+
+    assert (summary["skipped"], summary["ok"], summary["failed"]) == (1, 1, 1)
+    entries = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [e["path"] for e in entries][0] == "a.ogg"
+    assert {e["path"] for e in entries[1:]} == {"b.ogg", "bad.ogg"}
+    assert batch_transcribe.load_done(str(out)) == {"a.ogg", "b.ogg"}
@@ -0,0 +1,31 @@
+import json
+
+from app.tools import bench
+
+
+def test_compare_flags_only_slowdowns_over_threshold():
+    baseline = {"a": 10.0, "b": 10.0, "c": 10.0}
+    results = {"a": 12.4, "b": 12.6, "c": 5.0, "new": 99.0}
+    assert bench.compare(results, baseline, 0.25) == ["b"]
+
+
+def test_benchmarks_are_seeded_and_count_calls():
+    first, second = bench.build_benchmarks(seed=1), bench.build_benchmarks(seed=1)
+    assert set(first) == {"parse_number", "match_enum", "norm_text", "validate_and_normalize_row",
+                          "apply_extracted_data", "process_answer"}
+    assert first["parse_number"]() == second["parse_number"]() == 2000
+    assert first["process_answer"]() > 0
+
+
+def test_save_then_compare_against_baseline(tmp_path, capsys):
+    baseline = tmp_path / "baseline.json"
+    args = ["-k", "parse_number", "--repeat", "1", "--baseline", str(baseline)]
+    assert bench.main(args + ["--save"]) == 0
+    saved = json.loads(baseline.read_text())
+    assert set(saved["results"]) == {"parse_number"}
+
+    # A baseline far faster than anything real makes the run a regression
+    saved["results"]["parse_number"] = 1e-9
+    baseline.write_text(json.dumps(saved))
+    assert bench.main(args) == 1
+    assert "REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,94 @@
+import pytest
+
+from app.services import breaker, visit_store as store, sync
+from app.services.breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from app.services.sheets import get_shard
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the breaker module."""
+    now = [1000.0]
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _tripped(clock, threshold=3, reset=30):
+    b = CircuitBreaker("dep", failure_threshold=threshold, reset_timeout=reset)
+    for _ in range(threshold):
+        assert b.allow()
+        b.record_failure()
+    return b
+
+
+def test_opens_after_consecutive_failures_and_rejects_while_open(clock):
+    b = CircuitBreaker("dep", failure_threshold=3, reset_timeout=30)
+    b.record_failure()
+    b.record_failure()
+    b.record_success()  # a success in between resets the streak
+    b.record_failure()
+    b.record_failure()
+    assert b.state == CLOSED and b.allow()
+
+    b.record_failure()
+    assert b.state == OPEN and b.is_open()
+    clock[0] += 29
+    assert not b.allow()
+    with pytest.raises(CircuitOpenError):
+        b.check()
+    snap = b.snapshot()
+    assert snap["state"] == OPEN and snap["trips"] == 1 and snap["rejected"] == 2
+    assert snap["retry_in_s"] == 1.0
+
+
+def test_half_open_lets_a_single_probe_through_and_success_closes(clock):
+    b = _tripped(clock)
+    clock[0] += 30
+    assert not b.is_open()
+    assert b.allow()
+    assert b.state == HALF_OPEN
+    assert not b.allow()  # one probe at a time
+
+    b.record_success()
+    assert b.state == CLOSED and b.failures == 0
+    assert b.allow() and b.allow()
+
+
+def test_failed_probe_reopens_for_another_period(clock):
+    b = _tripped(clock)
+    clock[0] += 30
+    assert b.allow()
+    b.record_failure()
+    assert b.state == OPEN and b.counters["trips"] == 2
+    clock[0] += 29
+    assert not b.allow()
+    clock[0] += 1
+    assert b.allow() and b.state == HALF_OPEN
+
+
+def test_probe_that_never_reports_back_is_released_after_the_timeout(clock):
+    b = _tripped(clock)
+    clock[0] += 30
+    assert b.allow()
+    clock[0] += 29
+    assert not b.allow()
+    clock[0] += 1
+    assert b.allow()
+    assert b.state == HALF_OPEN
+
+
+def test_an_open_shop_breaker_does_not_block_other_shops(visits_db, fake_sheets):
+    fake = fake_sheets({"center": ["Date", "Client_ID", "Visit_key"], "north": ["Date", "Client_ID", "Visit_key"]})
+    center = get_shard("center").breaker
+    for _ in range(center.failure_threshold):
+        center.record_failure()
+    assert center.is_open()
+
+    with pytest.raises(CircuitOpenError):
+        get_shard("center").append_rows([{"Date": "2026-03-14", "Client_ID": "a"}])
+    store.record_visit({"Date": "2026-03-14", "Client_ID": "b", "Visit_key": "k-b"}, "north")
+    assert sync.sync_shop("north") == 1
+    assert fake.sheets["north"][1:] == [["2026-03-14", "b", "k-b"]]
+    assert fake.sheets["center"][1:] == []
+    assert set(breaker.stats()) == {"sheets:center", "sheets:north"}
+    assert breaker.stats()["sheets:north"]["state"] == CLOSED
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import client_index, visit_store as store
+from app.conversation_flow import ConversationState
+
+
+@pytest.fixture
+def index(monkeypatch, visits_db):
+    monkeypatch.setattr(client_index, "_index", {})
+    monkeypatch.setattr(client_index, "_loaded", False)
+    return client_index
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("оставила номер +7 (701) 234-56-78, перезвоним", "77012345678"),
+    ("клиент 8 701 234 5678 заходил", "87012345678"),
+    ("айди 12-34-56", "123456"),
+    ("номер клиента: 654321", "654321"),
+    ("купила 3 рулона по 15000", ""),
+    (None, ""),
+])
+def test_find_client_id(text, expected):
+    assert client_index.find_client_id(text) == expected
+
+
+def test_index_is_built_from_the_store_then_kept_current(index):
+    store.record_visit({"Date": "2026-03-01", "Client_ID": "345678", "Type_of_client": "оптовик"}, "center")
+    store.record_visit({"Date": "2026-02-01", "Client_ID": "345678", "Type_of_client": "новый"}, "center")
+
+    previous = index.lookup("8 (777) 234-5678")
+    assert previous == {"visits": 2, "last_date": "2026-03-01", "type_of_client": "оптовик"}
+
+    index.record({"Date": "2026-03-10", "Client_ID": "345678", "Type_of_client": "повторный"})
+    assert index.lookup("345678") == {"visits": 3, "last_date": "2026-03-10", "type_of_client": "повторный"}
+    assert index.lookup("12") is None
+    assert index.lookup("999999") is None
+
+
+@pytest.mark.parametrize("previous_type, expected", [
+    ("оптовик", "оптовик"),
+    ("контрактник/мастер", "контрактник/мастер"),
+    ("новый", "повторный"),
+    ("", "повторный"),
+])
+def test_repeat_client_type(previous_type, expected):
+    assert client_index.client_type_for_repeat({"type_of_client": previous_type}) == expected
+
+
+def test_apply_client_fills_repeat_fields():
+    state = ConversationState("клиент зашел", datetime(2026, 3, 14, 12, 0))
+    state.apply_client("77012345678", {"visits": 2, "last_date": "2026-03-01", "type_of_client": "оптовик"})
+    assert (state.data["Client_ID"], state.data["Repeat_visit"], state.data["Contact_left"]) == \
+        ("77012345678", "да", "да")
+    assert state.data["Type_of_client"] == "оптовик"
+
+    first = ConversationState("клиент зашел", datetime(2026, 3, 14, 12, 0))
+    first.apply_client("77012345678", None)
+    assert first.data["Repeat_visit"] == "нет"
+
+
+def _chat(text, replies):
+    async def reply_text(reply, **kwargs):
+        replies.append(reply)
+
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=1), effective_user=SimpleNamespace(id=2),
+                           message=SimpleNamespace(text=text, reply_text=reply_text))
+
+
+def test_a_resaved_visit_is_counted_once(index, monkeypatch):
+    from app import bot
+
+    monkeypatch.setattr(bot, "resolve_shop", lambda chat_id, user_id: "center")
+    monkeypatch.setattr(bot, "request_sync", lambda application, shop: None)
+    monkeypatch.setattr(bot, "get_shard", lambda shop: SimpleNamespace(breaker=SimpleNamespace(is_open=lambda: False)))
+    row = {"Date": "2026-03-14", "Client_ID": "345678", "Type_of_client": "новый", "Visit_key": "k-1"}
+
+    for _ in range(2):
+        context = SimpleNamespace(application=None, user_data={})
+        asyncio.run(bot.save_rows(_chat("", []), context, [row]))
+
+    assert index.lookup("345678")["visits"] == 1
+
+
+def test_only_the_contact_answer_is_looked_up_as_a_client_id(index, monkeypatch):
+    from app import bot
+    from app.conversation_flow import STATE_CONTACT_LEFT, STATE_TICKET_AMOUNT
+
+    store.record_visit({"Date": "2026-03-01", "Client_ID": "345678", "Type_of_client": "оптовик"}, "center")
+    state = ConversationState("клиент зашел", datetime(2026, 3, 14, 12, 0))
+    state.current_state = STATE_TICKET_AMOUNT
+    context = SimpleNamespace(user_data={"conv_state": state})
+    replies = []
+
+    asyncio.run(bot.collect_data(_chat("1234567890", replies), context))  # a large amount, not a phone
+    assert state.data["Client_ID"] == ""
+
+    state.current_state = STATE_CONTACT_LEFT
+    asyncio.run(bot.collect_data(_chat("да, 8 777 234 5678", replies), context))
+    assert state.data["Client_ID"] == "87772345678"
+    assert state.data["Type_of_client"] == "оптовик"
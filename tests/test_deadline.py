@@ -0,0 +1,156 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from app.services import ai_extractor, breaker, deadline
+from app.services.deadline import DeadlineExceeded, sleep_within, within
+from app.services.sheets import QuotaBudget
+
+
+@pytest.fixture
+def update_deadline():
+    """Start a deadline in the test's context, as tag_update does per update; cleared afterwards."""
+    started = []
+
+    def begin(seconds):
+        started.append(deadline._current.set(None))
+        return deadline.start(seconds)
+
+    yield begin
+    for token in reversed(started):
+        deadline._current.reset(token)
+
+
+def test_worker_threads_see_the_updates_deadline_expire():
+    async def update():
+        deadline.start(0.1)
+
+        def recognizer():
+            # A blocking loop that polls between chunks, like the STT worker
+            chunks = 0
+            while not deadline.current().expired:
+                time.sleep(0.01)
+                chunks += 1
+            return chunks
+
+        return await asyncio.to_thread(recognizer)
+
+    started = time.monotonic()
+    assert asyncio.run(update()) > 0
+    assert time.monotonic() - started < 1.0
+    assert deadline.current() is None  # the update's context, not the test's
+
+
+def test_within_cancels_the_update_and_runs_kill_callbacks():
+    killed = threading.Event()
+    worker_done = []
+
+    async def update():
+        d = deadline.start(0.1)
+
+        def decode():
+            with d.on_cancel(killed.set):
+                killed.wait(5)
+            worker_done.append(d.expired)
+
+        with pytest.raises(DeadlineExceeded) as info:
+            await within("stt", asyncio.to_thread(decode))
+        assert info.value.stage == "stt"
+        assert d.remaining() == 0.0
+        # Nothing registered after the cancel is left waiting either
+        late = []
+        with d.on_cancel(lambda: late.append(True)):
+            pass
+        assert late == [True]
+
+    asyncio.run(update())
+    assert killed.wait(1)
+    for _ in range(100):
+        if worker_done:
+            break
+        time.sleep(0.01)
+    assert worker_done == [True]
+
+
+def test_a_stages_own_timeout_is_not_taken_for_the_deadline():
+    async def update():
+        d = deadline.start(10)
+
+        async def api_call():
+            raise asyncio.TimeoutError()
+
+        with pytest.raises(asyncio.TimeoutError):
+            await within("gemini", api_call())
+        assert not d.expired
+
+    asyncio.run(update())
+
+
+def test_without_a_deadline_the_helpers_are_no_ops():
+    assert deadline.current() is None
+    assert deadline.remaining() == float("inf")
+    assert sleep_within(0.01)
+    deadline.for_audio(600)
+    assert asyncio.run(within("stt", asyncio.sleep(0, result="ok"))) == "ok"
+
+
+def test_sleep_within_refuses_sleeps_past_the_deadline_and_wakes_on_cancel(update_deadline):
+    d = update_deadline(0.5)
+    assert sleep_within(0.01)
+    started = time.monotonic()
+    assert not sleep_within(1.0)
+    assert time.monotonic() - started < 0.05
+
+    threading.Timer(0.05, d.cancel).start()
+    assert not sleep_within(0.3)
+    assert time.monotonic() - started < 0.25
+
+
+def test_for_audio_stretches_the_deadline_with_the_note_length(update_deadline, monkeypatch):
+    monkeypatch.setattr(deadline, "UPDATE_DEADLINE_S", 120)
+    monkeypatch.setattr(deadline, "UPDATE_DEADLINE_PER_AUDIO_S", 1.5)
+    d = update_deadline(120)
+    deadline.for_audio(200)
+    assert d.expires_at == pytest.approx(d.started + 420)
+    deadline.for_audio(10)  # never shortens
+    assert d.expires_at == pytest.approx(d.started + 420)
+
+
+def test_sheets_quota_wait_past_the_deadline_raises(update_deadline):
+    quota = QuotaBudget(per_minute=1)
+    quota.acquire()
+    update_deadline(1)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded) as info:
+        quota.acquire()  # next token in ~60s
+    assert info.value.stage == "sheets_quota"
+    assert time.monotonic() - started < 0.5
+
+
+def _rate_limited(prompt):
+    raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+
+def test_gemini_backoff_past_the_deadline_gives_up_without_blaming_gemini(gemini, update_deadline):
+    client = gemini(_rate_limited)
+    update_deadline(0.5)
+
+    assert ai_extractor.extract_data_with_gemini("клиент купил обои") == {}
+
+    assert len(client.prompts) == 1
+    snap = breaker.get_breaker("gemini").snapshot()
+    assert (snap["failures"], snap["consecutive_failures"]) == (0, 0)
+
+
+def test_batch_backoff_past_the_deadline_fails_the_rest_without_blaming_gemini(gemini, update_deadline):
+    client = gemini(_rate_limited)
+    update_deadline(0.5)
+
+    res = ai_extractor.extract_batch([("a", "x"), ("b", "y")])
+
+    assert res["results"] == {}
+    assert res["errors"] == {"a": "deadline exceeded in gemini_batch", "b": "deadline exceeded in gemini_batch"}
+    assert len(client.prompts) == 1
+    assert breaker.get_breaker("gemini").snapshot()["failures"] == 0
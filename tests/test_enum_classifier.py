@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from app.services import enum_classifier as clf, ai_extractor
+
+_BOUGHT = ["купила два рулона флизелиновых обоев", "взяли обои на зал, купили", "купил рулоны, оплатил картой"]
+_LEFT = ["посмотрела каталог, сказала дорого, ушла", "ушел, дорого ему", "дорого, подумает и уйдет"]
+
+
+def _rows(n=60, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        bought = i % 2 == 0
+        rows.append({
+            "Transcription_raw": rng.choice(_BOUGHT if bought else _LEFT) + f" номер {i}",
+            "Purchase_status": "купили" if bought else "не купили",
+            "Type_of_client": "новый",
+        })
+    return rows
+
+
+@pytest.fixture
+def model_path(tmp_path, monkeypatch):
+    path = tmp_path / "clf.json"
+    monkeypatch.setattr(clf, "CLASSIFIER_PATH", str(path))
+    monkeypatch.setattr(clf, "_model", None)
+    monkeypatch.setattr(clf, "_model_mtime", None)
+    return path
+
+
+def test_without_a_model_nothing_is_predicted(model_path):
+    assert clf.predict("купила обои") == {}
+    assert clf.confident_fields("купила обои") == {}
+
+
+def test_train_needs_enough_rows():
+    with pytest.raises(ValueError):
+        clf.train(_rows(10))
+
+
+def test_trained_model_predicts_confidently_on_clear_notes(model_path):
+    model, report = clf.train(_rows())
+    # A field with a single class teaches nothing and is left out
+    assert set(model["fields"]) == {"Purchase_status"}
+    assert report["fields"]["Purchase_status"]["accuracy"] >= 0.9
+    clf.save_model(model, str(model_path))
+
+    value, confidence = clf.predict("клиентка купила три рулона")["Purchase_status"]
+    assert value == "купили" and 0.5 < confidence <= 1.0
+    assert clf.predict("сказал дорого и ушел")["Purchase_status"][0] == "не купили"
+    assert clf.confident_fields("сказал дорого и ушел", min_confidence=0.0) == {"Purchase_status": "не купили"}
+    assert clf.confident_fields("сказал дорого и ушел", min_confidence=1.01) == {}
+
+
+def test_gemini_is_skipped_only_when_every_enum_is_settled_without_a_purchase(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ai_extractor, "extract_data_with_gemini",
+                        lambda text: calls.append(text) or {f: None for f in ai_extractor.FIELDS})
+    settled = {"Type_of_client": "новый", "Behavior": "посмотрел", "Purchase_status": "не купили",
+               "Reason_not_buying": "дорого", "Source": "инстаграм"}
+
+    monkeypatch.setattr(clf, "confident_fields", lambda text: settled)
+    assert ai_extractor.extract_fields("x")["Reason_not_buying"] == "дорого"
+    assert calls == []
+
+    # A purchase still needs Gemini for the amounts; local fields win over its answer
+    monkeypatch.setattr(clf, "confident_fields", lambda text: {**settled, "Purchase_status": "купили"})
+    assert ai_extractor.extract_fields("y")["Purchase_status"] == "купили"
+    assert calls == ["y"]
+
+
+def _reference(model, text):
+    """Scores the way train() does: full TF-IDF vector, one class at a time."""
+    vec = clf._tfidf(clf.ngrams(text), model["idf"])
+    out = {}
+    for field, f in model["fields"].items():
+        k = len(f["classes"])
+        weights = {g: w[f["offset"]:f["offset"] + k] for g, w in model["weights"].items()}
+        probs = clf._softmax(clf._scores(vec, f["priors"], weights), f["temperature"])
+        best = max(range(k), key=probs.__getitem__)
+        out[field] = (f["classes"][best], probs[best])
+    return out
+
+
+def test_predict_matches_the_training_scorer(model_path):
+    model, _ = clf.train(_rows())
+    clf.save_model(model, str(model_path))
+    for text in ["клиентка купила три рулона, купила клей", "дорого дорого, ушел", "номер 5 взяли обои на зал"]:
+        got, want = clf.predict(text), _reference(model, text)
+        assert got.keys() == want.keys()
+        for field in want:
+            assert got[field][0] == want[field][0]
+            assert got[field][1] == pytest.approx(want[field][1], rel=1e-9)
+
+
+def test_a_long_note_is_scored_on_a_bounded_number_of_features(model_path, monkeypatch):
+    model, _ = clf.train(_rows())
+    clf.save_model(model, str(model_path))
+    monkeypatch.setattr(clf, "CLASSIFIER_MAX_NGRAMS", 20)
+    head = "клиентка купила три рулона"
+    long_note = head + " " + " ".join(f"слово{i}" for i in range(500)) + " сказала дорого ушла"
+    assert clf.predict(long_note) == clf.predict(head)
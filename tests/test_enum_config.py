@@ -0,0 +1,107 @@
+import os
+import json
+
+import pytest
+
+from app.services import enum_config
+
+
+def _config(fields, version=2):
+    return json.dumps({"version": version, "fields": fields}, ensure_ascii=False).encode("utf-8")
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    path = tmp_path / "enum_config.json"
+    monkeypatch.setattr(enum_config, "ENUM_CONFIG_PATH", str(path))
+    monkeypatch.setattr(enum_config, "_current", enum_config._BUILTIN)
+    monkeypatch.setattr(enum_config, "_mtime", None)
+    monkeypatch.setattr(enum_config, "_next_check", 0.0)
+
+    def write(fields, version=2, mtime=None):
+        path.write_bytes(_config(fields, version))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    return write
+
+
+def test_fields_missing_from_the_file_keep_builtin_values():
+    snapshot = enum_config._parse(_config({"Reason_not_buying": ["дорого", "другое", "далеко"]}), "test")
+    assert snapshot.choices["Reason_not_buying"] == ("дорого", "другое", "далеко")
+    assert snapshot.choices["Source"] == tuple(enum_config.DEFAULT_ALLOWED["Source"])
+    assert snapshot.by_lower["Source"]["instagram"] == "Instagram"
+    assert snapshot.keyboard("YesNo") == [["да"], ["нет"]]
+    assert snapshot.key.startswith("2:")
+
+
+@pytest.mark.parametrize("field, values", [
+    ("Purchase_status", ["не купили", "думают"]),
+    ("Type_of_client", ["новый", "оптовик", "контрактник/мастер"]),
+    ("Type_of_client", ["новый", "повторный"]),
+    ("YesNo", ["да", "не"]),
+])
+def test_configs_dropping_values_the_code_relies_on_are_rejected(field, values):
+    with pytest.raises(ValueError, match="must keep"):
+        enum_config._parse(_config({field: values}), "test")
+
+
+@pytest.mark.parametrize("raw", [
+    _config({"Typ_of_client": ["новый"]}),
+    _config({"Source": []}),
+    _config({"Source": ["Instagram", " "]}),
+    json.dumps({"fields": {}}).encode(),
+    b"[1, 2]",
+])
+def test_malformed_configs_are_rejected(raw):
+    with pytest.raises(ValueError):
+        enum_config._parse(raw, "test")
+
+
+def test_reload_swaps_changed_files_and_keeps_the_last_good_one(config_file):
+    assert enum_config.current() is enum_config._BUILTIN
+
+    config_file({"Source": ["Instagram", "другое", "Kaspi"]}, version=3, mtime=1_000)
+    loaded = enum_config.reload()
+    assert loaded.version == 3 and "Kaspi" in loaded.choices["Source"]
+
+    # A broken edit is ignored: the previous snapshot stays in effect
+    config_file({"Purchase_status": ["не купили"]}, version=4, mtime=2_000)
+    assert enum_config.reload() is loaded
+
+    os.remove(enum_config.ENUM_CONFIG_PATH)
+    assert enum_config.reload() is enum_config._BUILTIN
+
+
+def test_gemini_configs_stay_consistent_across_threads_and_reloads(monkeypatch):
+    import threading
+    from app.services import ai_extractor
+
+    pytest.importorskip("google.genai")
+    versions = [enum_config._parse(_config({}, version), "test") for version in (2, 3)]
+    local = threading.local()
+    monkeypatch.setattr(ai_extractor, "current_enums", lambda: local.enums)
+    monkeypatch.setattr(ai_extractor, "_configs", {})
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(200):
+                local.enums = versions[(n + i) % 2]
+                cfg = ai_extractor._config("single" if i % 3 else "batch")
+                assert cfg.response_mime_type == "application/json"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    local.enums = versions[1]
+    single = ai_extractor._config("single")
+    assert ai_extractor._config("single") is single
+    assert {key[1] for key in ai_extractor._configs} == {versions[1].key}
@@ -0,0 +1,107 @@
+import json
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from telegram.ext import ConversationHandler
+
+from app import bot
+from app.conversation_flow import ConversationState
+from app.services import idle_sessions, local_store
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [5000.0]
+    monkeypatch.setattr(idle_sessions.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _session(chat_id, transcript="клиент купил обои"):
+    user_data = {"conv_state": ConversationState(transcript, datetime(2026, 3, 14, 12, 30))}
+    idle_sessions.touch(user_data, chat_id)
+    return user_data
+
+
+def test_sweep_expires_idle_sessions_and_returns_their_drafts(clock, monkeypatch):
+    monkeypatch.setattr(idle_sessions, "CONV_TTL_S", 600)
+    all_user_data = {1: _session(101), 2: {"last_active": 0}}
+    clock[0] += 300
+    all_user_data[3] = _session(103)
+    clock[0] += 301
+
+    drafts = idle_sessions.sweep(all_user_data)
+
+    assert [(d["user_id"], d["chat_id"], d["reason"], d["idle_s"]) for d in drafts] == [(1, 101, "ttl", 601)]
+    assert drafts[0]["current"]["Transcription_raw"] == "клиент купил обои"
+    assert drafts[0]["state"] is not None
+    assert "conv_state" not in all_user_data[1] and all_user_data[1]["chat_id"] == 101
+    assert "conv_state" in all_user_data[3]
+    assert idle_sessions.sweep(all_user_data) == []
+
+
+def test_sweep_evicts_least_recently_active_sessions_over_the_memory_budget(clock, monkeypatch):
+    monkeypatch.setattr(idle_sessions, "CONV_TTL_S", 3600)
+    all_user_data = {}
+    for user_id in (1, 2, 3):
+        all_user_data[user_id] = _session(100 + user_id, "слово " * 200)
+        clock[0] += 10
+    size = idle_sessions.session_bytes(all_user_data[1])
+    # Room for two sessions: the oldest one goes
+    monkeypatch.setattr(idle_sessions, "CONV_MEMORY_BUDGET_KB", (2 * size) // 1024 + 1)
+
+    drafts = idle_sessions.sweep(all_user_data)
+
+    assert [(d["user_id"], d["reason"]) for d in drafts] == [(1, "memory")]
+    assert [uid for uid, ud in all_user_data.items() if ud.get("conv_state")] == [2, 3]
+
+
+def test_sweep_drafts_a_multi_visit_note_with_its_answered_and_pending_visits(clock, monkeypatch):
+    monkeypatch.setattr(idle_sessions, "CONV_TTL_S", 60)
+    user_data = _session(101, "второй")
+    user_data["visit_batch"] = {
+        "rows": [{"Client_ID": "a", "Purchase_status": "купили"}],
+        "pending": [ConversationState("третий", datetime(2026, 3, 14, 12, 30))],
+    }
+    clock[0] += 61
+
+    [draft] = idle_sessions.sweep({7: user_data})
+
+    assert draft["completed"] == [{"Client_ID": "a", "Purchase_status": "купили"}]
+    assert [p["Transcription_raw"] for p in draft["pending"]] == ["третий"]
+    assert "visit_batch" not in user_data
+
+
+def test_journal_appends_drafts_to_the_drafts_file(clock):
+    idle_sessions.journal([idle_sessions.evict(1, _session(101), "ttl"),
+                           idle_sessions.evict(2, _session(102), "memory")])
+
+    with open(local_store.DRAFTS_FILE, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [(d["user_id"], d["reason"]) for d in lines] == [(1, "ttl"), (2, "memory")]
+    assert all("timestamp" in d for d in lines)
+
+
+def test_journal_failure_is_logged_not_raised(monkeypatch, caplog):
+    def broken(draft):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(idle_sessions, "save_draft", broken)
+    idle_sessions.journal([{"user_id": 1, "reason": "ttl"}])
+    assert "not journaled (disk full)" in caplog.text
+
+
+def test_the_next_message_after_a_sweep_ends_the_conversation(clock, monkeypatch):
+    monkeypatch.setattr(idle_sessions, "CONV_TTL_S", 60)
+    user_data = _session(101)
+    clock[0] += 61
+    assert [d["user_id"] for d in idle_sessions.sweep({1: user_data})] == [1]
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(message=SimpleNamespace(text="5000", reply_text=reply_text))
+    assert asyncio.run(bot.collect_data(update, SimpleNamespace(user_data=user_data))) == ConversationHandler.END
+    assert replies == ["Ошибка: состояние потеряно. Начни заново: /start"]
@@ -0,0 +1,104 @@
+import json
+import zipfile
+from datetime import date
+
+import pytest
+
+from app.services import log_export
+from app.services.log_export import parse_filters, export, format_summary
+
+TODAY = date(2026, 3, 14)
+
+
+def _write(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for day, entry in entries:
+            f.write(json.dumps({"timestamp": f"{day}T12:00:00", **entry}, ensure_ascii=False) + "\n")
+
+
+def _members(archive):
+    with zipfile.ZipFile(archive) as zf:
+        return {name: [json.loads(line) for line in zf.read(name).decode("utf-8").splitlines()]
+                for name in zf.namelist()}
+
+
+def test_parse_filters_defaults_to_the_last_week_of_every_journal():
+    assert parse_filters([], TODAY) == {"start": date(2026, 3, 8), "end": TODAY, "journals": set(),
+                                        "events": set(), "last": None}
+
+
+def test_parse_filters_reads_tokens_in_any_order():
+    filters = parse_filters(["last=50", "2026-03-01..2026-03-10", "Drafts", "failed"], TODAY)
+    assert (filters["start"], filters["end"]) == (date(2026, 3, 1), date(2026, 3, 10))
+    assert filters["journals"] == {"drafts", "failed"}
+    assert filters["last"] == 50
+    assert parse_filters(["today", "200"], TODAY)["last"] == 200
+    assert parse_filters(["last=0"], TODAY)["last"] == 1
+
+
+def test_an_event_filter_implies_the_events_journal():
+    filters = parse_filters(["save_failure", "validation_error"], TODAY)
+    assert filters["events"] == {"save_failure", "validation_error"}
+    assert filters["journals"] == {"events"}
+    assert parse_filters(["drafts", "save_failure"], TODAY)["journals"] == {"drafts"}
+
+
+@pytest.mark.parametrize("arg", ["2026-13-01", "14.03.2026", "2026-03-01.."])
+def test_parse_filters_rejects_a_bad_date(arg):
+    with pytest.raises(ValueError):
+        parse_filters([arg], TODAY)
+
+
+def test_export_keeps_entries_inside_the_period_and_counts_events():
+    _write("events.jsonl", [("2026-03-01", {"event": "save_success", "details": None}),
+                            ("2026-03-12", {"event": "save_success", "details": None}),
+                            ("2026-03-13", {"event": "save_failure", "details": "quota"}),
+                            ("2026-03-14", {"event": "save_success", "details": None})])
+    _write("drafts.jsonl", [("2026-03-02", {"user_id": 1}), ("2026-03-13", {"user_id": 2})])
+    filters = parse_filters(["2026-03-10..2026-03-13"], TODAY)
+
+    result = export(filters, "logs.zip")
+
+    members = _members("logs.zip")
+    assert set(members) == {"drafts.jsonl", "events.jsonl", "failed.jsonl"}
+    assert [e["user_id"] for e in members["drafts.jsonl"]] == [2]
+    assert [e["timestamp"][:10] for e in members["events.jsonl"]] == ["2026-03-12", "2026-03-13"]
+    assert members["failed.jsonl"] == []
+    assert result["entries"] == {"drafts": 1, "events": 2, "failed": 0}
+    assert result["events"] == {"save_success": 1, "save_failure": 1}
+    assert not result["truncated"]
+    assert "📂 Логи за 2026-03-10..2026-03-13:" in format_summary(filters, result)
+
+
+def test_export_by_event_type_with_a_last_n_window():
+    _write("events.jsonl", [(f"2026-03-1{i}", {"event": "save_failure" if i % 2 else "save_success", "n": i})
+                            for i in range(5)])
+    filters = parse_filters(["save_failure", "last=1"], TODAY)
+
+    result = export(filters, "logs.zip")
+
+    assert [e["n"] for e in _members("logs.zip")["events.jsonl"]] == [3]
+    assert result["entries"] == {"events": 1}
+
+
+def test_export_reads_the_legacy_failed_saves_array():
+    with open("failed_saves.json", "w", encoding="utf-8") as f:
+        json.dump([{"data": {"Client_ID": "old"}, "timestamp": "2026-03-13T09:00:00"}], f)
+    _write("failed_saves.jsonl", [("2026-03-14", {"data": {"Client_ID": "new"}})])
+
+    export(parse_filters(["failed"], TODAY), "logs.zip")
+
+    assert [e["data"]["Client_ID"] for e in _members("logs.zip")["failed.jsonl"]] == ["old", "new"]
+
+
+def test_export_stops_at_the_size_cap(monkeypatch):
+    _write("drafts.jsonl", [("2026-03-14", {"user_id": i, "text": "x" * 500}) for i in range(10)])
+    monkeypatch.setattr(log_export, "LOGS_EXPORT_MAX_MB", 2000 / (1024 * 1024))
+    filters = parse_filters(["drafts"], TODAY)
+
+    result = export(filters, "logs.zip")
+
+    assert result["truncated"]
+    assert result["entries"] == {"drafts": 3}
+    assert len(_members("logs.zip")["drafts.jsonl"]) == 3
+    assert "⚠️ Обрезано" in format_summary(filters, result)
@@ -0,0 +1,45 @@
+import sys
+import json
+import asyncio
+import logging
+
+from app.logging_setup import RequestIdFilter, JsonFormatter, set_request_id, get_request_id
+
+
+def _record(msg="hello", **kwargs):
+    return logging.LogRecord("app.test", logging.INFO, __file__, 1, msg, None, kwargs.pop("exc_info", None),
+                             **kwargs)
+
+
+def test_request_id_follows_the_update_into_worker_threads():
+    stamped = []
+
+    def worker():
+        record = _record()
+        RequestIdFilter().filter(record)
+        stamped.append(record.request_id)
+
+    async def update(request_id):
+        set_request_id(request_id)
+        await asyncio.sleep(0)
+        await asyncio.to_thread(worker)
+
+    async def main():
+        await asyncio.gather(update("1:10"), update("2:11"))
+
+    asyncio.run(main())
+    assert sorted(stamped) == ["1:10", "2:11"]
+    assert get_request_id() == "-"
+
+
+def test_json_formatter_includes_request_id_fields_and_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = _record("saved %d rows" % 3, exc_info=sys.exc_info())
+    record.request_id = "5:42"
+    record.fields = {"stage": "save", "rows": 3}
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["msg"] == "saved 3 rows"
+    assert (entry["request_id"], entry["stage"], entry["rows"], entry["level"]) == ("5:42", "save", 3, "INFO")
+    assert "ValueError: boom" in entry["exc"]
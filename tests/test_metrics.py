@@ -0,0 +1,17 @@
+import pytest
+
+from app.services import metrics
+
+
+@pytest.mark.parametrize("values, q, expected", [
+    ([], 0.95, 0.0),
+    ([7.0], 0.95, 7.0),
+    ([1.0, 2.0], 0.95, 2.0),
+    (list(range(1, 11)), 0.95, 10),  # ceil(0.95 * 10) = 10th value, not the 9th
+    (list(range(1, 22)), 0.95, 20),
+    (list(range(1, 101)), 0.95, 95),
+    (list(range(1, 101)), 0.50, 50),
+    (list(range(1, 11)), 0.99, 10),
+])
+def test_percentile_is_nearest_rank(values, q, expected):
+    assert metrics.percentile(values, q) == expected
@@ -0,0 +1,95 @@
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from telegram import Chat, Message, Update
+
+from app import bot
+from app.services import profiler
+from app.update_processor import PerChatUpdateProcessor
+
+
+@pytest.fixture
+def run():
+    """A started profile (the module's active one), finished at teardown if the test didn't."""
+    active = profiler.start(max_updates=2)
+    assert active is not None
+    yield active
+    if profiler._active is active:
+        profiler.finish(active)
+
+
+def _busy(stop: threading.Event):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_profile_samples_every_thread_into_collapsed_stacks(run):
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy, args=(stop,), name="stt-worker")
+    worker.start()
+    time.sleep(0.2)
+    stop.set()
+    worker.join()
+
+    result = profiler.finish(run)
+
+    assert result["samples"] > 0 and result["seconds"] >= 0.2
+    stacks = result["collapsed"].splitlines()
+    assert any(line.startswith("stt-worker;") and "_busy (test_profiler.py:" in line for line in stacks)
+    assert result["allocations"].startswith("   size KB")
+    assert profiler._active is None
+
+
+def test_only_one_profile_runs_at_a_time(run):
+    assert profiler.start() is None
+
+
+def test_update_count_ignores_updates_started_before_the_profile(run):
+    profiler.note_update(run.started - 1.0)  # e.g. the /profile command itself
+    assert run.updates == 0
+    profiler.note_update(time.perf_counter())
+    assert run.updates == 1 and not run.done.is_set()
+    profiler.note_update()
+    assert run.updates == 2 and run.done.is_set()
+
+
+def test_the_update_processor_counts_an_update_once_its_handlers_are_done(run):
+    processor = PerChatUpdateProcessor(4)
+    update = Update(1, message=Message(1, datetime.now(timezone.utc), Chat(id=1, type="private")))
+    seen = []
+
+    async def handler():
+        await asyncio.sleep(0.01)
+        seen.append(run.updates)
+
+    asyncio.run(processor.process_update(update, handler()))
+
+    assert seen == [0]
+    assert run.updates == 1
+
+
+def test_without_a_profile_the_hook_does_nothing():
+    assert profiler._active is None
+    profiler.note_update()
+
+
+def test_profile_command_is_refused_while_admin_chat_is_unset(monkeypatch):
+    monkeypatch.setattr(bot, "ADMIN_CHAT_ID", None)
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=42), message=SimpleNamespace(reply_text=reply_text))
+    asyncio.run(bot.profile_cmd(update, SimpleNamespace(args=["5"])))
+
+    assert replies == ["Профилирование доступно только админу (нужен ADMIN_CHAT_ID)."]
+    assert profiler._active is None
+    # Commands without fail_closed stay open until an admin chat is configured
+    assert bot._is_admin(update)
+    monkeypatch.setattr(bot, "ADMIN_CHAT_ID", "42")
+    assert bot._is_admin(update, fail_closed=True)
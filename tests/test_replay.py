@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from app.tools import replay
+from app.tools.fakes import FakeSheetsServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_clone_sequences_gives_each_copy_its_own_chat_and_files():
+    clones = replay.clone_sequences([replay.synthetic_sequence(1)], 3)
+    chats = [seq[0]["message"]["chat"]["id"] for seq in clones]
+    assert len(set(chats)) == 3
+    update_ids = [u["update_id"] for seq in clones for u in seq]
+    assert update_ids == sorted(set(update_ids))
+    files = {seq[0]["message"]["voice"]["file_id"] for seq in clones}
+    assert len(files) == 3
+    # The template is not modified
+    assert replay.synthetic_sequence(1)[0]["message"]["voice"]["file_id"] == "synthetic"
+
+
+def test_load_recording_groups_by_chat_in_order(tmp_path):
+    path = tmp_path / "rec.jsonl"
+    updates = [{"update_id": i, "message": {"chat": {"id": chat}, "text": str(i)}}
+               for i, chat in enumerate([5, 6, 5, 6, 5])]
+    path.write_text("\n".join(json.dumps(u) for u in updates) + "\n\n")
+    chats = replay.load_recording(str(path))
+    assert [[u["update_id"] for u in seq] for seq in chats] == [[0, 2, 4], [1, 3]]
+
+
+def test_fake_sheets_append_and_partial_row_update():
+    gspread = pytest.importorskip("gspread")
+    from app.services.sheets import _redirecting_session
+
+    fake = FakeSheetsServer("Book", {"Sheet": ["Date", "Client_ID"]}).start()
+    try:
+        ws = gspread.Client(None, session=_redirecting_session(fake.url)).open("Book").worksheet("Sheet")
+        resp = ws.append_rows([["2026-03-01", "c1"], ["2026-03-02", "c2"]])
+        assert resp["updates"]["updatedRange"].startswith("'Sheet'!A2")
+        ws.batch_update([{"range": "C1", "values": [["Visit_key"]]}])
+        assert fake.sheets["Sheet"][0] == ["Date", "Client_ID", "Visit_key"]
+        assert ws.col_values(2) == ["Client_ID", "c1", "c2"]
+    finally:
+        fake.stop()
+
+
+def test_replay_smoke(tmp_path):
+    proc = subprocess.run(
+        [sys.executable, "-m", "app.tools.replay", "--fake-stt", "--copies", "2",
+         "--stt-latency", "0.01", "0.02", "--workdir", str(tmp_path / "work")],
+        cwd=ROOT, capture_output=True, text=True, timeout=300,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert "4 updates (0 failed)" in proc.stdout
+    assert "2 rows written" in proc.stdout
@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+
+from app.services import visit_store as store
+from app.services.reports import parse_period, build_report, format_report
+
+TODAY = date(2026, 3, 14)  # a Saturday
+
+
+@pytest.mark.parametrize("arg, expected", [
+    (None, (TODAY, TODAY, "day")),
+    ("сегодня", (TODAY, TODAY, "day")),
+    ("Вчера", (date(2026, 3, 13), date(2026, 3, 13), "day")),
+    ("week", (date(2026, 3, 8), TODAY, "day")),
+    ("месяц", (date(2026, 2, 13), TODAY, "week")),
+    ("2026-03-01", (date(2026, 3, 1), date(2026, 3, 1), "day")),
+    ("2026-03-01..2026-03-10", (date(2026, 3, 1), date(2026, 3, 10), "day")),
+    ("2026-03-10..2026-03-01", (date(2026, 3, 1), date(2026, 3, 10), "day")),
+    ("2026-02-01..2026-03-01", (date(2026, 2, 1), date(2026, 3, 1), "week")),
+])
+def test_parse_period(arg, expected):
+    assert parse_period(arg, TODAY) == expected
+
+
+@pytest.mark.parametrize("arg", ["fortnight", "2026-13-01", "2026-03-01..", "14.03.2026"])
+def test_parse_period_rejects_garbage(arg):
+    with pytest.raises(ValueError):
+        parse_period(arg, TODAY)
+
+
+def _visit(day, status, ticket=None, cost=None, source="инстаграм", reason=""):
+    return {"Date": day, "Purchase_status": status, "Ticket_amount": ticket, "Cost_Price": cost,
+            "Source": source, "Reason_not_buying": reason}
+
+
+def test_build_report_from_rollups(visits_db):
+    store.record_visit(_visit("2026-03-09", "купили", 10000, 6000), "center")   # Monday
+    store.record_visit(_visit("2026-03-10", "купили", 5000, source="вывеска"), "center")
+    store.record_visit(_visit("2026-03-10", "не купили", reason="дорого"), "center")
+    store.record_visit(_visit("2026-03-16", "не купили", reason="дорого"), "center")  # next Monday
+    store.record_visit(_visit("2026-03-10", "купили", 99999), "mega")
+
+    report = build_report("center", date(2026, 3, 9), date(2026, 3, 10))
+    total = report["total"]
+    assert (total["visits"], total["purchases"], total["revenue"], total["margin"], total["margin_known"]) == \
+        (3, 2, 15000.0, 4000.0, 1)
+    assert total["avg_ticket"] == 7500.0
+    assert [b["bucket"] for b in report["buckets"]] == ["2026-03-09", "2026-03-10"]
+    assert report["top_reasons"] == [("дорого", 1)]
+    assert report["top_sources"][0]["source"] == "инстаграм"
+
+    weekly = build_report("center", date(2026, 3, 1), date(2026, 3, 31), "week")
+    assert [(b["bucket"], b["visits"]) for b in weekly["buckets"]] == [("2026-03-09", 3), ("2026-03-16", 1)]
+
+    text = format_report(report)
+    assert "Визиты: 3 | Покупки: 2 | Конверсия: 67%" in text
+    assert "Выручка: 15 000 ₸" in text
+
+
+def test_empty_period(visits_db):
+    text = format_report(build_report("center", TODAY, TODAY))
+    assert text.endswith("Визитов за период нет.")
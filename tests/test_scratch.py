@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from app.services import scratch
+
+
+@pytest.fixture
+def scratch_root(tmp_path, monkeypatch):
+    root = tmp_path / "scratch"
+    monkeypatch.setattr(scratch, "SCRATCH_DIR", str(root))
+    return root
+
+
+def test_scratch_dir_is_removed_even_on_error(scratch_root):
+    with pytest.raises(RuntimeError):
+        with scratch.scratch_dir() as path:
+            with open(os.path.join(path, "note.ogg"), "wb") as f:
+                f.write(b"x" * 100)
+            raise RuntimeError("stt failed")
+    assert not os.path.exists(path)
+    assert os.listdir(scratch_root) == []
+
+
+def test_quota_sweeps_stale_leftovers_before_rejecting(scratch_root, monkeypatch):
+    monkeypatch.setattr(scratch, "SCRATCH_QUOTA_MB", 1 / 1024)  # 1 KB
+    stale = scratch_root / "note-dead"
+    stale.mkdir(parents=True)
+    (stale / "a.ogg").write_bytes(b"x" * 2048)
+    old = time.time() - scratch.SCRATCH_MAX_AGE - 10
+    os.utime(stale, (old, old))
+
+    with scratch.scratch_dir() as path:
+        assert os.path.isdir(path)
+    assert not stale.exists()
+
+    fresh = scratch_root / "note-busy"
+    fresh.mkdir()
+    (fresh / "a.ogg").write_bytes(b"x" * 2048)
+    with pytest.raises(scratch.ScratchQuotaExceeded):
+        with scratch.scratch_dir():
+            pass
+    assert fresh.exists()
+
+
+def test_cleanup_stale_keeps_recent_entries(scratch_root):
+    scratch_root.mkdir()
+    (scratch_root / "note-live").mkdir()
+    (scratch_root / "orphan.ogg").write_bytes(b"")
+    old = time.time() - 100
+    os.utime(scratch_root / "orphan.ogg", (old, old))
+    assert scratch.cleanup_stale(max_age=50) == 1
+    assert os.listdir(scratch_root) == ["note-live"]
+
+
+class _File:
+    async def download_to_memory(self, out):
+        out.write(b"OggS")
+
+    async def download_to_drive(self, path):
+        with open(path, "wb") as f:
+            f.write(b"OggS")
+
+
+class _Bot:
+    async def get_file(self, file_id):
+        return _File()
+
+
+class _Context:
+    bot = _Bot()
+
+
+class _Voice:
+    def __init__(self, size):
+        self.file_id = self.file_unique_id = "note1"
+        self.file_size = size
+        self.duration = 5
+
+
+@pytest.mark.parametrize("size, in_memory", [(1000, True), (0, False), (10 * 1024 * 1024, False)])
+def test_short_notes_skip_the_disk(scratch_root, monkeypatch, size, in_memory):
+    from app import bot
+
+    seen = {}
+
+    def transcribe(source):
+        seen["source"] = source
+        seen["on_disk"] = isinstance(source, str) and os.path.exists(source)
+        return "текст"
+
+    monkeypatch.setattr(bot, "transcribe", transcribe)
+    assert asyncio.run(bot.download_and_transcribe(_Context(), _Voice(size))) == "текст"
+    if in_memory:
+        assert seen["source"].read() == b"OggS" and seen["source"].name == "note1.ogg"
+    else:
+        assert seen["on_disk"] and not os.path.exists(seen["source"])
+    assert not scratch_root.exists() or os.listdir(scratch_root) == []
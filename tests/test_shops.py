@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from app.services import shops, sheets
+
+
+@pytest.fixture
+def two_shops(shops_config):
+    shops_config({
+        "center": {"spreadsheet": "Center 2026", "chats": [-100], "users": [1]},
+        "mega": {"spreadsheet": "Mega 2026", "worksheet": "Mega", "chats": [-200], "users": [2, "3"]},
+    }, default="center")
+
+
+def test_config_defaults_are_filled(two_shops):
+    listed = shops.list_shops()
+    assert listed["center"]["worksheet"] == "Offline Traffic"
+    assert listed["mega"]["users"] == [2, 3]
+
+
+def test_resolve_shop_precedence(two_shops):
+    # config lists: user, then chat, then the default
+    assert shops.resolve_shop(-200, 1) == "center"
+    assert shops.resolve_shop(-200, 99) == "mega"
+    assert shops.resolve_shop(None, None) == "center"
+    # a runtime assignment wins over the config
+    shops.assign_shop(2, "mega")
+    shops.assign_shop(1, "center")
+    assert shops.resolve_shop(-100, 2) == "mega"
+
+
+def test_assign_shop_needs_allow_list_or_admin(two_shops):
+    with pytest.raises(PermissionError):
+        shops.assign_shop(1, "mega")
+    with pytest.raises(KeyError):
+        shops.assign_shop(1, "nowhere", by_admin=True)
+    shops.assign_shop(1, "mega", by_admin=True)
+    assert shops.resolve_shop(None, 1) == "mega"
+    with open(shops.SHOP_ASSIGNMENTS_FILE, encoding="utf-8") as f:
+        assert json.load(f) == {"user:1": "mega"}
+
+
+def test_missing_config_is_a_single_default_shop(shops_config):
+    assert list(shops.list_shops()) == [shops.DEFAULT_SHOP]
+    assert shops.resolve_shop(5, 5) == shops.DEFAULT_SHOP
+
+
+def test_bad_default_is_rejected(shops_config):
+    shops_config({"a": {}}, default="b")
+    with pytest.raises(RuntimeError):
+        shops.list_shops()
+
+
+def test_each_shop_gets_its_own_shard(two_shops):
+    center, mega = sheets.get_shard("center"), sheets.get_shard("mega")
+    assert sheets.get_shard("center") is center
+    assert sheets.get_shard(None) is center
+    assert (mega.spreadsheet, mega.worksheet) == ("Mega 2026", "Mega")
+    assert center.write_lock is not mega.write_lock
+
+
+def test_rows_go_to_their_shops_worksheet(fake_sheets):
+    fake = fake_sheets({"A": ["Date", "Client_ID", "Visit_key"], "B": ["Date", "Client_ID", "Visit_key"]})
+    assert sheets.get_shard("A").append_rows([{"Date": "2026-03-01", "Client_ID": "a1"}]) == 2
+    sheets.get_shard("B").append_rows([{"Date": "2026-03-02", "client_id": "b1"}])
+    assert fake.sheets["A"][1:] == [["2026-03-01", "a1", ""]]
+    assert fake.sheets["B"][1:] == [["2026-03-02", "b1", ""]]
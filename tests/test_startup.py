@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import subprocess
+
+from app import bot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["vosk", "pydub", "gspread", "google.genai", "google.oauth2", "faster_whisper", "requests"]
+
+
+def test_importing_the_bot_defers_heavy_dependencies():
+    code = ("import sys, app.bot; "
+            f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                          env={**os.environ, "PYTHONPATH": ROOT, "TELEGRAM_TOKEN": "123456:TEST"}, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == ""
+
+
+def test_warm_up_runs_services_concurrently_and_only_logs_failures(monkeypatch, caplog):
+    def slow():
+        time.sleep(0.2)
+
+    def broken():
+        raise RuntimeError("no credentials")
+
+    for name in ("warm_up_stt", "warm_up_gemini", "warm_up_classifier", "reload_enums", "cleanup_stale"):
+        monkeypatch.setattr(bot, name, slow)
+    monkeypatch.setattr(bot, "warm_up_sheets", broken)
+    monkeypatch.setattr(bot.client_index, "warm_up", slow)
+
+    started = time.perf_counter()
+    with caplog.at_level(logging.INFO):
+        asyncio.run(bot.warm_up_services())
+    assert time.perf_counter() - started < 1.0
+    assert "sheets=" in caplog.text and "failed: no credentials" in caplog.text
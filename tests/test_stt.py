@@ -0,0 +1,123 @@
+import pytest
+
+from app.services import stt
+from app.tools.stt_bench import word_errors, summarize
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(stt, "_backends", dict(stt._backends))
+    return stt._backends
+
+
+def test_builtin_backends_are_registered():
+    assert {"vosk", "whisper"} <= set(stt.available_backends())
+
+
+def test_incomplete_backend_fails_at_registration(registry):
+    with pytest.raises(TypeError):
+        @stt.register_backend
+        class Half(stt.SttBackend):
+            name = "half"
+
+    with pytest.raises(TypeError):
+        @stt.register_backend
+        class Nameless(stt.SttBackend):
+            def transcribe_detailed(self, source, debug_copy=False):
+                return {}
+
+    assert "half" not in registry
+
+
+def test_transcribe_uses_the_configured_backend(registry, monkeypatch):
+    @stt.register_backend
+    class Echo(stt.SttBackend):
+        name = "echo"
+
+        def transcribe_detailed(self, source, debug_copy=False):
+            return {"text": f"heard {source}", "words": [], "duration": 1.0}
+
+    monkeypatch.setattr(stt, "STT_BACKEND", "echo")
+    assert stt.transcribe("note.ogg") == "heard note.ogg"
+    monkeypatch.setattr(stt, "STT_BACKEND", "nope")
+    with pytest.raises(RuntimeError, match="available: .*echo"):
+        stt.transcribe("note.ogg")
+
+
+def test_word_errors_ignore_case_punctuation_and_yo():
+    assert word_errors("Клиент зашёл, купил обои.", "клиент зашел купил обои") == (0, 4)
+    assert word_errors("купил два рулона", "купил рулона обоев") == (2, 3)
+    assert word_errors("", "шум") == (1, 0)
+
+
+def test_summarize_reports_rtf_and_corpus_wer():
+    run = {"backend": "x", "load_s": 1.234, "rss_base_mb": 100, "rss_loaded_mb": 150, "rss_peak_mb": 160,
+           "notes": [{"path": "a", "text": "купил обои", "duration": 10.0, "elapsed": 2.0},
+                     {"path": "b", "text": "ушла", "duration": 10.0, "elapsed": 4.0},
+                     {"path": "c", "error": "decode failed"}]}
+    s = summarize(run, {"a": "купил обои", "b": "ушла домой"})
+    assert (s["notes"], s["failed"], s["rtf"], s["rtf_p95"], s["wer"], s["rss_model_mb"]) == \
+        (2, 1, 0.3, 0.4, 0.25, 50)
+
+
+def _pcm(pattern):
+    """16 kHz 16-bit PCM from [(seconds, loud?)]: loud parts are a square wave, pauses are silence."""
+    from array import array
+
+    samples = array("h")
+    for seconds, loud in pattern:
+        n = int(seconds * stt.SAMPLE_RATE)
+        samples.extend((8000 if (i // 20) % 2 else -8000) if loud else 0 for i in range(n))
+    return samples.tobytes()
+
+
+def _seconds(byte_offset):
+    return byte_offset / (stt.SAMPLE_RATE * 2)
+
+
+def test_split_at_silences_cuts_inside_the_pauses(monkeypatch):
+    monkeypatch.setattr(stt, "STT_SEGMENT_S", 20)
+    monkeypatch.setattr(stt, "STT_CUT_WINDOW_S", 5)
+    # Pauses at 18-19 s and 41-42.5 s; the next target boundaries are 20 s and ~38.5 s
+    pcm = _pcm([(18, True), (1, False), (22, True), (1.5, False), (17.5, True)])
+    ranges = stt.split_at_silences(pcm)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(pcm)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    cuts = [_seconds(start) for start, _ in ranges[1:]]
+    assert len(cuts) == 2
+    assert 18 <= cuts[0] <= 19 and 41 <= cuts[1] <= 42.5
+
+
+def test_short_audio_is_one_segment():
+    pcm = _pcm([(3, True)])
+    assert stt.split_at_silences(pcm) == [(0, len(pcm))]
+
+
+def test_parallel_pieces_are_stitched_in_order_with_shifted_timings(monkeypatch):
+    monkeypatch.setattr(stt, "STT_SEGMENT_S", 10)
+    monkeypatch.setattr(stt, "STT_CUT_WINDOW_S", 2)
+    pcm = _pcm([(9.5, True), (1, False), (9.5, True), (1, False), (9, True)])
+
+    def fake_recognize(piece, model, deadline=None):
+        n = len(piece)
+        return [f"piece{n}"], [{"word": f"w{n}", "start": 0.5, "end": 1.0}], 1
+
+    monkeypatch.setattr(stt, "_recognize", fake_recognize)
+    ranges = stt.split_at_silences(pcm)
+    texts, words, chunks = stt._recognize_parallel(pcm, model=None)
+    assert texts == [f"piece{end - start}" for start, end in ranges]
+    assert chunks == len(ranges) == 3
+    assert [w["start"] for w in words] == [round(_seconds(start) + 0.5, 3) for start, _ in ranges]
+
+
+def test_a_failed_piece_fails_the_note(monkeypatch):
+    monkeypatch.setattr(stt, "STT_SEGMENT_S", 10)
+    monkeypatch.setattr(stt, "STT_CUT_WINDOW_S", 2)
+    pcm = _pcm([(9.5, True), (1, False), (9.5, True), (1, False), (9, True)])
+
+    def fake_recognize(piece, model, deadline=None):
+        raise stt.DeadlineExceeded("stt")
+
+    monkeypatch.setattr(stt, "_recognize", fake_recognize)
+    with pytest.raises(stt.DeadlineExceeded):
+        stt._recognize_parallel(pcm, model=None)
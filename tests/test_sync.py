@@ -0,0 +1,180 @@
+from datetime import datetime
+
+import pytest
+
+from app.services import visit_store as store, sync
+from app.services.breaker import CircuitOpenError
+from app.services.sheets import get_shard
+
+HEADER = ["Date", "Client_ID", "Ticket_amount", "Visit_key"]
+
+
+def _row(client, ticket=1000, key=None):
+    return {"Date": "2026-03-14", "Client_ID": client, "Ticket_amount": ticket, "Visit_key": key or f"k-{client}"}
+
+
+def test_sync_appends_new_rows_then_updates_changed_ones_in_place(visits_db, fake_sheets):
+    fake = fake_sheets({"center": HEADER})
+    a = store.record_visit(_row("a"), "center")
+    store.record_visit(_row("b"), "center")
+
+    assert sync.sync_shop("center") == 2
+    assert [r[1] for r in fake.sheets["center"][1:]] == ["a", "b"]
+    assert store.pending_counts() == {}
+    assert sync.sync_shop("center") == 0
+
+    store.update_visit(a, _row("a", ticket=2500))
+    store.record_visit(_row("c"), "center")
+    assert sync.sync_shop("center") == 2
+    assert fake.sheets["center"][1:] == [
+        ["2026-03-14", "a", 2500, "k-a"], ["2026-03-14", "b", 1000, "k-b"], ["2026-03-14", "c", 1000, "k-c"],
+    ]
+
+
+def test_sync_all_reports_per_shop_errors(visits_db, fake_sheets):
+    fake_sheets({"center": HEADER}, error_rate=1.0)
+    store.record_visit(_row("a"), "center")
+    results = sync.sync_all()
+    assert results["center"]
+    assert store.pending_counts() == {"center": 1}
+
+
+def _land_then_fail(shard, monkeypatch):
+    """The next append reaches the sheet but the call errors out (e.g. a read timeout)."""
+    original = shard.append_rows
+
+    def append_rows(rows, before_send=None):
+        original(rows, before_send)
+        monkeypatch.setattr(shard, "append_rows", original)
+        raise TimeoutError("read timed out")
+
+    monkeypatch.setattr(shard, "append_rows", append_rows)
+
+
+def test_retry_after_a_landed_append_does_not_duplicate(visits_db, fake_sheets, monkeypatch):
+    fake = fake_sheets({"center": HEADER})
+    vid = store.record_visit(_row("a"), "center")
+    _land_then_fail(get_shard("center"), monkeypatch)
+    with pytest.raises(TimeoutError):
+        sync.sync_shop("center")
+    assert store.pending_counts() == {"center": 1}
+
+    assert sync.sync_shop("center") == 1
+    assert [r[1] for r in fake.sheets["center"][1:]] == ["a"]
+    assert store.get_visit(vid)["sheet_row"] == 2
+    assert store.pending_counts() == {}
+
+
+def test_missing_key_column_is_added_on_first_use(visits_db, fake_sheets, monkeypatch):
+    fake = fake_sheets({"center": ["Date", "Client_ID", "Ticket_amount"]})
+    store.record_visit(_row("a"), "center")
+    _land_then_fail(get_shard("center"), monkeypatch)
+    try:
+        sync.sync_shop("center")
+    except TimeoutError:
+        pass
+    assert fake.sheets["center"][0] == HEADER
+    assert sync.sync_shop("center") == 1
+    assert fake.sheets["center"][1:] == [["2026-03-14", "a", 1000, "k-a"]]
+
+
+def _no_header_writes(fake, monkeypatch):
+    """The sheet refuses the Visit_key header cell (e.g. a protected range)."""
+    handle = fake.handle
+
+    def refuse(method, path, query, body, content_type):
+        if path.endswith("/values:batchUpdate"):
+            return 403, {"error": {"code": 403, "message": "protected range"}}
+        return handle(method, path, query, body, content_type)
+
+    monkeypatch.setattr(fake, "handle", refuse)
+
+
+def test_without_a_key_column_only_the_ambiguous_rows_are_held_back(visits_db, fake_sheets, monkeypatch):
+    fake = fake_sheets({"center": ["Date", "Client_ID", "Ticket_amount"]})
+    _no_header_writes(fake, monkeypatch)
+    a = store.record_visit(_row("a"), "center")
+    _land_then_fail(get_shard("center"), monkeypatch)
+    with pytest.raises(TimeoutError):
+        sync.sync_shop("center")
+    assert not get_shard("center").has_key_column()
+
+    b = store.record_visit(_row("b"), "center")
+    for _ in range(3):
+        assert sync.sync_shop("center") in (0, 1)
+    # "a" may be in the sheet already: not appended again, still pending; "b" went out once
+    assert [r[1] for r in fake.sheets["center"][1:]] == ["a", "b"]
+    assert store.pending_counts() == {"center": 1}
+    assert not store.is_synced(a) and store.is_synced(b)
+
+
+def test_an_append_that_never_went_out_is_not_counted_as_an_attempt(visits_db, fake_sheets):
+    fake_sheets({"center": HEADER})
+    vid = store.record_visit(_row("a"), "center")
+    shard_breaker = get_shard("center").breaker
+    for _ in range(shard_breaker.failure_threshold):
+        shard_breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        sync.sync_shop("center")
+    assert store.get_visit(vid)["append_attempts"] == 0
+
+
+def test_a_failure_opening_the_sheet_is_not_counted_as_an_attempt(visits_db, fake_sheets, monkeypatch):
+    fake_sheets({"center": HEADER})
+    vid = store.record_visit(_row("a"), "center")
+    shard = get_shard("center")
+
+    def unreachable():
+        raise ConnectionError("sheet not reachable")
+
+    monkeypatch.setattr(shard, "get_worksheet", unreachable)
+    with pytest.raises(ConnectionError):
+        sync.sync_shop("center")
+    assert store.get_visit(vid)["append_attempts"] == 0
+
+
+def test_committing_the_same_visit_twice_keeps_one_row(visits_db):
+    key = store.make_visit_key(-100, 7, datetime(2026, 3, 14, 12, 0))
+    first = store.record_visit(_row("a", key=key), "center")
+    assert store.record_visit(_row("a", ticket=5, key=key), "center") == first
+    assert store.pending_counts() == {"center": 1}
+
+
+def test_a_save_replies_after_the_local_commit_and_syncs_in_the_background(visits_db, monkeypatch):
+    import asyncio
+    import threading
+    from types import SimpleNamespace
+
+    from app import bot
+
+    sheets_done = threading.Event()
+    synced = []
+
+    def slow_sync(shop):
+        sheets_done.wait(5)
+        synced.append(shop)
+        return 1
+
+    monkeypatch.setattr(bot, "sync_shop", slow_sync)
+    monkeypatch.setattr(bot, "resolve_shop", lambda chat_id, user_id: "center")
+    monkeypatch.setattr(bot, "get_shard", lambda shop: SimpleNamespace(breaker=SimpleNamespace(is_open=lambda: False)))
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    async def save():
+        update = SimpleNamespace(effective_chat=SimpleNamespace(id=1), effective_user=SimpleNamespace(id=2),
+                                 message=SimpleNamespace(reply_text=reply_text))
+        context = SimpleNamespace(application=SimpleNamespace(create_task=lambda coro, name=None: asyncio.create_task(coro)),
+                                  user_data={"conv_state": object()})
+        result = await asyncio.wait_for(bot.save_rows(update, context, [_row("a")]), 2)
+        assert result == bot.ConversationHandler.END and context.user_data == {}
+        assert store.pending_counts() == {"center": 1} and synced == []
+        sheets_done.set()
+        await bot.wait_for_syncs()
+
+    asyncio.run(save())
+    assert replies == ["✅ Забубенил. Хорош братишка!"]
+    assert synced == ["center"]
@@ -0,0 +1,73 @@
+import json
+import asyncio
+
+import pytest
+
+from app.services import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(path))
+    monkeypatch.setattr(tracing, "TRACE_OTLP_ENDPOINT", None)
+    monkeypatch.setattr(tracing, "TRACE_HEAD_RATE", 1.0)
+    monkeypatch.setattr(tracing, "TRACE_TAIL_RATE", 0.0)
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 60_000)
+
+    def spans():
+        tracing.flush()
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+    return spans
+
+
+def test_tracing_is_a_noop_when_not_configured(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_FILE", None)
+    monkeypatch.setattr(tracing, "TRACE_OTLP_ENDPOINT", None)
+    with tracing.start_trace("update") as root, tracing.span("stt") as child:
+        tracing.set_attribute("x", 1)
+    assert root is tracing.NOOP_SPAN and child is tracing.NOOP_SPAN
+
+
+def test_fast_successful_traces_are_tail_sampled_out(trace_file):
+    with tracing.start_trace("update"):
+        with tracing.span("stt"):
+            pass
+    assert trace_file() == []
+
+
+def test_failed_trace_is_exported_with_worker_thread_children(trace_file):
+    async def update():
+        with tracing.start_trace("update", chat_id=1):
+            await asyncio.to_thread(_stt)
+            with tracing.span("save"):
+                raise RuntimeError("sheets down")
+
+    def _stt():
+        with tracing.span("stt") as sp:
+            sp.set_attribute("transcript_len", 42)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(update())
+
+    spans = {s["name"]: s for s in trace_file()}
+    assert set(spans) == {"update", "stt", "save"}
+    root = spans["update"]
+    assert {s["trace_id"] for s in spans.values()} == {root["trace_id"]}
+    assert spans["stt"]["parent_id"] == spans["save"]["parent_id"] == root["span_id"]
+    assert spans["stt"]["attributes"] == {"transcript_len": 42}
+    assert spans["save"]["error"] == "RuntimeError: sheets down"
+    assert root["attributes"] == {"chat_id": 1}
+
+
+def test_otlp_payload_shape():
+    payload = tracing._to_otlp([[{
+        "trace_id": "t", "span_id": "s", "parent_id": None, "name": "update", "start_ns": 1_000,
+        "duration_ms": 2.0, "attributes": {"ok": True, "n": 3, "ms": 1.5, "who": "x"}, "error": None,
+    }]])
+    (span,) = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert span["endTimeUnixNano"] == str(1_000 + 2_000_000)
+    assert [a["value"] for a in span["attributes"]] == [
+        {"boolValue": True}, {"intValue": "3"}, {"doubleValue": 1.5}, {"stringValue": "x"}]
+    assert span["status"] == {"code": 1}
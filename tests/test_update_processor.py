@@ -0,0 +1,80 @@
+import time
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update
+
+from app.update_processor import PerChatUpdateProcessor
+
+
+def _update(update_id: int, chat_id: int) -> Update:
+    chat = Chat(id=chat_id, type="private")
+    return Update(update_id, message=Message(update_id, datetime.now(timezone.utc), chat))
+
+
+async def _run(processor, updates, delays):
+    log = []
+
+    async def handler(update, delay):
+        log.append(("start", update.update_id))
+        await asyncio.sleep(delay)
+        log.append(("end", update.update_id))
+
+    await asyncio.gather(*(processor.process_update(u, handler(u, d)) for u, d in zip(updates, delays)))
+    return log
+
+
+def test_updates_of_one_chat_run_in_order_one_at_a_time():
+    processor = PerChatUpdateProcessor(8)
+    updates = [_update(i, chat_id=1) for i in range(1, 5)]
+    # The first update is the slowest: a racing second one would start before it ends
+    log = asyncio.run(_run(processor, updates, [0.05, 0.01, 0.01, 0.0]))
+    assert log == [(kind, i) for i in range(1, 5) for kind in ("start", "end")]
+    assert processor._chat_locks == {}
+
+
+def test_updates_of_different_chats_overlap():
+    processor = PerChatUpdateProcessor(8)
+    updates = [_update(i, chat_id=i) for i in range(1, 5)]
+    log = asyncio.run(_run(processor, updates, [0.05] * 4))
+    assert [kind for kind, _ in log[:4]] == ["start"] * 4
+
+
+def test_global_limit_still_applies():
+    processor = PerChatUpdateProcessor(2)
+    running = peak = 0
+
+    async def handler():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    async def main():
+        await asyncio.gather(*(processor.process_update(_update(i, chat_id=i), handler()) for i in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+
+
+def test_a_busy_chat_does_not_take_the_other_chats_slots():
+    processor = PerChatUpdateProcessor(2)
+    started = {}
+
+    async def handler(update_id, delay):
+        started[update_id] = time.monotonic()
+        await asyncio.sleep(delay)
+
+    async def main():
+        t0 = time.monotonic()
+        # Chat 1: a slow update with three more queued behind it; then one update of chat 2
+        busy = [processor.process_update(_update(i, chat_id=1), handler(i, 0.3 if i == 1 else 0.01))
+                for i in range(1, 5)]
+        await asyncio.gather(*busy, processor.process_update(_update(5, chat_id=2), handler(5, 0)))
+        return t0
+
+    t0 = asyncio.run(main())
+    assert started[5] - t0 < 0.1
+    assert sorted(started, key=started.get) == [1, 5, 2, 3, 4]
+    assert processor.current_concurrent_updates == 0
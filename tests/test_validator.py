@@ -0,0 +1,36 @@
+import pytest
+
+from app.services.validator import parse_number, norm_text, match_enum
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("15000", 15000.0),
+    ("15 000", 15000.0),
+    ("1 000 000", 1000000.0),
+    ("15000.50", 15000.5),
+    ("15,5", 15.5),
+    ("15000 тг", 15000.0),
+    ("15 000.50", 15000.5),
+    ("-100", -100.0),
+    ("1+5", None),
+    ("abc123", None),
+    ("15 и 20", None),
+    ("1.2.3", None),
+    ("15 20", None),
+    ("1 2 3 4 5", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == expected
+
+
+def test_norm_text_collapses_whitespace_and_drops_control_chars():
+    assert norm_text("  Клиент\n\r зашёл\t\x00 ") == "Клиент зашёл"
+
+
+def test_match_enum_exact_substring_and_fuzzy():
+    assert match_enum("КУПИЛИ", "Purchase_status") == "купили"
+    assert match_enum("оптовик", "Type_of_client") == "оптовик"
+    assert match_enum("оптавик", "Type_of_client") == "оптовик"
+    assert match_enum("", "Type_of_client") == ""
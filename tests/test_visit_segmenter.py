@@ -0,0 +1,55 @@
+import pytest
+
+from app.services.visit_segmenter import split_visits
+
+
+def test_ordinal_markers_split_visits_in_order():
+    text = ("За час было три клиента. Первый оптовик купил на пятьдесят тысяч, "
+            "вторая просто посмотрела каталог и ушла, третий спросил цену и сказал дорого")
+    assert split_visits(text) == [
+        "За час было три клиента. Первый оптовик купил на пятьдесят тысяч",
+        "вторая просто посмотрела каталог и ушла",
+        "третий спросил цену и сказал дорого",
+    ]
+
+
+def test_typed_list_and_next_marker():
+    assert split_visits("1) купила два рулона обоев 2) посмотрел и ушел домой, следующая спросила про клей") == [
+        "1) купила два рулона обоев",
+        "2) посмотрел и ушел домой",
+        "следующая спросила про клей",
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    "клиентка пришла второй раз, купила обои на второй этаж",
+    "первый раз зашел, посмотрел и ушел",
+    "вторая покупательница купила, а первая нет",  # markers out of order
+    "второй оптовик купил на сто тысяч",
+    "клей отнесли на первый этаж и на второй этаж, клиент купил три рулона",
+    "спрашивал про первый вариант и второй вариант, выбрал первый",
+    "первая жена выбирала, второй муж платил, купили обои на шесть тысяч",
+    "первый рулон взяли, второй рулон вернули",
+])
+def test_single_visits_stay_whole(text):
+    assert split_visits(text) == [text]
+
+
+def test_stray_short_part_is_merged_into_the_previous_visit():
+    assert split_visits("первый купил обои на зал и клей, второй. третья ушла, сказала что дорого") == [
+        "первый купил обои на зал и клей второй",
+        "третья ушла, сказала что дорого",
+    ]
+
+
+def test_empty_note():
+    assert split_visits("   ") == []
+
+
+def test_clause_start_markers_with_a_client_word_verb_or_dash_split():
+    assert split_visits("Первый — оптовик, купил на пятьдесят тысяч. А второй покупатель только смотрел. "
+                        "Третья ушла, сказала что дорого") == [
+        "Первый — оптовик, купил на пятьдесят тысяч",
+        "А второй покупатель только смотрел",
+        "Третья ушла, сказала что дорого",
+    ]
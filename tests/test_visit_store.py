@@ -0,0 +1,61 @@
+from app.services import visit_store as store
+
+
+def _row(client="c1", status="купили", ticket=1000, cost=600, date="2026-03-14", **extra):
+    return {"Date": date, "Time": "12:00", "Client_ID": client, "Purchase_status": status,
+            "Ticket_amount": ticket, "Cost_Price": cost, "Source": "инстаграм",
+            "Reason_not_buying": "" if status == "купили" else "дорого", **extra}
+
+
+def test_pending_changes_follow_the_high_water_mark(visits_db):
+    a = store.record_visit(_row("a"), "center")
+    b = store.record_visit(_row("b"), "center")
+    store.record_visit(_row("m"), "mega")
+    assert store.pending_counts() == {"center": 2, "mega": 1}
+
+    changes = store.pending_changes("center", 10)
+    assert [c["id"] for c in changes] == [a, b]
+    assert changes[0]["row"]["Client_ID"] == "a" and changes[0]["sheet_row"] is None
+
+    store.mark_synced("center", changes[-1]["rev"], {a: 2, b: 3})
+    assert store.pending_changes("center", 10) == []
+    assert store.is_synced(a) and store.get_visit(a)["sheet_row"] == 2
+
+    # An edit after sync is pending again, with its sheet row known
+    store.update_visit(a, _row("a", ticket=2000))
+    (change,) = store.pending_changes("center", 10)
+    assert (change["id"], change["sheet_row"]) == (a, 2)
+    assert not store.is_synced(a)
+
+
+def test_high_water_mark_never_moves_back(visits_db):
+    store.record_visit(_row(), "center")
+    store.mark_synced("center", 5, {})
+    store.mark_synced("center", 3, {})
+    assert store.get_high_water("center") == 5
+
+
+def test_rollups_track_inserts_and_updates(visits_db):
+    a = store.record_visit(_row("a", ticket=1000, cost=600), "center")
+    store.record_visit(_row("b", status="не купили", ticket=None, cost=None), "center")
+
+    def rollup():
+        r = store.query("SELECT visits, purchases, revenue, margin, margin_n FROM daily_rollup "
+                        "WHERE shop = 'center' AND date = '2026-03-14'")[0]
+        return tuple(r)
+
+    assert rollup() == (2, 1, 1000.0, 400.0, 1)
+    store.update_visit(a, _row("a", ticket=1500, cost=600))
+    assert rollup() == (2, 1, 1500.0, 900.0, 1)
+    reasons = store.query("SELECT value, visits FROM daily_dim WHERE dim = 'reason'")
+    assert [tuple(r) for r in reasons] == [("дорого", 1)]
+
+    store.rebuild_rollups()
+    assert rollup() == (2, 1, 1500.0, 900.0, 1)
+
+
+def test_record_visits_reports_which_rows_were_inserted(visits_db):
+    first = store.record_visits([_row("a", Visit_key="k-a")], "center")
+    again = store.record_visits([_row("a", Visit_key="k-a"), _row("b", Visit_key="k-b")], "center")
+    assert first == [(first[0][0], True)]
+    assert again == [(first[0][0], False), (again[1][0], True)]